@@ -0,0 +1,35 @@
+import asyncio
+import logging
+
+from dtb.settings import ARCHIVE_INTERVAL, LLM_LEDGER_FLUSH_INTERVAL, RETENTION_INTERVAL
+from stories.archival import run_archival
+from stories.ledger import run_llm_call_ledger
+from stories.retention import run_retention
+
+logger = logging.getLogger(__name__)
+
+# The jobs running on the event loop of the bot
+background_tasks: list[asyncio.Task] = []
+
+
+def start_background_jobs() -> None:
+    """
+    Starts the periodic jobs of the bot on the running event loop: transcript archival,
+    retention of abandoned story completions and the writer of the LLM call ledger.
+    Called by every entry point, see dtb/main.py and run_polling.py.
+    """
+    if ARCHIVE_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(run_archival(ARCHIVE_INTERVAL)))
+    if RETENTION_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(run_retention(RETENTION_INTERVAL)))
+    if LLM_LEDGER_FLUSH_INTERVAL > 0:
+        background_tasks.append(asyncio.create_task(run_llm_call_ledger(LLM_LEDGER_FLUSH_INTERVAL)))
+    logger.info(f"Started {len(background_tasks)} background jobs")
+
+
+async def stop_background_jobs() -> None:
+    """Cancels the periodic jobs and lets them finish their cleanup, e.g. the last LLM call rows are written."""
+    for task in background_tasks:
+        task.cancel()
+    await asyncio.gather(*background_tasks, return_exceptions=True)
+    background_tasks.clear()
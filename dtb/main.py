@@ -5,6 +5,7 @@ import os
 from django.core.asgi import get_asgi_application
 
 from dtb.app_holder import AppHolder
+from dtb.settings import PERSISTENCE_NAMESPACE
 from tgbot.system_commands import set_up_commands
 from tgbot.user_update_processor import UserUpdateProcessor
 
@@ -19,8 +20,9 @@ import uvicorn
 from telegram.ext import Application
 
 from django_persistence.persistence import DjangoPersistence
+from dtb.background_jobs import start_background_jobs, stop_background_jobs
 from tgbot.dispatcher import setup_event_handlers
-from tgbot.main import bot
+from tgbot.main import bot, streaming_bot
 
 # Enable logging
 logging.basicConfig(
@@ -29,7 +31,7 @@ logging.basicConfig(
 # set higher logging level for httpx to avoid all GET and POST requests being logged
 logging.getLogger("httpx").setLevel(logging.WARNING)
 
-persistence = DjangoPersistence()
+persistence = DjangoPersistence(namespace=PERSISTENCE_NAMESPACE)
 ptb_application = (
     Application.builder()
     .bot(bot)
@@ -59,9 +61,12 @@ async def main() -> None:
     await set_up_commands(ptb_application)
 
     # Run application and webserver together
-    async with ptb_application:
+    async with ptb_application, streaming_bot:
         await ptb_application.start()
+        # Run background jobs until the webserver stops
+        start_background_jobs()
         await webserver.serve()
+        await stop_background_jobs()
         await ptb_application.stop()
 
 
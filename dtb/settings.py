@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 import sys
@@ -138,6 +139,16 @@ if TELEGRAM_TOKEN is None:
     sys.exit(1)
 
 TELEGRAM_LOGS_CHAT_ID = os.getenv("TELEGRAM_LOGS_CHAT_ID", default=None)
+# Bot API connection pools: one for replies and sends, one for the edits of streamed answers.
+#  HTTP/2 requires httpx[http2]
+TELEGRAM_POOL_SIZE = int(os.getenv("TELEGRAM_POOL_SIZE", default=16))
+TELEGRAM_STREAMING_POOL_SIZE = int(os.getenv("TELEGRAM_STREAMING_POOL_SIZE", default=8))
+TELEGRAM_POOL_TIMEOUT = float(os.getenv("TELEGRAM_POOL_TIMEOUT", default=5.0))
+TELEGRAM_HTTP_VERSION = os.getenv("TELEGRAM_HTTP_VERSION", default="1.1")
+# Namespace of the bot's conversations and user/chat data in the django_persistence tables
+PERSISTENCE_NAMESPACE = os.getenv("PERSISTENCE_NAMESPACE", default="")
+# Seconds an idle connection is kept alive
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("HTTP_KEEPALIVE_EXPIRY", default=30))
 
 # -----> SENTRY
 # import sentry_sdk
@@ -160,3 +171,104 @@ TELEGRAM_LOGS_CHAT_ID = os.getenv("TELEGRAM_LOGS_CHAT_ID", default=None)
 # )
 
 OPENAI_TOKEN = os.getenv("OPENAI_TOKEN", default=None)
+# Connection pool shared by the OpenAI clients, HTTP/2 requires httpx[http2]
+OPENAI_MAX_CONNECTIONS = int(os.getenv("OPENAI_MAX_CONNECTIONS", default=100))
+OPENAI_MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("OPENAI_MAX_KEEPALIVE_CONNECTIONS", default=20))
+OPENAI_HTTP2 = os.getenv("OPENAI_HTTP2", default=False) in ["True", "true", "1", True]
+
+# -----> LLM
+# "openai", or "fake" for load tests: a local provider answering after LLM_FAKE_TIME_TO_FIRST_TOKEN seconds
+#  at LLM_FAKE_TOKENS_PER_SECOND (0 for no delay), failing LLM_FAKE_ERROR_RATE of the requests. LLM_FAKE_ANSWERS_PATH is an optional
+#  JSON file with "chat", "verdict" and/or "transcription" lists of answers
+LLM_BACKEND = os.getenv("LLM_BACKEND", default="openai")
+LLM_FAKE_TIME_TO_FIRST_TOKEN = float(os.getenv("LLM_FAKE_TIME_TO_FIRST_TOKEN", default=0.5))
+LLM_FAKE_TOKENS_PER_SECOND = float(os.getenv("LLM_FAKE_TOKENS_PER_SECOND", default=50))
+LLM_FAKE_ERROR_RATE = float(os.getenv("LLM_FAKE_ERROR_RATE", default=0))
+LLM_FAKE_ANSWERS_PATH = os.getenv("LLM_FAKE_ANSWERS_PATH", default=None)
+# Every LLM call is recorded in the LLMCall ledger, rows are written every LLM_LEDGER_FLUSH_INTERVAL seconds
+#  (0 disables the ledger) or once LLM_LEDGER_BATCH_SIZE rows (at least 1) are pending. At most LLM_LEDGER_MAX_PENDING
+#  rows are kept while the database is unavailable
+LLM_LEDGER_FLUSH_INTERVAL = float(os.getenv("LLM_LEDGER_FLUSH_INTERVAL", default=5))
+LLM_LEDGER_BATCH_SIZE = int(os.getenv("LLM_LEDGER_BATCH_SIZE", default=100))
+LLM_LEDGER_MAX_PENDING = int(os.getenv("LLM_LEDGER_MAX_PENDING", default=10000))
+# Model of the LLM calls matched by no route of LLM_ROUTES, LLM_FALLBACK_MODEL answers when it times out
+LLM_DEFAULT_MODEL = os.getenv("LLM_DEFAULT_MODEL", default="gpt-4-1106-preview")
+LLM_FALLBACK_MODEL = os.getenv("LLM_FALLBACK_MODEL", default="gpt-3.5-turbo-1106")
+# Routing policy: the first route matching the task ("question" or "verdict"), the agent type and the prompt size
+#  picks the model of a call, see llm_helper.router
+LLM_ROUTES = json.loads(os.getenv("LLM_ROUTES", default="""[
+    {"name": "environment", "task": "question", "agent_type": "ENVIRONMENT", "max_prompt_tokens": 8000,
+     "model": "gpt-3.5-turbo-1106", "fallback_model": "gpt-4-1106-preview", "timeout": 10},
+    {"name": "verdict", "task": "verdict",
+     "model": "gpt-4-1106-preview", "fallback_model": "gpt-3.5-turbo-1106", "timeout": 30}
+]"""))
+# Prices of the models in USD per 1K prompt and completion tokens, for the cost of the routes
+LLM_MODEL_PRICES = json.loads(os.getenv("LLM_MODEL_PRICES", default="""{
+    "gpt-4-1106-preview": [0.01, 0.03],
+    "gpt-3.5-turbo-1106": [0.001, 0.002]
+}"""))
+# Maximum number of prompt tokens sent to a model, the oldest turns are dropped first.
+#  Can be overridden per model with a JSON object, e.g. {"gpt-4-1106-preview": 16000}
+LLM_PROMPT_TOKEN_BUDGET = int(os.getenv("LLM_PROMPT_TOKEN_BUDGET", default=16000))
+LLM_PROMPT_TOKEN_BUDGETS = json.loads(os.getenv("LLM_PROMPT_TOKEN_BUDGETS", default="{}"))
+# Tokens are counted with tiktoken, which downloads its encodings on first use into TIKTOKEN_CACHE_DIR
+#  (read by tiktoken itself); without them, e.g. on offline hosts, token counts are approximated
+# The partial answer is passed on while streaming at most every LLM_STREAM_CALLBACK_INTERVAL seconds,
+#  or earlier once LLM_STREAM_CALLBACK_CHARS new characters were received
+LLM_STREAM_CALLBACK_INTERVAL = float(os.getenv("LLM_STREAM_CALLBACK_INTERVAL", default=1.0))
+LLM_STREAM_CALLBACK_CHARS = int(os.getenv("LLM_STREAM_CALLBACK_CHARS", default=500))
+# Failed LLM calls (rate limits, server and connection errors) are attempted up to LLM_RETRY_ATTEMPTS times,
+#  waiting a jittered exponential backoff between LLM_RETRY_BASE_DELAY and LLM_RETRY_MAX_DELAY seconds
+LLM_RETRY_ATTEMPTS = int(os.getenv("LLM_RETRY_ATTEMPTS", default=3))
+LLM_RETRY_BASE_DELAY = float(os.getenv("LLM_RETRY_BASE_DELAY", default=0.5))
+LLM_RETRY_MAX_DELAY = float(os.getenv("LLM_RETRY_MAX_DELAY", default=8))
+# A second streaming request is sent if the first one did not stream anything after
+#  LLM_HEDGE_AFTER seconds, the first to stream is used (0 disables hedging)
+LLM_HEDGE_AFTER = float(os.getenv("LLM_HEDGE_AFTER", default=0))
+# A streamed answer fails without a first chunk after LLM_FIRST_TOKEN_TIMEOUT seconds, stops when no chunk
+#  arrived for LLM_STALL_TIMEOUT seconds and is cut after LLM_ANSWER_TIMEOUT seconds. The text received is kept
+LLM_FIRST_TOKEN_TIMEOUT = float(os.getenv("LLM_FIRST_TOKEN_TIMEOUT", default=20))
+LLM_STALL_TIMEOUT = float(os.getenv("LLM_STALL_TIMEOUT", default=10))
+LLM_ANSWER_TIMEOUT = float(os.getenv("LLM_ANSWER_TIMEOUT", default=90))
+# Requests and tokens per minute allowed by the provider, requests are queued when the quota is used up
+#  (0 disables the limit). A request is charged its prompt and LLM_EXPECTED_ANSWER_TOKENS (at most its max_tokens)
+LLM_REQUESTS_PER_MINUTE = int(os.getenv("LLM_REQUESTS_PER_MINUTE", default=500))
+LLM_TOKENS_PER_MINUTE = int(os.getenv("LLM_TOKENS_PER_MINUTE", default=150000))
+LLM_EXPECTED_ANSWER_TOKENS = int(os.getenv("LLM_EXPECTED_ANSWER_TOKENS", default=300))
+# At most LLM_MAX_IN_FLIGHT LLM calls run at once, waiting users are served in turns. Admins get LLM_ADMIN_WEIGHT
+#  calls per turn, which only matters when calls of a user run concurrently: the bot handles a user's updates one at a time
+LLM_MAX_IN_FLIGHT = int(os.getenv("LLM_MAX_IN_FLIGHT", default=32))
+LLM_ADMIN_WEIGHT = float(os.getenv("LLM_ADMIN_WEIGHT", default=2))
+# The LLM circuit breaker opens when, over the last LLM_BREAKER_WINDOW seconds (and at least LLM_BREAKER_MIN_CALLS calls),
+#  LLM_BREAKER_FAILURE_RATE of the calls failed or LLM_BREAKER_SLOW_RATE took more than LLM_BREAKER_SLOW_CALL seconds.
+#  Calls fail fast for LLM_BREAKER_OPEN_FOR seconds, then LLM_BREAKER_PROBES successful probes close it again
+LLM_BREAKER_WINDOW = float(os.getenv("LLM_BREAKER_WINDOW", default=60))
+LLM_BREAKER_MIN_CALLS = int(os.getenv("LLM_BREAKER_MIN_CALLS", default=10))
+LLM_BREAKER_FAILURE_RATE = float(os.getenv("LLM_BREAKER_FAILURE_RATE", default=0.5))
+LLM_BREAKER_SLOW_RATE = float(os.getenv("LLM_BREAKER_SLOW_RATE", default=0.5))
+LLM_BREAKER_SLOW_CALL = float(os.getenv("LLM_BREAKER_SLOW_CALL", default=10))
+LLM_BREAKER_OPEN_FOR = float(os.getenv("LLM_BREAKER_OPEN_FOR", default=30))
+LLM_BREAKER_PROBES = int(os.getenv("LLM_BREAKER_PROBES", default=3))
+
+# -----> STORIES
+# Create agent interactions on the first question to the agent instead of at the story start
+LAZY_AGENT_INTERACTIONS = os.getenv("LAZY_AGENT_INTERACTIONS", default=False) in ["True", "true", "1", True]
+# Number of agent conversations kept in memory and seconds after which an unused one is evicted
+TRANSCRIPT_CACHE_SIZE = int(os.getenv("TRANSCRIPT_CACHE_SIZE", default=1024))
+TRANSCRIPT_CACHE_MAX_IDLE = float(os.getenv("TRANSCRIPT_CACHE_MAX_IDLE", default=1800))
+# Seconds after which the story catalog cache is reloaded even if no change was signalled
+STORY_CATALOG_MAX_AGE = float(os.getenv("STORY_CATALOG_MAX_AGE", default=300))
+# Finished story completions are packed into compressed archives after ARCHIVE_AFTER_DAYS days,
+#  checked every ARCHIVE_INTERVAL seconds (0 disables the background job)
+ARCHIVE_AFTER_DAYS = float(os.getenv("ARCHIVE_AFTER_DAYS", default=7))
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", default=3600))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", default=500))
+# Message bodies of at least this many bytes are stored compressed (0 disables compression),
+#  with "zlib" or "zstd" (requires the zstandard package)
+TRANSCRIPT_COMPRESSION_THRESHOLD = int(os.getenv("TRANSCRIPT_COMPRESSION_THRESHOLD", default=1024))
+TRANSCRIPT_COMPRESSION_CODEC = os.getenv("TRANSCRIPT_COMPRESSION_CODEC", default="zlib")
+# Unfinished story completions without activity for RETENTION_IDLE_DAYS days are deleted,
+#  RETENTION_BATCH_SIZE at a time, every RETENTION_INTERVAL seconds (0 disables the background job)
+RETENTION_IDLE_DAYS = float(os.getenv("RETENTION_IDLE_DAYS", default=30))
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", default=3600))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", default=100))
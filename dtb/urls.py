@@ -26,6 +26,7 @@ urlpatterns = [
     path('tgadmin/', admin.site.urls),
     path('__debug__/', include(debug_toolbar.urls)),
     path('', views.index, name="index"),
+    path('metrics/', views.metrics_view, name="metrics"),
     path(f'webhook/{TELEGRAM_TOKEN}/', csrf_exempt(views.TelegramBotWebhookView.as_view())),
     path(
         "favicon.ico",
@@ -1,5 +1,6 @@
 import json
 import logging
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views import View
 from django.http import JsonResponse
 
@@ -7,6 +8,7 @@ from telegram import Update
 
 from dtb.app_holder import AppHolder
 from tgbot.main import bot
+from utils import metrics
 
 logger = logging.getLogger(__name__)
 
@@ -15,6 +17,12 @@ def index(request):
     return JsonResponse({"error": "sup hacker"})
 
 
+@staff_member_required
+def metrics_view(request):
+    """In-process metrics of the bot, e.g. the connection pool waits"""
+    return JsonResponse(metrics.snapshot(), json_dumps_params={"ensure_ascii": False})
+
+
 class TelegramBotWebhookView(View):
     # WARNING: if fail - Telegram webhook will be delivered again.
     async def post(self, request, *args, **kwargs):
@@ -0,0 +1,201 @@
+import asyncio
+import json
+import logging
+import random
+import re
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import AsyncIterator, Dict, List, Optional, Union
+
+import httpx
+import openai
+from dtb.settings import (
+    OPENAI_TOKEN,
+    OPENAI_MAX_CONNECTIONS,
+    OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+    OPENAI_HTTP2,
+    HTTP_KEEPALIVE_EXPIRY,
+    LLM_BACKEND,
+    LLM_FAKE_TIME_TO_FIRST_TOKEN,
+    LLM_FAKE_TOKENS_PER_SECOND,
+    LLM_FAKE_ERROR_RATE,
+    LLM_FAKE_ANSWERS_PATH,
+)
+from utils.http import pool_wait_hooks
+from utils.metrics import LLM_DURATION_BUCKETS
+
+logger = logging.getLogger(__name__)
+
+TRANSCRIPTION_MODEL = "whisper-1"
+
+# Connection pool shared by all the LLM helpers of the process
+http_client = httpx.AsyncClient(
+    limits=httpx.Limits(
+        max_connections=OPENAI_MAX_CONNECTIONS,
+        max_keepalive_connections=OPENAI_MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+    ),
+    timeout=openai.DEFAULT_TIMEOUT,
+    http2=OPENAI_HTTP2,
+    # connections are held for the whole streamed answer
+    event_hooks=pool_wait_hooks("openai", LLM_DURATION_BUCKETS),
+)
+
+
+class LLMBackend(ABC):
+    """
+    The provider behind LLMHelper.
+
+    Backends only send requests: retries, rate limiting, deadlines and the circuit breaker
+    are handled by the helper. Transient failures should raise the openai exceptions
+    (e.g. openai.APIConnectionError, openai.RateLimitError), so that they are retried.
+    """
+
+    @abstractmethod
+    async def stream_chat(self, **kwargs) -> AsyncIterator[str]:
+        """
+        Sends a streaming chat completion request (`messages`, `model`, `max_tokens`)
+        and returns an async generator of the text deltas of the answer.
+        Closing the generator releases the connection.
+        """
+
+    @abstractmethod
+    async def complete_chat(self, **kwargs) -> str:
+        """Sends a chat completion request (`messages`, `model`) and returns the answer."""
+
+    @abstractmethod
+    async def transcribe(self, path: Union[Path, str]) -> str:
+        """Returns the text of the audio file."""
+
+
+class OpenAIBackend(LLMBackend):
+    def __init__(self):
+        # failures are retried by the retry policy of the helper, not by the client
+        self.client = openai.AsyncOpenAI(
+            api_key=OPENAI_TOKEN, http_client=http_client, max_retries=0
+        )
+
+    async def stream_chat(self, **kwargs) -> AsyncIterator[str]:
+        stream = await self.client.chat.completions.create(stream=True, **kwargs)
+        return self._deltas(stream)
+
+    @staticmethod
+    async def _deltas(stream) -> AsyncIterator[str]:
+        try:
+            async for chunk in stream:
+                logger.debug(chunk)
+                delta = chunk.choices[0].delta.content
+                # if delta is None, this is the last message
+                if delta is None:
+                    return
+                yield delta
+        finally:
+            await stream.response.aclose()
+
+    async def complete_chat(self, **kwargs) -> str:
+        chat_completion = await self.client.chat.completions.create(**kwargs)
+        return chat_completion.choices[0].message.content
+
+    async def transcribe(self, path: Union[Path, str]) -> str:
+        with open(path, "rb") as f:
+            return await self.client.audio.transcriptions.create(
+                model=TRANSCRIPTION_MODEL, file=f, response_format="text"
+            )
+
+
+class FakeBackend(LLMBackend):
+    """
+    A local provider for load tests, nothing is sent over the network.
+
+    Answers are picked from canned ones, or from the `chat`, `verdict` and `transcription` lists
+    of the JSON file at `answers_path` (e.g. recorded answers). They arrive after `time_to_first_token`
+    seconds and are streamed at `tokens_per_second` (0 for no delay), a word being counted as a token.
+    A share `error_rate` of the requests fails with a rate limit, server or connection error.
+    """
+
+    ANSWERS = {
+        "chat": [
+            "Answer from the witness:\n\nI was in the library all evening, reading by the fire. "
+            "I heard nothing unusual until the butler started shouting.",
+            "Answer from the witness:\n\nI would rather not talk about that. "
+            "Ask the gardener, he knows more than he admits.",
+        ],
+        "verdict": [
+            "Person(s): 1\nMotive: 1\nWay: 1\nYou identified the guilty person, the motive and the way correctly.",
+            "Person(s): 1\nMotive: 0\nWay: 0\nLook again at what the victim was about to change.",
+        ],
+        "transcription": [
+            "Where were you on the night of the murder?",
+        ],
+    }
+
+    def __init__(
+        self,
+        time_to_first_token: float = LLM_FAKE_TIME_TO_FIRST_TOKEN,
+        tokens_per_second: float = LLM_FAKE_TOKENS_PER_SECOND,
+        error_rate: float = LLM_FAKE_ERROR_RATE,
+        answers_path: Optional[str] = LLM_FAKE_ANSWERS_PATH,
+    ):
+        if tokens_per_second < 0:
+            raise ValueError("tokens_per_second must not be negative")
+        self.time_to_first_token = time_to_first_token
+        # seconds per token
+        self.token_delay = 1 / tokens_per_second if tokens_per_second else 0
+        self.error_rate = error_rate
+        self.answers: Dict[str, List[str]] = dict(self.ANSWERS)
+        if answers_path:
+            with open(answers_path) as f:
+                self.answers.update(json.load(f))
+
+    def _maybe_fail(self) -> None:
+        if random.random() >= self.error_rate:
+            return
+        request = httpx.Request("POST", "http://fake-llm/v1")
+        error = random.choice(
+            [
+                openai.RateLimitError(
+                    "Injected rate limit", response=httpx.Response(429, request=request), body=None
+                ),
+                openai.InternalServerError(
+                    "Injected server error", response=httpx.Response(503, request=request), body=None
+                ),
+                openai.APIConnectionError(request=request),
+            ]
+        )
+        raise error
+
+    async def stream_chat(self, **kwargs) -> AsyncIterator[str]:
+        self._maybe_fail()
+        return self._deltas(random.choice(self.answers["chat"]), kwargs.get("max_tokens"))
+
+    async def _deltas(self, answer: str, max_tokens: Optional[int]) -> AsyncIterator[str]:
+        tokens = re.findall(r"\s*\S+", answer)[:max_tokens]
+        await asyncio.sleep(self.time_to_first_token)
+        for i, token in enumerate(tokens):
+            if i:
+                await asyncio.sleep(self.token_delay)
+            yield token
+
+    async def complete_chat(self, **kwargs) -> str:
+        self._maybe_fail()
+        answer = random.choice(self.answers["verdict"])
+        await asyncio.sleep(self.time_to_first_token + len(answer.split()) * self.token_delay)
+        return answer
+
+    async def transcribe(self, path: Union[Path, str]) -> str:
+        self._maybe_fail()
+        await asyncio.sleep(self.time_to_first_token)
+        return random.choice(self.answers["transcription"])
+
+
+BACKENDS = {
+    "openai": OpenAIBackend,
+    "fake": FakeBackend,
+}
+
+
+def get_backend(name: str = LLM_BACKEND) -> LLMBackend:
+    """Returns a new backend of the given name, see the LLM_BACKEND setting."""
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend {name!r}, expected one of {', '.join(BACKENDS)}")
+    return BACKENDS[name]()
@@ -1,10 +1,27 @@
+import asyncio
 import logging
 import os
+import time
+from contextlib import aclosing
 from pathlib import Path
-from typing import Any, List, Callable, Coroutine, Union
+from typing import Any, AsyncIterator, Dict, List, Callable, Coroutine, Union
 
-import openai
-from dtb.settings import OPENAI_TOKEN
+from dtb.settings import (
+    LLM_PROMPT_TOKEN_BUDGET,
+    LLM_PROMPT_TOKEN_BUDGETS,
+    LLM_HEDGE_AFTER,
+    LLM_FIRST_TOKEN_TIMEOUT,
+    LLM_STALL_TIMEOUT,
+    LLM_ANSWER_TIMEOUT,
+    LLM_EXPECTED_ANSWER_TOKENS,
+)
+from llm_helper.backends import LLMBackend, TRANSCRIPTION_MODEL, get_backend
+from llm_helper.circuit_breaker import llm_circuit_breaker
+from llm_helper.context_window import ContextWindow
+from llm_helper.rate_limit import rate_limiter
+from llm_helper.retry import RetryPolicy
+from llm_helper.stream import StreamAccumulator, StreamTimeout
+from llm_helper.usage import CallStats
 
 MAX_MESSAGE_LENGTH = 2048
 
@@ -12,47 +29,182 @@ MAX_MESSAGE_LENGTH = 2048
 class LLMHelper:
     logger = logging.getLogger(__name__)
 
-    def __init__(self, model="gpt-4-1106-preview"):
-        self.client = openai.AsyncOpenAI(api_key=OPENAI_TOKEN)
+    def __init__(
+        self,
+        model="gpt-4-1106-preview",
+        retry_policy=None,
+        hedge_after=LLM_HEDGE_AFTER,
+        backend: LLMBackend = None,
+    ):
+        # the provider, picked by the LLM_BACKEND setting by default
+        self.backend = backend if backend is not None else get_backend()
         self.model = model
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.hedge_after = hedge_after
+        self.first_token_timeout = LLM_FIRST_TOKEN_TIMEOUT
+        self.stall_timeout = LLM_STALL_TIMEOUT
+        self.answer_timeout = LLM_ANSWER_TIMEOUT
+        self.rate_limiter = rate_limiter
+        self.expected_answer_tokens = LLM_EXPECTED_ANSWER_TOKENS
+        self.circuit_breaker = llm_circuit_breaker
+        self.context_window = ContextWindow(
+            model,
+            prompt_budget=LLM_PROMPT_TOKEN_BUDGETS.get(model, LLM_PROMPT_TOKEN_BUDGET),
+            max_answer_tokens=MAX_MESSAGE_LENGTH,
+        )
 
     async def chat_complete(
         self,
         messages: List[Any],
         message_callback: Callable[[str], Coroutine[Any, Any, None]] = None,
+        stats: CallStats = None,
+        deadline: float = None,
+        quota_acquired: bool = False,
     ) -> str:
-        self.logger.info(f"Chat complete with messages: {messages}")
-        # Create a stream from OpenAI API
-        stream = await self.client.chat.completions.create(
-            messages=messages,
-            model=self.model,
-            stream=True,
-            max_tokens=MAX_MESSAGE_LENGTH,
-        )
-        # Iterate over the stream and append the deltas to the result
-        res = ""
-        start_deleted = False
-        async for item in stream:
-            self.logger.debug(item)
-            delta = item.choices[0].delta.content
+        """
+        Streams the answer to the messages, passing the partial answer to the callback.
+        The model, tokens, time to first token and retries of the call are set in `stats`.
+
+        Raises StreamTimeout if the first chunk does not arrive within `first_token_timeout` seconds,
+        if no chunk arrives for `stall_timeout` seconds or if the answer is not complete by the `deadline`
+        (a `time.monotonic()` value), `answer_timeout` seconds by default. The text received until then
+        is kept in the exception. The default timeouts start once the rate limiter admitted the request,
+        callers that waited for the rate limiter themselves (see `acquire_chat_quota`) set `quota_acquired`.
+        Raises CircuitOpenError while the provider is considered down, the circuit breaker
+        judges the provider by the wait for the first chunk of every request.
+        """
+        stats = stats if stats is not None else CallStats()
+        # Keep the prompt within the token budget, the answer gets the room that is left
+        messages, max_tokens = self.context_window.fit(messages)
+        stats.model = self.model
+        stats.prompt_tokens = self.context_window.counter.count_messages(messages)
+        self.logger.info(f"Chat complete with {len(messages)} messages ({stats.prompt_tokens} tokens)")
+        self.logger.debug(f"Chat complete with messages: {messages}")
+        if not quota_acquired:
+            await self.acquire_quota(stats.prompt_tokens, max_tokens)
+        if deadline is None:
+            deadline = time.monotonic() + self.answer_timeout
+        first_token_timeout = min(self.first_token_timeout, deadline - time.monotonic())
+        # Create a stream from the backend
+        try:
+            stream = await asyncio.wait_for(
+                self.open_stream(
+                    stats=stats,
+                    messages=messages,
+                    model=self.model,
+                    max_tokens=max_tokens,
+                ),
+                timeout=max(first_token_timeout, 0),
+            )
+        except asyncio.TimeoutError:
+            raise StreamTimeout(f"No answer after {max(first_token_timeout, 0):.1f}s") from None
+        stats.first_token()
+        # Iterate over the stream, the callback gets the partial answer on a time/size cadence
+        answer = StreamAccumulator(message_callback)
+        async with aclosing(stream):
+            while True:
+                timeout = min(self.stall_timeout, deadline - time.monotonic())
+                try:
+                    delta = await asyncio.wait_for(anext(stream), timeout=max(timeout, 0))
+                except StopAsyncIteration:
+                    break
+                except asyncio.TimeoutError:
+                    reason = (
+                        f"stalled for {self.stall_timeout}s"
+                        if timeout == self.stall_timeout
+                        else "was not complete by its deadline"
+                    )
+                    partial_answer = answer.text()
+                    stats.completion_tokens = self.context_window.counter.count(partial_answer)
+                    raise StreamTimeout(f"The answer {reason}", partial_answer) from None
+                await answer.feed(delta)
 
-            # if delta is None, this is the last message
-            if delta is None:
-                break
+        res = answer.text()
+        stats.completion_tokens = self.context_window.counter.count(res)
+        self.logger.debug(f"Chat complete response: {res}")
+        return res
 
-            res += delta
+    async def open_stream(self, stats: CallStats = None, **kwargs) -> AsyncIterator:
+        """
+        Sends a streaming chat completion request and waits for its first chunk.
 
-            if "\n" in res and not start_deleted:
-                res = res[res.find("\n") + 1 :]
-                start_deleted = True
+        Failures before the first chunk are retried (and counted in `stats`). If hedging is enabled
+        and no chunk arrived after `hedge_after` seconds, a second request is sent and the first one
+        to stream is used.
+        """
+        if self.hedge_after > 0:
+            stream, first_item = await self._hedged_first_chunk(kwargs, stats)
+        else:
+            stream, first_item = await self.retry_policy.run(lambda: self._first_chunk(kwargs), stats)
+        return self._continue_stream(stream, first_item)
 
-            # update the message callback
-            if message_callback is not None:
-                if start_deleted:
-                    await message_callback(res.strip())
+    async def acquire_quota(self, prompt_tokens: int, max_tokens: int = None) -> None:
+        """
+        Waits until the rate limiter admits a request, charged its prompt and the expected size
+        of its answer. Retries and hedged requests of the call are not charged again.
+        """
+        answer_tokens = min(self.expected_answer_tokens, max_tokens or self.expected_answer_tokens)
+        await self.rate_limiter.acquire(prompt_tokens + answer_tokens)
 
-        self.logger.debug(f"Chat complete response: {res}")
-        return res.strip()
+    async def acquire_chat_quota(self, messages: List[Any]) -> None:
+        """Waits for the quota of a `chat_complete` call with the messages, see `acquire_quota`."""
+        messages, max_tokens = self.context_window.fit(messages)
+        await self.acquire_quota(self.context_window.counter.count_messages(messages), max_tokens)
+
+    async def create_chat_completion(self, stream: bool = False, **kwargs):
+        """
+        Sends a chat completion request to the backend, the quota is acquired by the caller.
+        Returns the answer, or an async generator of its deltas if `stream` is set.
+        """
+        if stream:
+            return await self.backend.stream_chat(**kwargs)
+        return await self.backend.complete_chat(**kwargs)
+
+    async def _first_chunk(self, kwargs):
+        async with self.circuit_breaker.guard():
+            stream = await self.create_chat_completion(stream=True, **kwargs)
+            try:
+                return stream, await stream.__anext__()
+            except StopAsyncIteration:
+                return stream, None
+            except BaseException:
+                await stream.aclose()
+                raise
+
+    async def _hedged_first_chunk(self, kwargs, stats):
+        def send():
+            return asyncio.create_task(self.retry_policy.run(lambda: self._first_chunk(kwargs), stats))
+
+        pending = {send()}
+        try:
+            done, _ = await asyncio.wait(pending, timeout=self.hedge_after)
+            if not done:
+                self.logger.info(f"No first chunk after {self.hedge_after}s, sending a hedged request")
+                pending.add(send())
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                streamed = [task for task in done if task.exception() is None]
+                if streamed:
+                    for task in streamed[1:]:
+                        await task.result()[0].aclose()
+                    return streamed[0].result()
+                if not pending:
+                    raise done.pop().exception()
+        finally:
+            # the slower request is cancelled, its connection is released
+            for task in pending:
+                task.cancel()
+
+    @staticmethod
+    async def _continue_stream(stream, first_item):
+        try:
+            if first_item is None:
+                return
+            yield first_item
+            async for item in stream:
+                yield item
+        finally:
+            await stream.aclose()
 
     comparison_system_prompt = (
 """
@@ -148,7 +300,9 @@ Also, do not reveal the ground truth to the player, but give some hints - in wha
 """
     ).strip()
 
-    async def is_solved(self, player_answer: str, ground_truth: str, prelude: str) -> tuple[bool, bool, bool, str]:
+    def get_verdict_messages(
+        self, player_answer: str, ground_truth: str, prelude: str
+    ) -> List[Dict[str, str]]:
         text = f"""
 **What was the truth - solution of the story given by the auther, player needs to reveal it**:
 {ground_truth}
@@ -158,17 +312,41 @@ Also, do not reveal the ground truth to the player, but give some hints - in wha
 ==============================================================
 **What player discovered during the game (you need to estimate only this part)**:
 {player_answer}"""
-        chat_completion = await self.client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": self.comparison_system_prompt},
-                {"role": "user", "content": text},
-            ],
-            model=self.model,
-        )
+        return [
+            {"role": "system", "content": self.comparison_system_prompt},
+            {"role": "user", "content": text},
+        ]
+
+    async def is_solved(
+        self,
+        player_answer: str,
+        ground_truth: str,
+        prelude: str,
+        stats: CallStats = None,
+        quota_acquired: bool = False,
+    ) -> tuple[bool, bool, bool, str]:
+        """
+        Assesses the player's answer, see `comparison_system_prompt`. Callers that waited
+        for the rate limiter themselves set `quota_acquired`.
+        """
+        messages = self.get_verdict_messages(player_answer, ground_truth, prelude)
+        text = messages[-1]["content"]
+        stats = stats if stats is not None else CallStats()
+        stats.model = self.model
+        stats.prompt_tokens = self.context_window.counter.count_messages(messages)
+        if not quota_acquired:
+            await self.acquire_quota(stats.prompt_tokens)
+
+        async def complete():
+            async with self.circuit_breaker.guard():
+                return await self.create_chat_completion(messages=messages, model=self.model)
+
+        res = await self.retry_policy.run(complete, stats)
+        stats.completion_tokens = self.context_window.counter.count(res)
         print(self.comparison_system_prompt)
         print('====================')
         print(text)
-        res = chat_completion.choices[0].message.content.strip()
+        res = res.strip()
         print('====================')
         print(res)
 
@@ -181,11 +359,16 @@ Also, do not reveal the ground truth to the player, but give some hints - in wha
         score_way = score_way.split(":")[1].strip() == "1"
         return score_person, score_motive, score_way, hint
 
-    async def transcribe_audio_file(self, path: Union[Path, str]) -> str:
-        """Transcribe an audio file using OpenAI API and return the text"""
-        with open(path, "rb") as f:
-            transcript = await self.client.audio.transcriptions.create(
-                model="whisper-1", file=f, response_format="text"
-            )
+    async def transcribe_audio_file(self, path: Union[Path, str], stats: CallStats = None) -> str:
+        """Transcribe an audio file using the backend and return the text"""
+        stats = stats if stats is not None else CallStats()
+        stats.model = TRANSCRIPTION_MODEL
+
+        async def transcribe():
+            async with self.circuit_breaker.guard():
+                return await self.backend.transcribe(path)
+
+        transcript = await self.retry_policy.run(transcribe, stats)
+        stats.completion_tokens = self.context_window.counter.count(transcript)
         self.logger.debug(f"Transcription from {path}: {transcript}")
         return transcript.strip()
@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Deque, Tuple
+
+from dtb.settings import (
+    LLM_BREAKER_WINDOW,
+    LLM_BREAKER_MIN_CALLS,
+    LLM_BREAKER_FAILURE_RATE,
+    LLM_BREAKER_SLOW_RATE,
+    LLM_BREAKER_SLOW_CALL,
+    LLM_BREAKER_OPEN_FOR,
+    LLM_BREAKER_PROBES,
+)
+from llm_helper.retry import RetryPolicy
+from utils.metrics import register_collector
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half-open"
+
+
+class CircuitOpenError(Exception):
+    """The LLM provider is considered down, the call was not sent."""
+
+
+class CircuitBreaker:
+    """
+    Fails LLM calls fast while the provider is down, instead of letting every call time out.
+
+    The circuit opens when, over the last `window` seconds and at least `min_calls` calls, the share
+    of failed calls (connection errors, timeouts, rate limits and server errors) reaches `failure_rate`
+    or the share of calls slower than `slow_call` seconds reaches `slow_rate`.
+    Calls then raise CircuitOpenError for `open_for` seconds. After that up to `probes` calls
+    are let through (half-open): a failed or slow probe opens the circuit again,
+    `probes` successful ones close it.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+        self,
+        name: str = "openai",
+        window: float = LLM_BREAKER_WINDOW,
+        min_calls: int = LLM_BREAKER_MIN_CALLS,
+        failure_rate: float = LLM_BREAKER_FAILURE_RATE,
+        slow_rate: float = LLM_BREAKER_SLOW_RATE,
+        slow_call: float = LLM_BREAKER_SLOW_CALL,
+        open_for: float = LLM_BREAKER_OPEN_FOR,
+        probes: int = LLM_BREAKER_PROBES,
+    ):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.failure_rate = failure_rate
+        self.slow_rate = slow_rate
+        self.slow_call = slow_call
+        self.open_for = open_for
+        self.probes = probes
+
+        self.state = CLOSED
+        self.opened_at = 0.0
+        # (finished at, failed, slow) of the calls in the window, while closed
+        self.calls: Deque[Tuple[float, bool, bool]] = deque()
+        self.failed_calls = 0
+        self.slow_calls = 0
+        self.probes_in_flight = 0
+        self.successful_probes = 0
+        self.times_opened = 0
+        self.rejected_calls = 0
+        register_collector(f"{name}.circuit_breaker", self.snapshot)
+
+    @property
+    def rejects_calls(self) -> bool:
+        """Whether a call would fail fast right now."""
+        if self.state == OPEN:
+            return time.monotonic() - self.opened_at < self.open_for
+        if self.state == HALF_OPEN:
+            return self.probes_in_flight >= self.probes
+        return False
+
+    @staticmethod
+    def is_failure(error: Exception) -> bool:
+        # errors caused by the request itself (e.g. a bad request) say nothing about the provider
+        return isinstance(error, TimeoutError) or RetryPolicy.is_retryable(error)
+
+    @asynccontextmanager
+    async def guard(self):
+        """
+        Runs the block as a request to the provider, or raises CircuitOpenError while the circuit is open.
+        The block should only wait for the provider: not for a rate limit, a retry backoff or another request.
+        """
+        is_probe = self._start_call()
+        started_at = time.monotonic()
+        failed = cancelled = False
+        try:
+            yield
+        except asyncio.CancelledError:
+            cancelled = True
+            raise
+        except Exception as e:
+            failed = self.is_failure(e)
+            raise
+        finally:
+            duration = time.monotonic() - started_at
+            if cancelled and duration < self.slow_call:
+                # a cancelled request says nothing about the provider, unless it was already slow
+                self._cancel_call(is_probe)
+            else:
+                self._finish_call(is_probe, failed, duration)
+
+    def _start_call(self) -> bool:
+        """Admits a call, returns whether it is a probe."""
+        if self.state == OPEN and time.monotonic() - self.opened_at >= self.open_for:
+            self.state = HALF_OPEN
+            self.successful_probes = 0
+            self.logger.info(f"The {self.name} circuit is half-open, probing")
+        if self.rejects_calls:
+            self.rejected_calls += 1
+            raise CircuitOpenError(f"The {self.name} circuit is open, calls are paused")
+        if self.state == HALF_OPEN:
+            self.probes_in_flight += 1
+            return True
+        return False
+
+    def _cancel_call(self, is_probe: bool) -> None:
+        if is_probe:
+            # the probe is neither a success nor a failure, another call may probe instead
+            self.probes_in_flight -= 1
+
+    def _finish_call(self, is_probe: bool, failed: bool, duration: float) -> None:
+        slow = duration >= self.slow_call
+        if is_probe:
+            self.probes_in_flight -= 1
+            if self.state != HALF_OPEN:
+                return
+            if failed or slow:
+                self._open("a probe failed" if failed else f"a probe took {duration:.1f}s")
+            else:
+                self.successful_probes += 1
+                if self.successful_probes >= self.probes:
+                    self._close()
+            return
+        if self.state != CLOSED:
+            # the call was sent before the circuit opened
+            return
+
+        now = time.monotonic()
+        self.calls.append((now, failed, slow))
+        self.failed_calls += failed
+        self.slow_calls += slow
+        while self.calls[0][0] < now - self.window:
+            _, old_failed, old_slow = self.calls.popleft()
+            self.failed_calls -= old_failed
+            self.slow_calls -= old_slow
+
+        if len(self.calls) < self.min_calls:
+            return
+        if self.failed_calls >= self.failure_rate * len(self.calls):
+            self._open(f"{self.failed_calls} of the last {len(self.calls)} calls failed")
+        elif self.slow_calls >= self.slow_rate * len(self.calls):
+            self._open(f"{self.slow_calls} of the last {len(self.calls)} calls took more than {self.slow_call}s")
+
+    def _open(self, reason: str) -> None:
+        self.logger.warning(f"The {self.name} circuit opens for {self.open_for}s: {reason}")
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        self.times_opened += 1
+        self._reset_window()
+
+    def _close(self) -> None:
+        self.logger.info(f"The {self.name} circuit is closed again")
+        self.state = CLOSED
+        self._reset_window()
+
+    def _reset_window(self) -> None:
+        self.calls.clear()
+        self.failed_calls = 0
+        self.slow_calls = 0
+
+    def snapshot(self) -> dict:
+        return dict(
+            state=self.state,
+            calls=len(self.calls),
+            failed_calls=self.failed_calls,
+            slow_calls=self.slow_calls,
+            times_opened=self.times_opened,
+            rejected_calls=self.rejected_calls,
+        )
+
+
+# Shared by all the LLM helpers of the process, like the rate limiter
+llm_circuit_breaker = CircuitBreaker()
@@ -0,0 +1,150 @@
+import logging
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import tiktoken
+except ImportError:  # tiktoken is optional, token counts are approximated without it
+    tiktoken = None
+
+logger = logging.getLogger(__name__)
+
+# Context window sizes (prompt + answer tokens) of the supported models
+MODEL_CONTEXT_WINDOWS = {
+    "gpt-4-1106-preview": 128000,
+    "gpt-4": 8192,
+    "gpt-4-32k": 32768,
+    "gpt-3.5-turbo": 4096,
+    "gpt-3.5-turbo-1106": 16385,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+# Tokens added by the chat format for every message and to prime the answer
+TOKENS_PER_MESSAGE = 3
+TOKENS_PER_ANSWER = 3
+
+# Used to approximate token counts when the tokenizer is not available
+CHARS_PER_TOKEN = 4
+
+
+# Set once downloading an encoding failed, so that other models do not wait for the network again
+_encodings_unavailable = False
+
+
+@lru_cache(maxsize=None)
+def get_encoding(model: str):
+    """
+    Returns the tiktoken encoding of the model, or None when it is not available.
+
+    Encodings are loaded on first use, once per process, and shared by all counters.
+    tiktoken downloads the BPE file of an encoding the first time it is used and keeps it
+    in TIKTOKEN_CACHE_DIR (a directory in the system temp dir by default): on offline hosts,
+    set TIKTOKEN_CACHE_DIR to a directory holding the files. Once a download failed, token counts
+    are approximated for the rest of the process.
+    """
+    global _encodings_unavailable
+    if tiktoken is None or _encodings_unavailable:
+        return None
+    try:
+        try:
+            return tiktoken.encoding_for_model(model)
+        except KeyError:
+            return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Tokenizer for {model} is not available, token counts are approximated: {e}")
+        _encodings_unavailable = True
+        return None
+
+
+class TokenCounter:
+    """Counts tokens locally with tiktoken, falling back to a character-based estimate."""
+
+    def __init__(self, model: str):
+        self.model = model
+        # The system prompt and the older turns are re-counted on every question
+        self.count = lru_cache(maxsize=1024)(self._count)
+
+    @property
+    def encoding(self):
+        return get_encoding(self.model)
+
+    def _count(self, text: str) -> int:
+        if self.encoding is None:
+            return len(text) // CHARS_PER_TOKEN + 1
+        return len(self.encoding.encode(text, disallowed_special=()))
+
+    def count_message(self, message: Dict[str, Any]) -> int:
+        return TOKENS_PER_MESSAGE + self.count(message["content"])
+
+    def count_messages(self, messages: List[Dict[str, Any]]) -> int:
+        return TOKENS_PER_ANSWER + sum(self.count_message(m) for m in messages)
+
+
+class ContextWindow:
+    """
+    Keeps the conversation sent to a model within a token budget.
+
+    The leading system messages and the last message are always kept,
+    the oldest turns are dropped first. The answer length is limited
+    by the room left in the model's context window.
+
+    Args:
+        model (str): The model name, used to pick the tokenizer and the context window size.
+        prompt_budget (int, optional): The maximum number of prompt tokens.
+            Defaults to the context window size minus `min_answer_tokens`.
+        max_answer_tokens (int): The maximum number of answer tokens.
+        min_answer_tokens (int): The number of tokens always reserved for the answer.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+        self,
+        model: str,
+        prompt_budget: Optional[int] = None,
+        max_answer_tokens: int = 2048,
+        min_answer_tokens: int = 256,
+    ):
+        self.counter = TokenCounter(model)
+        self.context_window = MODEL_CONTEXT_WINDOWS.get(model, DEFAULT_CONTEXT_WINDOW)
+        self.prompt_budget = self.context_window - min_answer_tokens
+        if prompt_budget is not None:
+            self.prompt_budget = min(prompt_budget, self.prompt_budget)
+        self.max_answer_tokens = max_answer_tokens
+
+    def fit(self, messages: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Returns the messages that fit into the prompt budget and the `max_tokens` for the answer.
+        """
+        n_system = 0
+        while n_system < len(messages) - 1 and messages[n_system]["role"] == "system":
+            n_system += 1
+        head, history, last = messages[:n_system], messages[n_system:-1], messages[-1:]
+
+        prompt_tokens = self.counter.count_messages(head + last)
+        n_kept = 0
+        for message in reversed(history):
+            message_tokens = self.counter.count_message(message)
+            if prompt_tokens + message_tokens > self.prompt_budget:
+                break
+            prompt_tokens += message_tokens
+            n_kept += 1
+
+        kept = history[len(history) - n_kept :]
+        # Do not start the history with an answer to a dropped question
+        if n_kept < len(history) and kept and kept[0]["role"] == "assistant":
+            prompt_tokens -= self.counter.count_message(kept[0])
+            kept = kept[1:]
+        if len(kept) < len(history):
+            self.logger.info(
+                f"Dropped {len(history) - len(kept)} of {len(history)} messages "
+                f"to fit the prompt into {self.prompt_budget} tokens"
+            )
+
+        answer_tokens = min(self.max_answer_tokens, self.context_window - prompt_tokens)
+        if answer_tokens <= 0:
+            self.logger.warning(
+                f"Prompt of {prompt_tokens} tokens does not fit into the context window"
+            )
+            answer_tokens = 1
+        return head + kept + last, answer_tokens
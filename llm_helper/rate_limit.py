@@ -0,0 +1,76 @@
+import asyncio
+import time
+
+from dtb.settings import LLM_REQUESTS_PER_MINUTE, LLM_TOKENS_PER_MINUTE
+from utils.metrics import LLM_DURATION_BUCKETS, get_gauge, get_metric
+
+
+class TokenBucket:
+    """A bucket of `per_minute` units, refilled continuously. A limit of 0 disables it."""
+
+    def __init__(self, per_minute: int):
+        self.capacity = per_minute
+        self.level = float(per_minute)
+        self.rate = per_minute / 60
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def get_wait(self, amount: float) -> float:
+        """Seconds until `amount` units are available."""
+        if not self.capacity:
+            return 0
+        self._refill()
+        # a request larger than the bucket only waits for a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return max(missing / self.rate, 0)
+
+    def take(self, amount: float) -> None:
+        if self.capacity:
+            self.level -= min(amount, self.capacity)
+
+
+class RateLimiter:
+    """
+    Admits LLM requests within the requests and tokens per minute quotas of the provider.
+
+    Requests wait in arrival order while the quotas are used up. The number of waiting requests
+    and their waits are recorded in the `<name>.rate_limit_queue` and `<name>.rate_limit_wait` metrics.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: int = LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute: int = LLM_TOKENS_PER_MINUTE,
+        name: str = "openai",
+    ):
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        # asyncio locks are fair, waiters are admitted in arrival order
+        self.lock = asyncio.Lock()
+        self.queue_depth = get_gauge(f"{name}.rate_limit_queue")
+        self.wait_time = get_metric(f"{name}.rate_limit_wait", LLM_DURATION_BUCKETS)
+
+    async def acquire(self, tokens: int) -> None:
+        """Waits until a request of `tokens` estimated tokens can be sent."""
+        started_at = time.monotonic()
+        self.queue_depth.inc()
+        try:
+            async with self.lock:
+                while True:
+                    wait = max(self.requests.get_wait(1), self.tokens.get_wait(tokens))
+                    if wait <= 0:
+                        break
+                    await asyncio.sleep(wait)
+                self.requests.take(1)
+                self.tokens.take(tokens)
+        finally:
+            self.queue_depth.dec()
+        self.wait_time.observe(time.monotonic() - started_at)
+
+
+# Shared by all the LLM helpers of the process, the quotas are per API key
+rate_limiter = RateLimiter()
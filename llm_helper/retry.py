@@ -0,0 +1,95 @@
+import asyncio
+import email.utils
+import logging
+import random
+import time
+from typing import Awaitable, Callable, Optional, TypeVar
+
+import openai
+from dtb.settings import LLM_RETRY_ATTEMPTS, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY
+from llm_helper.usage import CallStats
+
+T = TypeVar("T")
+
+# Status codes worth another attempt, other API errors (e.g. a bad request) are raised right away
+RETRYABLE_STATUS_CODES = (408, 409, 429, 500, 502, 503, 504)
+
+
+def get_retry_after(error: Exception) -> Optional[float]:
+    """Seconds to wait according to the Retry-After headers of the error response, if any."""
+    response = getattr(error, "response", None)
+    if response is None:
+        return None
+    retry_after_ms = response.headers.get("retry-after-ms")
+    if retry_after_ms is not None:
+        try:
+            return float(retry_after_ms) / 1000
+        except ValueError:
+            pass
+    retry_after = response.headers.get("retry-after")
+    if retry_after is None:
+        return None
+    try:
+        return float(retry_after)
+    except ValueError:
+        # an HTTP date
+        retry_at = email.utils.parsedate_tz(retry_after)
+        if retry_at is None:
+            return None
+        return max(email.utils.mktime_tz(retry_at) - time.time(), 0)
+
+
+class RetryPolicy:
+    """
+    Retries transient LLM API failures with a jittered exponential backoff.
+
+    The delay before the n-th retry is drawn from [0, min(max_delay, base_delay * 2 ** n)].
+    A Retry-After header is honored as a minimum; if it asks for more than `max_delay`,
+    the error is raised instead, the user would not wait for it anyway.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+        self,
+        attempts: int = LLM_RETRY_ATTEMPTS,
+        base_delay: float = LLM_RETRY_BASE_DELAY,
+        max_delay: float = LLM_RETRY_MAX_DELAY,
+    ):
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    @staticmethod
+    def is_retryable(error: Exception) -> bool:
+        if isinstance(error, openai.APIConnectionError):  # including timeouts
+            return True
+        if isinstance(error, openai.APIStatusError):
+            return error.status_code in RETRYABLE_STATUS_CODES
+        return False
+
+    def get_delay(self, retry: int, error: Exception) -> Optional[float]:
+        """Seconds to wait before the given retry (counted from 0), None to give up."""
+        delay = random.uniform(0, min(self.max_delay, self.base_delay * 2**retry))
+        retry_after = get_retry_after(error)
+        if retry_after is not None:
+            if retry_after > self.max_delay:
+                return None
+            delay = max(delay, retry_after)
+        return delay
+
+    async def run(self, call: Callable[[], Awaitable[T]], stats: CallStats = None) -> T:
+        """Awaits `call()`, calling it again after transient failures (counted in `stats`)."""
+        for retry in range(max(self.attempts, 1)):
+            try:
+                return await call()
+            except Exception as e:
+                if retry >= self.attempts - 1 or not self.is_retryable(e):
+                    raise
+                delay = self.get_delay(retry, e)
+                if delay is None:
+                    raise
+                self.logger.warning(f"LLM call failed ({e!r}), retrying in {delay:.2f}s")
+                if stats is not None:
+                    stats.retries += 1
+                await asyncio.sleep(delay)
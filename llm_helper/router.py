@@ -0,0 +1,190 @@
+import asyncio
+import logging
+import time
+from contextlib import nullcontext
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Coroutine, Dict, List, Optional, Tuple, TypeVar, Union
+
+from dtb.settings import LLM_DEFAULT_MODEL, LLM_FALLBACK_MODEL, LLM_ROUTES, LLM_MODEL_PRICES
+from llm_helper.backends import LLMBackend
+from llm_helper.chat import LLMHelper
+from llm_helper.usage import CallStats
+from utils.metrics import LLM_DURATION_BUCKETS, get_metric, register_collector
+
+T = TypeVar("T")
+
+QUESTION, VERDICT = "question", "verdict"
+
+
+class Route:
+    """
+    A rule of the routing policy: calls of the `task` ("question" or "verdict"), to agents
+    of the `agent_type`, with prompts of at most `max_prompt_tokens` tokens once fitted into
+    the context window of `model` go to `model`. Conditions left out match any call.
+
+    If `model` times out, `fallback_model` answers instead: for questions `timeout` is the wait
+    for the first token and the fallback gets the time left to the answer deadline, for verdicts
+    `timeout` is the wait for the whole assessment. Answers that started streaming are kept as they are. The latency of the route (including the fallback) is recorded
+    in the `llm_route.<name>` metric, its calls, tokens and estimated cost on the metrics page.
+    """
+
+    logger = logging.getLogger(__name__)
+
+    def __init__(
+        self,
+        name: str,
+        model: str,
+        fallback_model: Optional[str] = None,
+        task: Optional[str] = None,
+        agent_type: Optional[str] = None,
+        max_prompt_tokens: Optional[int] = None,
+        timeout: Optional[float] = None,
+        backend: Optional[LLMBackend] = None,
+    ):
+        self.name = name
+        self.task = task
+        self.agent_type = agent_type
+        self.max_prompt_tokens = max_prompt_tokens
+        self.timeout = timeout
+        self.helper = LLMHelper(model, backend=backend)
+        self.fallback_helper = LLMHelper(fallback_model, backend=backend) if fallback_model else None
+        if timeout is not None:
+            self.helper.first_token_timeout = timeout
+
+        self.latency = get_metric(f"llm_route.{name}", LLM_DURATION_BUCKETS)
+        self.calls = 0
+        self.fallbacks = 0
+        self.failures = 0
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.cost = 0.0
+
+    def matches(self, task: str, agent_type: Optional[str], messages: List[Any] = ()) -> bool:
+        if (self.task is not None and self.task != task) or (
+            self.agent_type is not None and self.agent_type != agent_type
+        ):
+            return False
+        if self.max_prompt_tokens is None:
+            return True
+        # the prompt as it would be sent to the model
+        messages, _ = self.helper.context_window.fit(messages)
+        return self.helper.context_window.counter.count_messages(messages) <= self.max_prompt_tokens
+
+    async def run(self, call: Callable[[LLMHelper], Awaitable[T]], streamed: bool) -> Tuple[T, LLMHelper]:
+        """Awaits `call(helper)` with the helper of the model, then of the fallback model on a timeout."""
+        started_at = time.monotonic()
+        self.calls += 1
+        try:
+            try:
+                # streamed answers time out on their first token, see __init__
+                async with asyncio.timeout(self.timeout) if not streamed else nullcontext():
+                    helper = self.helper
+                    result = await call(helper)
+            except TimeoutError as e:
+                if self.fallback_helper is None or getattr(e, "partial_answer", ""):
+                    raise
+                self.logger.warning(
+                    f"Route {self.name}: {self.helper.model} timed out, falling back to {self.fallback_helper.model}"
+                )
+                self.fallbacks += 1
+                helper = self.fallback_helper
+                result = await call(helper)
+        except Exception:
+            self.failures += 1
+            raise
+        finally:
+            self.latency.observe(time.monotonic() - started_at)
+        return result, helper
+
+    def record_usage(self, model: str, prompt_tokens: int, completion_tokens: int) -> None:
+        self.prompt_tokens += prompt_tokens
+        self.completion_tokens += completion_tokens
+        prompt_price, completion_price = LLM_MODEL_PRICES.get(model, (0, 0))
+        self.cost += (prompt_tokens * prompt_price + completion_tokens * completion_price) / 1000
+
+    def snapshot(self) -> dict:
+        return dict(
+            model=self.helper.model,
+            fallback_model=self.fallback_helper.model if self.fallback_helper else None,
+            calls=self.calls,
+            fallbacks=self.fallbacks,
+            failures=self.failures,
+            prompt_tokens=self.prompt_tokens,
+            completion_tokens=self.completion_tokens,
+            cost_usd=round(self.cost, 4),
+        )
+
+
+class ModelRouter:
+    """
+    Picks the model of every LLM call from a policy table, see the LLM_ROUTES setting.
+
+    Used in place of a single LLMHelper: questions are routed by the type of the questioned
+    agent and the size of the prompt, verdict assessments by their task alone. Calls matched
+    by no route go to `default_model`, falling back to `fallback_model` on a timeout.
+    A call waits for the rate limiter once, before its deadlines start: the fallback is not charged again.
+    Transcriptions are not routed.
+    """
+
+    def __init__(
+        self,
+        routes: List[Dict[str, Any]] = LLM_ROUTES,
+        default_model: str = LLM_DEFAULT_MODEL,
+        fallback_model: Optional[str] = LLM_FALLBACK_MODEL,
+        backend: Optional[LLMBackend] = None,
+    ):
+        self.routes = [Route(**route, backend=backend) for route in routes]
+        self.default_route = Route("default", default_model, fallback_model or None, backend=backend)
+        self.circuit_breaker = self.default_route.helper.circuit_breaker
+        register_collector("llm_routes", self.snapshot)
+
+    def route(self, task: str, agent_type: Optional[str] = None, messages: List[Any] = ()) -> Route:
+        for route in self.routes:
+            if route.matches(task, agent_type, messages):
+                return route
+        return self.default_route
+
+    async def chat_complete(
+        self,
+        messages: List[Any],
+        message_callback: Callable[[str], Coroutine[Any, Any, None]] = None,
+        agent_type: Optional[str] = None,
+        stats: CallStats = None,
+    ) -> str:
+        """Streams the answer of the model routed for the agent type and the prompt size, see LLMHelper."""
+        stats = stats if stats is not None else CallStats()
+        route = self.route(QUESTION, agent_type, messages)
+        # the call is charged once, the deadline starts when the rate limiter admitted it
+        # and the fallback model only gets the time left
+        await route.helper.acquire_chat_quota(messages)
+        deadline = time.monotonic() + route.helper.answer_timeout
+        answer, helper = await route.run(
+            lambda helper: helper.chat_complete(
+                messages, message_callback, stats=stats, deadline=deadline, quota_acquired=True
+            ),
+            streamed=True,
+        )
+        route.record_usage(helper.model, stats.prompt_tokens, stats.completion_tokens)
+        return answer
+
+    async def is_solved(
+        self, player_answer: str, ground_truth: str, prelude: str, stats: CallStats = None
+    ) -> tuple[bool, bool, bool, str]:
+        """Assesses the verdict with the model routed for verdicts, see LLMHelper."""
+        stats = stats if stats is not None else CallStats()
+        route = self.route(VERDICT)
+        # the call is charged once, the timeout of the route starts when the rate limiter admitted it
+        messages = route.helper.get_verdict_messages(player_answer, ground_truth, prelude)
+        await route.helper.acquire_quota(route.helper.context_window.counter.count_messages(messages))
+        result, helper = await route.run(
+            lambda helper: helper.is_solved(player_answer, ground_truth, prelude, stats, quota_acquired=True),
+            streamed=False,
+        )
+        route.record_usage(helper.model, stats.prompt_tokens, stats.completion_tokens)
+        return result
+
+    async def transcribe_audio_file(self, path: Union[Path, str], stats: CallStats = None) -> str:
+        return await self.default_route.helper.transcribe_audio_file(path, stats)
+
+    def snapshot(self) -> dict:
+        return {route.name: route.snapshot() for route in self.routes + [self.default_route]}
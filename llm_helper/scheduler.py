@@ -0,0 +1,142 @@
+import asyncio
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from typing import Deque, Dict, Hashable
+
+from dtb.settings import LLM_MAX_IN_FLIGHT
+from utils.metrics import LLM_DURATION_BUCKETS, DurationMetric, get_gauge, get_metric, register_collector
+
+# Number of users whose wait times are kept
+MAX_TRACKED_USERS = 1000
+
+
+class FairScheduler:
+    """
+    Bounds the number of in-flight LLM calls and shares them fairly between users.
+
+    While all slots are taken, waiting calls are admitted in a deficit round-robin over users:
+    on their turn users earn `weight` credits and every admitted call costs one, so a user with
+    many queued calls cannot delay the others, and a user of weight 2 gets two calls per turn.
+    Waits are recorded in the `llm_scheduler.wait` metric and per user.
+
+    The bot processes the updates of a user one at a time (see UserUpdateProcessor), so there
+    a user never has more than one waiting call: the scheduler caps the in-flight calls and admits
+    the waiting users in arrival order, weights only matter to callers with concurrent calls per user.
+    """
+
+    def __init__(self, max_in_flight: int = LLM_MAX_IN_FLIGHT, name: str = "llm_scheduler"):
+        self.max_in_flight = max_in_flight
+        self.in_flight = 0
+        # users with waiting calls, in turn order
+        self.active: Deque[Hashable] = deque()
+        self.queues: Dict[Hashable, Deque[asyncio.Future]] = {}
+        self.deficits: Dict[Hashable, float] = {}
+        self.weights: Dict[Hashable, float] = {}
+
+        self.in_flight_gauge = get_gauge(f"{name}.in_flight")
+        self.queued_gauge = get_gauge(f"{name}.queued")
+        # a slot is freed when an LLM call ends
+        self.wait_time = get_metric(f"{name}.wait", LLM_DURATION_BUCKETS)
+        self.user_wait_times: OrderedDict[Hashable, DurationMetric] = OrderedDict()
+        register_collector(f"{name}.user_wait", self.user_wait_snapshot)
+
+    @asynccontextmanager
+    async def slot(self, user_id: Hashable, weight: float = 1):
+        """Holds one of the in-flight slots, waiting for the turn of the user if they are all taken."""
+        if weight <= 0:
+            raise ValueError("The weight must be positive")
+        started_at = time.monotonic()
+        if self.in_flight < self.max_in_flight and not self.active:
+            self._admit()
+        else:
+            await self._wait(user_id, weight)
+        self._record_wait(user_id, time.monotonic() - started_at)
+        try:
+            yield
+        finally:
+            self._release()
+
+    async def _wait(self, user_id: Hashable, weight: float) -> None:
+        waiter = asyncio.get_running_loop().create_future()
+        if user_id not in self.queues:
+            self.queues[user_id] = deque()
+            self.deficits[user_id] = 0
+            self.active.append(user_id)
+        self.queues[user_id].append(waiter)
+        self.weights[user_id] = weight
+        self.queued_gauge.inc()
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # admitted just before the cancellation
+                self._release()
+            else:
+                self._remove_waiter(user_id, waiter)
+            raise
+        finally:
+            self.queued_gauge.dec()
+
+    def _remove_waiter(self, user_id: Hashable, waiter: asyncio.Future) -> None:
+        queue = self.queues[user_id]
+        queue.remove(waiter)
+        if not queue:
+            self.active.remove(user_id)
+            del self.queues[user_id], self.deficits[user_id], self.weights[user_id]
+
+    def _admit(self) -> None:
+        self.in_flight += 1
+        self.in_flight_gauge.inc()
+
+    def _release(self) -> None:
+        self.in_flight -= 1
+        self.in_flight_gauge.dec()
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Admits waiting calls while slots are free, in deficit round-robin order."""
+        while self.in_flight < self.max_in_flight and self.active:
+            user_id = self.active[0]
+            queue = self.queues[user_id]
+            if self.deficits[user_id] < 1:
+                # the turn of the user starts
+                self.deficits[user_id] += self.weights[user_id]
+                if self.deficits[user_id] < 1:
+                    self.active.rotate(-1)
+                    continue
+
+            waiter = queue.popleft()
+            self.deficits[user_id] -= 1
+            if not queue:
+                self.active.popleft()
+                del self.queues[user_id], self.deficits[user_id], self.weights[user_id]
+            elif self.deficits[user_id] < 1:
+                self.active.rotate(-1)
+
+            self._admit()
+            waiter.set_result(None)
+
+    def _record_wait(self, user_id: Hashable, seconds: float) -> None:
+        self.wait_time.observe(seconds)
+        if user_id not in self.user_wait_times:
+            self.user_wait_times[user_id] = DurationMetric(LLM_DURATION_BUCKETS)
+            if len(self.user_wait_times) > MAX_TRACKED_USERS:
+                self.user_wait_times.popitem(last=False)
+        self.user_wait_times.move_to_end(user_id)
+        self.user_wait_times[user_id].observe(seconds)
+
+    def user_wait_snapshot(self) -> dict:
+        """Waits of the most recently served users."""
+        return {
+            str(user_id): dict(
+                count=metric.count,
+                average=round(metric.total / metric.count, 3),
+                max=round(metric.max, 3),
+            )
+            for user_id, metric in reversed(self.user_wait_times.items())
+        }
+
+
+# Shared by all the handlers of the process
+llm_scheduler = FairScheduler()
@@ -0,0 +1,74 @@
+import time
+from typing import Any, Callable, Coroutine, List, Optional
+
+from dtb.settings import LLM_STREAM_CALLBACK_CHARS, LLM_STREAM_CALLBACK_INTERVAL
+
+
+class StreamTimeout(TimeoutError):
+    """A streamed answer did not arrive in time, `partial_answer` holds the text received until then."""
+
+    def __init__(self, message: str, partial_answer: str = ""):
+        super().__init__(message)
+        self.partial_answer = partial_answer
+
+
+class StreamAccumulator:
+    """
+    Collects the deltas of a streamed answer.
+
+    The first line of the answer (the `Answer from X:` header) is dropped once it is complete,
+    an answer of a single line is kept whole.
+    Deltas are buffered in a list and the callback gets the latest snapshot of the answer
+    at most every `interval` seconds, or earlier after `max_pending_chars` new characters.
+    The first snapshot is passed on right away.
+    """
+
+    def __init__(
+        self,
+        callback: Optional[Callable[[str], Coroutine[Any, Any, None]]] = None,
+        interval: float = LLM_STREAM_CALLBACK_INTERVAL,
+        max_pending_chars: int = LLM_STREAM_CALLBACK_CHARS,
+    ):
+        self.callback = callback
+        self.interval = interval
+        self.max_pending_chars = max_pending_chars
+        self.parts: List[str] = []
+        self.header_stripped = False
+        self.pending_chars = 0
+        self.last_callback_at = None
+
+    async def feed(self, delta: str) -> None:
+        """Adds a delta of the stream, calling the callback if it is due."""
+        self.parts.append(delta)
+        if not self.header_stripped:
+            # only the new delta can complete the header line
+            if "\n" not in delta:
+                return
+            head = "".join(self.parts)
+            delta = head[head.find("\n") + 1 :]
+            self.parts = [delta]
+            self.header_stripped = True
+        self.pending_chars += len(delta)
+
+        if self.callback is not None and self._is_callback_due():
+            text = self.text()
+            if not text:
+                # nothing to show yet, e.g. only the header was received
+                return
+            self.pending_chars = 0
+            self.last_callback_at = time.monotonic()
+            await self.callback(text)
+
+    def _is_callback_due(self) -> bool:
+        return (
+            self.last_callback_at is None
+            or self.pending_chars >= self.max_pending_chars
+            or time.monotonic() - self.last_callback_at >= self.interval
+        )
+
+    def text(self) -> str:
+        """The answer received so far."""
+        text = "".join(self.parts)
+        # keep the joined text, so that the next call only joins the new deltas
+        self.parts = [text]
+        return text.strip()
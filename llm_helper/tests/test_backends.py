@@ -0,0 +1,32 @@
+from unittest import IsolatedAsyncioTestCase
+
+from llm_helper.backends import FakeBackend, LLMBackend, get_backend
+
+
+class FakeBackendTest(IsolatedAsyncioTestCase):
+    async def test_stream_chat(self):
+        backend = FakeBackend(time_to_first_token=0, tokens_per_second=0, error_rate=0)
+        stream = await backend.stream_chat(messages=[], model="fake", max_tokens=3)
+        deltas = [delta async for delta in stream]
+
+        self.assertEqual(len(deltas), 3)
+        self.assertTrue(any("".join(deltas) in answer for answer in FakeBackend.ANSWERS["chat"]))
+
+    async def test_complete_chat(self):
+        backend = FakeBackend(time_to_first_token=0, tokens_per_second=0, error_rate=0)
+        self.assertIn(await backend.complete_chat(messages=[], model="fake"), FakeBackend.ANSWERS["verdict"])
+
+    def test_negative_tokens_per_second(self):
+        with self.assertRaises(ValueError):
+            FakeBackend(tokens_per_second=-1)
+
+
+class LLMBackendTest(IsolatedAsyncioTestCase):
+    def test_abstract(self):
+        with self.assertRaises(TypeError):
+            LLMBackend()
+
+    def test_get_backend(self):
+        self.assertIsInstance(get_backend("fake"), FakeBackend)
+        with self.assertRaises(ValueError):
+            get_backend("unknown")
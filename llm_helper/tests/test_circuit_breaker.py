@@ -0,0 +1,84 @@
+import asyncio
+import io
+from contextlib import redirect_stdout
+from unittest import IsolatedAsyncioTestCase, mock
+
+import httpx
+import openai
+
+from llm_helper.backends import FakeBackend
+from llm_helper.chat import LLMHelper
+from llm_helper.circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker
+from llm_helper.retry import RetryPolicy
+
+
+def connection_error() -> openai.APIConnectionError:
+    return openai.APIConnectionError(request=httpx.Request("POST", "http://fake-llm/v1"))
+
+
+class CircuitBreakerTest(IsolatedAsyncioTestCase):
+    def get_breaker(self, **kwargs) -> CircuitBreaker:
+        options = dict(min_calls=1, failure_rate=0.5, slow_call=0.1, open_for=0, probes=1)
+        options.update(kwargs)
+        return CircuitBreaker(name=f"test_breaker.{self._testMethodName}", **options)
+
+    async def request(self, breaker: CircuitBreaker, duration: float = 0, error: Exception = None):
+        async with breaker.guard():
+            await asyncio.sleep(duration)
+            if error is not None:
+                raise error
+
+    async def open_circuit(self, breaker: CircuitBreaker):
+        with self.assertRaises(openai.APIConnectionError):
+            await self.request(breaker, error=connection_error())
+        self.assertEqual(breaker.state, OPEN)
+
+    async def test_cancelled_probe_is_not_a_success(self):
+        breaker = self.get_breaker()
+        await self.open_circuit(breaker)
+
+        probe = asyncio.create_task(self.request(breaker, duration=1))
+        await asyncio.sleep(0.01)
+        self.assertEqual(breaker.state, HALF_OPEN)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+        self.assertEqual(breaker.state, HALF_OPEN)
+        self.assertEqual(breaker.successful_probes, 0)
+        self.assertFalse(breaker.rejects_calls)
+        await self.request(breaker)
+        self.assertEqual(breaker.state, CLOSED)
+
+    async def test_cancelled_slow_probe_opens_the_circuit(self):
+        breaker = self.get_breaker()
+        await self.open_circuit(breaker)
+
+        probe = asyncio.create_task(self.request(breaker, duration=1))
+        await asyncio.sleep(breaker.slow_call + 0.05)
+        probe.cancel()
+        await asyncio.gather(probe, return_exceptions=True)
+
+        self.assertEqual(breaker.state, OPEN)
+
+    async def test_retry_backoff_is_not_judged(self):
+        helper = LLMHelper(
+            retry_policy=RetryPolicy(attempts=2, base_delay=0.3, max_delay=0.3),
+            backend=FakeBackend(time_to_first_token=0.01, tokens_per_second=1000, error_rate=0),
+        )
+        helper.circuit_breaker = self.get_breaker(min_calls=10)
+        failures = iter([connection_error()])
+
+        def maybe_fail():
+            error = next(failures, None)
+            if error is not None:
+                raise error
+
+        # is_solved prints the assessment
+        with mock.patch.object(helper.backend, "_maybe_fail", maybe_fail), mock.patch(
+            "llm_helper.retry.random.uniform", return_value=0.3
+        ), redirect_stdout(io.StringIO()):
+            await helper.is_solved("The butler", "The butler did it", "A storm")
+
+        # the failed request and the retried one, the backoff between them was not timed
+        self.assertEqual([failed for _, failed, _ in helper.circuit_breaker.calls], [True, False])
+        self.assertEqual(helper.circuit_breaker.slow_calls, 0)
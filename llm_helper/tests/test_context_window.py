@@ -0,0 +1,92 @@
+from unittest import TestCase, mock
+
+from llm_helper import context_window
+from llm_helper.context_window import ContextWindow, TokenCounter, get_encoding
+
+SYSTEM = {"role": "system", "content": "You are the gardener of the manor."}
+
+
+def get_conversation(turns: int) -> list:
+    messages = [SYSTEM]
+    for turn in range(turns):
+        messages += [
+            {"role": "user", "content": f"Question {turn}: where were you on the night of the murder?"},
+            {"role": "assistant", "content": f"Answer {turn}: in the greenhouse, " + "tending the orchids " * turn},
+        ]
+    return messages + [{"role": "user", "content": "Who did you see?"}]
+
+
+class ContextWindowTest(TestCase):
+    def test_fit_keeps_everything_within_budget(self):
+        window = ContextWindow("gpt-4", max_answer_tokens=100)
+        messages = get_conversation(turns=3)
+
+        fitted, max_tokens = window.fit(messages)
+
+        self.assertEqual(fitted, messages)
+        self.assertEqual(max_tokens, 100)
+
+    def test_fit_never_keeps_an_answer_without_its_question(self):
+        messages = get_conversation(turns=8)
+        counter = TokenCounter("gpt-4")
+        total = counter.count_messages(messages)
+        minimum = counter.count_messages([messages[0], messages[-1]])
+
+        for budget in range(minimum, total + 1):
+            window = ContextWindow("gpt-4", prompt_budget=budget)
+            fitted, _ = window.fit(messages)
+
+            # the system prompt and the question are always kept
+            self.assertEqual(fitted[0], SYSTEM)
+            self.assertEqual(fitted[-1], messages[-1])
+            history = fitted[1:-1]
+            # the most recent turns are kept
+            self.assertEqual(history, messages[len(messages) - 1 - len(history) : -1])
+            if history:
+                self.assertEqual(history[0]["role"], "user", f"budget {budget}")
+            self.assertLessEqual(counter.count_messages(fitted), budget)
+
+    def test_prompt_larger_than_the_context_window(self):
+        window = ContextWindow("gpt-4")
+        question = {"role": "user", "content": "Why? " * 20000}
+
+        fitted, max_tokens = window.fit([SYSTEM, question])
+
+        # the question is sent anyway, the answer gets one token
+        self.assertEqual(fitted, [SYSTEM, question])
+        self.assertEqual(max_tokens, 1)
+
+    def test_answer_gets_the_room_left(self):
+        window = ContextWindow("gpt-3.5-turbo", max_answer_tokens=2048)
+        messages = get_conversation(turns=1)
+
+        _, max_tokens = window.fit(messages)
+
+        self.assertEqual(max_tokens, min(2048, 4096 - window.counter.count_messages(messages)))
+
+
+class GetEncodingTest(TestCase):
+    def setUp(self):
+        get_encoding.cache_clear()
+        self.addCleanup(get_encoding.cache_clear)
+        patcher = mock.patch.object(context_window, "_encodings_unavailable", False)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_loaded_on_first_count(self):
+        with mock.patch.object(context_window, "get_encoding", return_value=None) as patched:
+            counter = ContextWindow("gpt-4").counter
+            patched.assert_not_called()
+
+            self.assertEqual(counter.count("Where were you?"), len("Where were you?") // 4 + 1)
+            patched.assert_called_with("gpt-4")
+
+    @mock.patch.object(context_window, "tiktoken")
+    def test_download_is_attempted_once(self, tiktoken):
+        tiktoken.encoding_for_model.side_effect = ConnectionError("offline")
+
+        counters = [TokenCounter(model) for model in ("gpt-4", "gpt-3.5-turbo", "gpt-4")]
+        counts = [counter.count("Where were you?") for counter in counters]
+
+        self.assertEqual(counts, [len("Where were you?") // 4 + 1] * 3)
+        tiktoken.encoding_for_model.assert_called_once_with("gpt-4")
@@ -0,0 +1,81 @@
+import asyncio
+import time
+from unittest import IsolatedAsyncioTestCase
+
+from llm_helper.backends import FakeBackend
+from llm_helper.chat import LLMHelper
+from llm_helper.rate_limit import RateLimiter
+from llm_helper.usage import CallStats
+
+
+class RateLimiterTest(IsolatedAsyncioTestCase):
+    def get_rate_limiter(self, requests_per_minute: int = 0, tokens_per_minute: int = 0) -> RateLimiter:
+        return RateLimiter(requests_per_minute, tokens_per_minute, name=f"test_rate_limit.{self._testMethodName}")
+
+    async def test_fifo(self):
+        # 1000 tokens per second, used up
+        rate_limiter = self.get_rate_limiter(tokens_per_minute=60000)
+        rate_limiter.tokens.take(60000)
+        admitted = []
+
+        async def request(name: str, tokens: int):
+            await rate_limiter.acquire(tokens)
+            admitted.append(name)
+
+        tasks = [asyncio.create_task(request("large", 100))]
+        await asyncio.sleep(0)
+        tasks += [asyncio.create_task(request(f"small{number}", 1)) for number in range(2)]
+        await asyncio.gather(*tasks)
+
+        # the small requests do not overtake the large one that came first
+        self.assertEqual(admitted, ["large", "small0", "small1"])
+        self.assertEqual(rate_limiter.wait_time.count, 3)
+        self.assertEqual(rate_limiter.queue_depth.value, 0)
+
+    async def test_requests_per_minute(self):
+        # a request every 0.05s
+        rate_limiter = self.get_rate_limiter(requests_per_minute=1200)
+        rate_limiter.requests.take(1200)
+
+        started_at = time.monotonic()
+        for _ in range(3):
+            await rate_limiter.acquire(1)
+
+        self.assertGreaterEqual(time.monotonic() - started_at, 0.14)
+
+    async def test_request_larger_than_the_bucket(self):
+        rate_limiter = self.get_rate_limiter(tokens_per_minute=600)
+
+        await asyncio.wait_for(rate_limiter.acquire(1000), timeout=1)
+
+        self.assertEqual(rate_limiter.tokens.level, 0)
+
+    async def test_disabled(self):
+        rate_limiter = self.get_rate_limiter()
+
+        started_at = time.monotonic()
+        for _ in range(100):
+            await rate_limiter.acquire(10**6)
+
+        self.assertLess(time.monotonic() - started_at, 0.1)
+
+    async def test_charge(self):
+        helper = LLMHelper(backend=FakeBackend(time_to_first_token=0, tokens_per_second=0, error_rate=0))
+        helper.rate_limiter = self.get_rate_limiter(requests_per_minute=100, tokens_per_minute=100000)
+        helper.expected_answer_tokens = 300
+        stats = CallStats()
+
+        await helper.chat_complete([{"role": "user", "content": "Where were you?"}], stats=stats)
+
+        # the prompt and the expected answer, not max_tokens
+        self.assertEqual(helper.rate_limiter.tokens.level, 100000 - stats.prompt_tokens - 300)
+        self.assertEqual(helper.rate_limiter.requests.level, 99)
+
+    async def test_charge_at_most_max_tokens(self):
+        helper = LLMHelper(backend=FakeBackend(time_to_first_token=0, tokens_per_second=0, error_rate=0))
+        helper.rate_limiter = self.get_rate_limiter(tokens_per_minute=100000)
+        helper.expected_answer_tokens = 300
+
+        await helper.acquire_quota(1000, max_tokens=100)
+
+        self.assertEqual(helper.rate_limiter.tokens.level, 100000 - 1100)
@@ -0,0 +1,138 @@
+import asyncio
+import io
+import time
+from contextlib import redirect_stdout
+from unittest import IsolatedAsyncioTestCase
+
+from llm_helper.backends import FakeBackend
+from llm_helper.rate_limit import RateLimiter
+from llm_helper.router import QUESTION, VERDICT, ModelRouter
+from llm_helper.stream import StreamTimeout
+from llm_helper.usage import CallStats
+
+SMALL_MODEL, LARGE_MODEL = "gpt-3.5-turbo-1106", "gpt-4-1106-preview"
+
+
+class SlowBackend(FakeBackend):
+    """Answers of the `slow_models` only start streaming after `delay` seconds."""
+
+    def __init__(self, slow_models=(), delay: float = 5):
+        super().__init__(time_to_first_token=0, tokens_per_second=0, error_rate=0)
+        self.slow_models = slow_models
+        self.delay = delay
+
+    async def stream_chat(self, **kwargs):
+        if kwargs["model"] in self.slow_models:
+            await asyncio.sleep(self.delay)
+        return await super().stream_chat(**kwargs)
+
+
+def get_conversation(turns: int) -> list:
+    messages = [{"role": "system", "content": "You are the gardener of the manor."}]
+    for turn in range(turns):
+        messages += [
+            {"role": "user", "content": f"Question {turn}: where were you on the night of the murder?"},
+            {"role": "assistant", "content": f"Answer {turn}: I was in the greenhouse, tending the orchids."},
+        ]
+    return messages + [{"role": "user", "content": "Who did you see?"}]
+
+
+class ModelRouterTest(IsolatedAsyncioTestCase):
+    def get_router(self, backend: FakeBackend, **route) -> ModelRouter:
+        route = {**dict(name="small", task=QUESTION, model=SMALL_MODEL, fallback_model=LARGE_MODEL), **route}
+        return ModelRouter([route], default_model=LARGE_MODEL, fallback_model=None, backend=backend)
+
+    def saturate(self, router: ModelRouter) -> RateLimiter:
+        """Gives the router a rate limiter with no quota left, admitting a request every 0.1s."""
+        rate_limiter = RateLimiter(
+            requests_per_minute=600, tokens_per_minute=0, name=f"test_router.{self._testMethodName}"
+        )
+        rate_limiter.requests.take(600)
+        for route in router.routes + [router.default_route]:
+            for helper in filter(None, (route.helper, route.fallback_helper)):
+                helper.rate_limiter = rate_limiter
+        return rate_limiter
+
+    async def test_route_on_fitted_prompt(self):
+        router = self.get_router(SlowBackend(), max_prompt_tokens=200)
+        small_route = router.routes[0]
+        small_route.helper.context_window.prompt_budget = 150
+        messages = get_conversation(turns=20)
+        self.assertGreater(small_route.helper.context_window.counter.count_messages(messages), 200)
+
+        self.assertIs(router.route(QUESTION, messages=messages), small_route)
+        stats = CallStats()
+        await router.chat_complete(messages, stats=stats)
+
+        # the usage of the prompt sent to the model
+        self.assertEqual(stats.model, SMALL_MODEL)
+        self.assertLessEqual(stats.prompt_tokens, 150)
+        self.assertEqual(small_route.snapshot()["prompt_tokens"], stats.prompt_tokens)
+        self.assertEqual(small_route.snapshot()["completion_tokens"], stats.completion_tokens)
+        self.assertEqual(router.default_route.calls, 0)
+
+    def test_latency_histogram_covers_llm_calls(self):
+        latency = self.get_router(SlowBackend()).routes[0].latency
+        before = latency.snapshot()["histogram"]["≤60s"]
+
+        latency.observe(45)
+
+        # a slow answer is told apart from a stuck one
+        self.assertEqual(latency.snapshot()["histogram"]["≤60s"], before + 1)
+        self.assertGreaterEqual(latency.buckets[-1], 120)
+
+    async def test_fallback_gets_time_left(self):
+        router = self.get_router(SlowBackend(slow_models=(SMALL_MODEL, LARGE_MODEL)), timeout=0.2)
+        small_route = router.routes[0]
+        small_route.helper.answer_timeout = 0.5
+
+        started_at = time.monotonic()
+        with self.assertRaises(StreamTimeout):
+            await router.chat_complete(get_conversation(turns=1))
+
+        self.assertEqual(small_route.fallbacks, 1)
+        self.assertLess(time.monotonic() - started_at, 1)
+
+    async def test_fallback(self):
+        router = self.get_router(SlowBackend(slow_models=(SMALL_MODEL,)), timeout=0.2)
+        stats = CallStats()
+
+        answer = await router.chat_complete(get_conversation(turns=1), stats=stats)
+
+        self.assertTrue(answer)
+        self.assertEqual(stats.model, LARGE_MODEL)
+        self.assertEqual(router.routes[0].fallbacks, 1)
+
+    async def test_deadline_starts_after_rate_limit(self):
+        router = self.get_router(SlowBackend(), timeout=0.05)
+        router.routes[0].helper.answer_timeout = 0.05
+        rate_limiter = self.saturate(router)
+
+        answer = await router.chat_complete(get_conversation(turns=1))
+
+        self.assertTrue(answer)
+        self.assertEqual(router.routes[0].fallbacks, 0)
+        # charged once
+        self.assertEqual(rate_limiter.wait_time.count, 1)
+        self.assertLess(rate_limiter.requests.level, 1)
+
+    async def test_fallback_is_not_charged_again(self):
+        router = self.get_router(SlowBackend(slow_models=(SMALL_MODEL,)), timeout=0.2)
+        rate_limiter = self.saturate(router)
+
+        await router.chat_complete(get_conversation(turns=1))
+
+        self.assertEqual(router.routes[0].fallbacks, 1)
+        self.assertEqual(rate_limiter.wait_time.count, 1)
+
+    async def test_verdict_timeout_starts_after_rate_limit(self):
+        router = self.get_router(SlowBackend(), task=VERDICT, timeout=0.05)
+        rate_limiter = self.saturate(router)
+
+        # is_solved prints the assessment
+        with redirect_stdout(io.StringIO()):
+            await router.is_solved("The butler", "The butler did it", "A storm")
+
+        self.assertEqual(router.routes[0].calls, 1)
+        self.assertEqual(router.routes[0].fallbacks, 0)
+        self.assertEqual(rate_limiter.wait_time.count, 1)
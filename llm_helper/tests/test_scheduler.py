@@ -0,0 +1,144 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase, mock
+
+from llm_helper.backends import FakeBackend
+from llm_helper.scheduler import FairScheduler
+
+
+class FairSchedulerTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.backend = FakeBackend(time_to_first_token=0.01, tokens_per_second=1000, error_rate=0)
+        # calls in the order they were admitted, as "<user><number>"
+        self.admitted = []
+        self.running = 0
+        self.max_running = 0
+
+    def get_scheduler(self, max_in_flight: int) -> FairScheduler:
+        return FairScheduler(max_in_flight, name=f"test_scheduler.{self._testMethodName}")
+
+    async def call(self, scheduler: FairScheduler, user_id: str, number: int, weight: float = 1) -> str:
+        async with scheduler.slot(user_id, weight):
+            self.admitted.append(f"{user_id}{number}")
+            self.running += 1
+            self.max_running = max(self.max_running, self.running)
+            try:
+                return await self.backend.complete_chat(messages=[], model="fake")
+            finally:
+                self.running -= 1
+
+    def start_calls(self, scheduler: FairScheduler, user_id: str, count: int, weight: float = 1) -> list:
+        return [
+            asyncio.create_task(self.call(scheduler, user_id, number, weight)) for number in range(count)
+        ]
+
+    async def test_new_user_is_not_delayed_by_heavy_user(self):
+        scheduler = self.get_scheduler(max_in_flight=2)
+        tasks = self.start_calls(scheduler, "heavy", 8)
+        await asyncio.sleep(0)
+        tasks += self.start_calls(scheduler, "new", 2)
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(
+            self.admitted,
+            ["heavy0", "heavy1", "heavy2", "new0", "heavy3", "new1", "heavy4", "heavy5", "heavy6", "heavy7"],
+        )
+
+    async def test_weights(self):
+        scheduler = self.get_scheduler(max_in_flight=1)
+        tasks = self.start_calls(scheduler, "blocker", 1)
+        await asyncio.sleep(0)
+        tasks += self.start_calls(scheduler, "player", 4)
+        tasks += self.start_calls(scheduler, "admin", 6, weight=2)
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(
+            self.admitted,
+            [
+                "blocker0",
+                *("player0", "admin0", "admin1"),
+                *("player1", "admin2", "admin3"),
+                *("player2", "admin4", "admin5"),
+                "player3",
+            ],
+        )
+
+    async def test_weight_must_be_positive(self):
+        scheduler = self.get_scheduler(max_in_flight=1)
+        with self.assertRaises(ValueError):
+            async with scheduler.slot("user", weight=0):
+                pass
+
+    async def test_in_flight_cap(self):
+        scheduler = self.get_scheduler(max_in_flight=3)
+        tasks = []
+        for user_number in range(10):
+            tasks += self.start_calls(scheduler, f"user{user_number}-", 2)
+        answers = await asyncio.gather(*tasks)
+
+        self.assertEqual(len(answers), 20)
+        self.assertEqual(self.max_running, 3)
+        self.assertEqual(scheduler.in_flight_gauge.max, 3)
+        self.assertEqual(scheduler.in_flight, 0)
+        self.assertEqual(scheduler.in_flight_gauge.value, 0)
+        self.assertEqual(scheduler.queued_gauge.value, 0)
+
+    async def test_cancel_queued_call(self):
+        scheduler = self.get_scheduler(max_in_flight=1)
+        tasks = self.start_calls(scheduler, "blocker", 1)
+        await asyncio.sleep(0)
+        cancelled = self.start_calls(scheduler, "gone", 1)[0]
+        tasks += self.start_calls(scheduler, "user", 1)
+        await asyncio.sleep(0)
+        self.assertEqual(scheduler.queued_gauge.value, 2)
+
+        cancelled.cancel()
+        await asyncio.sleep(0)
+        # the cancelled call left the queue at once
+        self.assertNotIn("gone", scheduler.queues)
+        self.assertEqual(scheduler.queued_gauge.value, 1)
+        await asyncio.gather(*tasks)
+
+        self.assertTrue(cancelled.cancelled())
+        self.assertEqual(self.admitted, ["blocker0", "user0"])
+        self.assertEqual(scheduler.in_flight, 0)
+        self.assertEqual(scheduler.queued_gauge.value, 0)
+        self.assertFalse(scheduler.active)
+        self.assertFalse(scheduler.queues)
+
+    async def test_cancelled_call_does_not_cost_a_turn(self):
+        scheduler = self.get_scheduler(max_in_flight=1)
+        tasks = self.start_calls(scheduler, "blocker", 1)
+        await asyncio.sleep(0)
+        cancelled, kept = self.start_calls(scheduler, "user", 2)
+        tasks += [kept] + self.start_calls(scheduler, "other", 1)
+        await asyncio.sleep(0)
+
+        cancelled.cancel()
+        await asyncio.gather(*tasks)
+
+        self.assertEqual(self.admitted, ["blocker0", "user1", "other0"])
+
+    async def test_user_wait_metrics(self):
+        scheduler = self.get_scheduler(max_in_flight=1)
+        tasks = self.start_calls(scheduler, "first", 1)
+        await asyncio.sleep(0)
+        tasks += self.start_calls(scheduler, "second", 2)
+        await asyncio.gather(*tasks)
+
+        waits = scheduler.user_wait_snapshot()
+        # the most recently served user first
+        self.assertEqual(list(waits), ["second", "first"])
+        self.assertEqual(waits["first"]["count"], 1)
+        self.assertLess(waits["first"]["max"], 0.01)
+        self.assertEqual(waits["second"]["count"], 2)
+        # the second call waited for the two calls before it
+        self.assertGreater(waits["second"]["max"], 2 * self.backend.time_to_first_token)
+        self.assertEqual(scheduler.wait_time.count, 3)
+
+    async def test_user_wait_metrics_are_bounded(self):
+        scheduler = self.get_scheduler(max_in_flight=1)
+        with mock.patch("llm_helper.scheduler.MAX_TRACKED_USERS", 2):
+            for user_id in ("first", "second", "third"):
+                await self.call(scheduler, user_id, 0)
+
+        self.assertEqual(list(scheduler.user_wait_snapshot()), ["third", "second"])
@@ -0,0 +1,61 @@
+import asyncio
+from unittest import IsolatedAsyncioTestCase
+
+from llm_helper.stream import StreamAccumulator
+
+
+class StreamAccumulatorTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.snapshots = []
+
+    async def callback(self, text: str) -> None:
+        self.snapshots.append(text)
+
+    async def feed(self, accumulator: StreamAccumulator, deltas) -> str:
+        for delta in deltas:
+            await accumulator.feed(delta)
+        return accumulator.text()
+
+    async def test_header_is_dropped_once(self):
+        accumulator = StreamAccumulator(self.callback, interval=0)
+
+        text = await self.feed(
+            accumulator, ["Answer fr", "om Alice:", "\n\n In the", " library.\n", "Then I went to bed.\n"]
+        )
+
+        self.assertEqual(text, "In the library.\nThen I went to bed.")
+        # no snapshot with the header, or before it was complete
+        self.assertEqual(
+            self.snapshots, ["In the", "In the library.", "In the library.\nThen I went to bed."]
+        )
+
+    async def test_header_and_answer_in_one_delta(self):
+        accumulator = StreamAccumulator()
+
+        text = await self.feed(accumulator, ["Answer from Alice:\n\n In the library.\nAlone."])
+
+        self.assertEqual(text, "In the library.\nAlone.")
+
+    async def test_answer_of_a_single_line(self):
+        accumulator = StreamAccumulator(self.callback)
+
+        # nothing is shown while the first line may be the header, the complete answer is kept
+        self.assertEqual(await self.feed(accumulator, ["I was in", " the library."]), "I was in the library.")
+        self.assertEqual(self.snapshots, [])
+
+    async def test_throttling(self):
+        accumulator = StreamAccumulator(self.callback, interval=60, max_pending_chars=10)
+
+        await self.feed(accumulator, ["Answer from Alice:\n", "In", " the", " lib", "rary", " alone."])
+
+        # the first snapshot right away, the next one after 10 new characters
+        self.assertEqual(self.snapshots, ["In", "In the library"])
+
+    async def test_interval(self):
+        accumulator = StreamAccumulator(self.callback, interval=0.05, max_pending_chars=1000)
+
+        await self.feed(accumulator, ["Answer from Alice:\n", "In", " the"])
+        await asyncio.sleep(0.06)
+        await self.feed(accumulator, [" library"])
+
+        self.assertEqual(self.snapshots, ["In", "In the library"])
@@ -0,0 +1,27 @@
+import time
+from typing import Optional
+
+
+class CallStats:
+    """
+    What an LLM call used, filled in by LLMHelper while the call runs, see `stories.ledger`.
+
+    The time to first token is measured from the creation of the object, so it includes
+    the waits for retries and for a fallback model.
+    """
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.model = ""
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.time_to_first_token: Optional[float] = None
+        self.retries = 0
+
+    def first_token(self) -> None:
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.monotonic() - self.started_at
+
+    @property
+    def duration(self) -> float:
+        return time.monotonic() - self.started_at
@@ -8,17 +8,29 @@ django.setup()
 from telegram import Bot
 from telegram.ext import Updater, DictPersistence, Application
 
+from dtb.background_jobs import start_background_jobs, stop_background_jobs
 from dtb.settings import TELEGRAM_TOKEN
 from tgbot.dispatcher import setup_event_handlers
 
 
+async def post_init(app: Application) -> None:
+    await set_up_commands(app)
+    # the same jobs as in the webhook mode, see dtb/main.py
+    start_background_jobs()
+
+
+async def post_stop(app: Application) -> None:
+    await stop_background_jobs()
+
+
 def run_polling(tg_token: str = TELEGRAM_TOKEN):
     """Run bot in polling mode"""
     app = (
         Application.builder()
         .token(tg_token)
         .persistence(DictPersistence())
-        .post_init(set_up_commands)
+        .post_init(post_init)
+        .post_stop(post_stop)
         .build()
     )
     app = setup_event_handlers(app)
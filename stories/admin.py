@@ -1,4 +1,8 @@
 from django.contrib import admin
+from django.db.models import Count
+from django.shortcuts import render
+from django.urls import path
+from django.utils.html import format_html_join
 
 from stories.models import (
     Story,
@@ -6,11 +10,32 @@ from stories.models import (
     StoryCompletion,
     AgentInteraction,
     AgentInteractionMessage,
+    StoryCompletionArchive,
+    StoryStats,
+    LLMCall,
+    LATENCY_BUCKETS,
 )
+from stories.search import SEARCH_FIELDS, search
+from utils.paginator import EstimatedCountPaginator
+
+
+def format_transcript(messages: list[dict]) -> str:
+    return format_html_join(
+        "",
+        '<p><b>{}</b> <small>{}</small><br><span style="white-space: pre-wrap">{}</span></p>',
+        ((m["role"], m["created_at"], m["message"]) for m in messages),
+    )
+
+
+class FullTextSearchAdmin(admin.ModelAdmin):
+    """Searches with the full-text indexes of `stories.search` instead of `icontains` scans."""
+
+    def get_search_results(self, request, queryset, search_term):
+        return search(queryset, search_term), False
 
 
 @admin.register(Story)
-class StoryAdmin(admin.ModelAdmin):
+class StoryAdmin(FullTextSearchAdmin):
     list_display = [
         "id",
         "title",
@@ -20,11 +45,11 @@ class StoryAdmin(admin.ModelAdmin):
         "created_at",
         "updated_at",
     ]
-    search_fields = ("title", "prelude")
+    search_fields = SEARCH_FIELDS[Story]
 
 
 @admin.register(Agent)
-class AgentAdmin(admin.ModelAdmin):
+class AgentAdmin(FullTextSearchAdmin):
     list_display = [
         "id",
         "story",
@@ -36,7 +61,8 @@ class AgentAdmin(admin.ModelAdmin):
         "relationships",
         "knowledge",
     ]
-    search_fields = ("name", "background")
+    list_select_related = ["story"]
+    search_fields = SEARCH_FIELDS[Agent]
 
 
 @admin.register(StoryCompletion)
@@ -51,16 +77,166 @@ class StoryCompletionAdmin(admin.ModelAdmin):
         "completed_at",
         "score",
     ]
-    search_fields = ("user", "story")
+    list_select_related = ["user", "story"]
+    search_fields = ("user__username", "story__title")
+    raw_id_fields = ["user", "story", "system_prompt"]
+    readonly_fields = ["transcript"]
+
+    @admin.display(description="Transcript")
+    def transcript(self, obj):
+        # read from the archive if the completion was archived
+        return format_transcript(obj.get_transcript())
 
 
 @admin.register(AgentInteraction)
 class AgentInteractionAdmin(admin.ModelAdmin):
-    list_display = ["id", "story_completion", "agent"]
-    search_fields = ("agent",)
+    list_display = ["id", "story_completion", "agent", "message_count"]
+    list_select_related = ["story_completion__user", "story_completion__story", "agent__story"]
+    search_fields = ("agent__name", "story_completion__user__username")
+    raw_id_fields = ["story_completion", "agent", "system_prompt"]
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).annotate(message_count=Count("agentinteractionmessage"))
+
+    @admin.display(description="Messages", ordering="message_count")
+    def message_count(self, obj):
+        return obj.message_count
 
 
 @admin.register(AgentInteractionMessage)
-class AgentInteractionMessageAdmin(admin.ModelAdmin):
-    list_display = ["id", "agent_interaction", "message", "role"]
-    search_fields = ("agent_interaction", "role", "message")
+class AgentInteractionMessageAdmin(FullTextSearchAdmin):
+    list_display = ["id", "agent_interaction", "body", "role", "created_at"]
+    list_select_related = [
+        "agent_interaction__agent__story",
+        "agent_interaction__story_completion__user",
+    ]
+    search_fields = SEARCH_FIELDS[AgentInteractionMessage]
+    raw_id_fields = ["agent_interaction"]
+    readonly_fields = ["body"]
+    # the table is too big to be counted on every page
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    @admin.display(description="Message")
+    def body(self, obj):
+        # decompressed if needed
+        return obj.body
+
+
+@admin.register(StoryCompletionArchive)
+class StoryCompletionArchiveAdmin(admin.ModelAdmin):
+    list_display = ["story_completion", "message_count", "created_at"]
+    list_select_related = ["story_completion__user", "story_completion__story"]
+    exclude = ["transcript"]
+    readonly_fields = ["story_completion", "message_count", "created_at", "messages"]
+
+    @admin.display(description="Transcript")
+    def messages(self, obj):
+        return format_transcript(obj.unpack())
+
+
+def format_ratio(value) -> str:
+    return "-" if value is None else f"{value:.2f}"
+
+
+@admin.register(StoryStats)
+class StoryStatsAdmin(admin.ModelAdmin):
+    list_display = [
+        "story",
+        "started",
+        "questions",
+        "failed_questions",
+        "verdicts",
+        "solved",
+        "quits",
+        "solve_rate",
+        "questions_per_completion",
+        "average_latency",
+        "p95_latency",
+        "updated_at",
+    ]
+    list_select_related = ["story"]
+    readonly_fields = [field.name for field in StoryStats._meta.fields]
+    change_list_template = "admin/story_stats_change_list.html"
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description="Solve rate")
+    def solve_rate(self, obj):
+        return format_ratio(obj.solve_rate)
+
+    @admin.display(description="Questions per completion")
+    def questions_per_completion(self, obj):
+        return format_ratio(obj.questions_per_completion)
+
+    @admin.display(description="Average LLM latency, s")
+    def average_latency(self, obj):
+        return format_ratio(obj.average_latency)
+
+    @admin.display(description="p95 LLM latency, s")
+    def p95_latency(self, obj):
+        return format_ratio(obj.latency_percentile(95))
+
+    def get_urls(self):
+        return [
+            path(
+                "dashboard/",
+                self.admin_site.admin_view(self.dashboard_view),
+                name="stories_storystats_dashboard",
+            ),
+        ] + super().get_urls()
+
+    def dashboard_view(self, request):
+        """Stories ordered by p95 LLM latency, with their latency histograms."""
+        bucket_labels = [f"≤{bound}s" for bound in LATENCY_BUCKETS] + [f">{LATENCY_BUCKETS[-1]}s"]
+        rows = []
+        for stats in StoryStats.objects.select_related("story"):
+            histogram = stats.llm_latency_histogram
+            rows.append(
+                dict(
+                    stats=stats,
+                    solve_rate=format_ratio(stats.solve_rate),
+                    questions_per_completion=format_ratio(stats.questions_per_completion),
+                    average_latency=format_ratio(stats.average_latency),
+                    p50_latency=stats.latency_percentile(50),
+                    p95_latency=stats.latency_percentile(95),
+                    histogram=histogram,
+                )
+            )
+        rows.sort(key=lambda row: row["p95_latency"] or 0, reverse=True)
+        context = dict(
+            self.admin_site.each_context(request),
+            title="Story stats dashboard",
+            opts=self.model._meta,
+            bucket_labels=bucket_labels,
+            rows=rows,
+        )
+        return render(request, "admin/story_stats_dashboard.html", context)
+
+
+@admin.register(LLMCall)
+class LLMCallAdmin(admin.ModelAdmin):
+    list_display = [
+        "id",
+        "created_at",
+        "kind",
+        "model",
+        "outcome",
+        "prompt_tokens",
+        "completion_tokens",
+        "time_to_first_token",
+        "duration",
+        "retries",
+        "story_completion",
+    ]
+    list_filter = ["kind", "outcome", "model"]
+    list_select_related = ["story_completion__user", "story_completion__story"]
+    raw_id_fields = ["story_completion", "agent_interaction"]
+    readonly_fields = [field.name for field in LLMCall._meta.fields]
+    # one row per LLM call, too many to be counted on every page
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def has_add_permission(self, request):
+        return False
@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class StoriesConfig(AppConfig):
     name = 'stories'
+
+    def ready(self):
+        # register signal handlers
+        from stories import signals  # noqa: F401
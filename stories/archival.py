@@ -0,0 +1,97 @@
+import asyncio
+import logging
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from dtb.settings import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE, ARCHIVE_INTERVAL
+from stories.models import (
+    AgentInteractionMessage,
+    StoryCompletion,
+    StoryCompletionArchive,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def get_completions_to_archive(older_than: timedelta, limit: int = None) -> list[int]:
+    """
+    Returns ids of the story completions that were finished before `older_than` ago
+    and still have message rows.
+    """
+    completions = (
+        StoryCompletion.objects.filter(completed_at__lt=timezone.now() - older_than)
+        .filter(
+            Exists(
+                AgentInteractionMessage.objects.filter(
+                    agent_interaction__story_completion=OuterRef("pk")
+                )
+            )
+        )
+        .order_by("completed_at")
+        .values_list("id", flat=True)
+    )
+    return list(completions[:limit] if limit is not None else completions)
+
+
+def archive_completion(completion_id: int, batch_size: int = ARCHIVE_BATCH_SIZE) -> int:
+    """
+    Packs the transcript of a finished story completion into a StoryCompletionArchive row
+    and deletes its message rows in batches. Returns the number of deleted rows.
+
+    Safe to re-run: if the archive already exists, only the leftover rows are deleted.
+    """
+    with transaction.atomic():
+        completion = StoryCompletion.objects.select_for_update().get(id=completion_id)
+        if completion.completed_at is None:
+            raise ValueError(f"Story completion {completion_id} is not finished")
+        if not StoryCompletionArchive.objects.filter(story_completion=completion).exists():
+            transcript = completion.get_transcript()
+            StoryCompletionArchive.objects.create(
+                story_completion=completion,
+                transcript=StoryCompletionArchive.pack(transcript),
+                message_count=len(transcript),
+            )
+
+    # Delete in small batches to keep the locks short
+    messages = AgentInteractionMessage.objects.filter(
+        agent_interaction__story_completion_id=completion_id
+    )
+    deleted = 0
+    while True:
+        batch = list(messages.values_list("id", flat=True)[:batch_size])
+        if not batch:
+            return deleted
+        deleted += AgentInteractionMessage.objects.filter(id__in=batch).delete()[0]
+
+
+async def archive_finished_completions(
+    older_than: timedelta = timedelta(days=ARCHIVE_AFTER_DAYS),
+    limit: int = None,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+) -> tuple[int, int]:
+    """
+    Archives the story completions finished before `older_than` ago.
+    Returns the number of archived completions and deleted message rows.
+    """
+    completion_ids = await sync_to_async(get_completions_to_archive)(older_than, limit)
+    deleted = 0
+    for completion_id in completion_ids:
+        # One completion at a time, so that the bot's queries are not blocked for long
+        deleted += await sync_to_async(archive_completion)(completion_id, batch_size)
+    if completion_ids:
+        logger.info(f"Archived {len(completion_ids)} story completions, deleted {deleted} messages")
+    return len(completion_ids), deleted
+
+
+async def run_archival(interval: float = ARCHIVE_INTERVAL):
+    """Archives finished story completions every `interval` seconds."""
+    while True:
+        try:
+            await archive_finished_completions()
+        except Exception as e:
+            logger.exception(e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,95 @@
+import logging
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional
+
+from dtb.settings import STORY_CATALOG_MAX_AGE
+from stories.models import Story, Agent
+
+logger = logging.getLogger(__name__)
+
+
+class StoryCatalog:
+    """
+    In-memory cache of all stories, their agents and objects derived from them (e.g. keyboards).
+
+    Stories change rarely, so the catalog is loaded once and reloaded on the next access
+    after the version counter is bumped. The counter is bumped by the post_save/post_delete
+    signals of Story and Agent (see stories.signals) and, as a safety net for changes made
+    by other processes, when the catalog is older than `max_age` seconds.
+
+    Args:
+        max_age (float): The number of seconds after which the catalog is reloaded anyway.
+    """
+
+    def __init__(self, max_age: float = 300.0):
+        self.max_age = max_age
+        self.version = 0
+        self._loaded_version: Optional[int] = None
+        self._loaded_at = 0.0
+        self._stories: Dict[int, Story] = {}
+        self._agents: Dict[int, Agent] = {}
+        self._agents_by_story: Dict[int, List[Agent]] = {}
+        self._derived: Dict[Hashable, Any] = {}
+
+    def invalidate(self):
+        """Marks the catalog as outdated, it is reloaded on the next access."""
+        self.version += 1
+
+    async def stories(self) -> List[Story]:
+        await self._ensure_loaded()
+        return list(self._stories.values())
+
+    async def get_story(self, story_id: int) -> Story:
+        await self._ensure_loaded()
+        try:
+            return self._stories[int(story_id)]
+        except KeyError:
+            raise Story.DoesNotExist(f"Story {story_id} does not exist")
+
+    async def get_agent(self, agent_id: int) -> Agent:
+        await self._ensure_loaded()
+        try:
+            return self._agents[int(agent_id)]
+        except KeyError:
+            raise Agent.DoesNotExist(f"Agent {agent_id} does not exist")
+
+    async def agents(self, story_id: int) -> List[Agent]:
+        await self._ensure_loaded()
+        return list(self._agents_by_story.get(int(story_id), []))
+
+    def derived(self, key: Hashable, build: Callable[[], Any]) -> Any:
+        """
+        Returns an object built from the current catalog version, building it on first use.
+        Should be called after the catalog was loaded by one of the async getters.
+        """
+        if key not in self._derived:
+            self._derived[key] = build()
+        return self._derived[key]
+
+    async def _ensure_loaded(self):
+        if time.monotonic() - self._loaded_at > self.max_age:
+            self.invalidate()
+        if self._loaded_version == self.version:
+            return
+
+        version = self.version
+        stories = {story.id: story async for story in Story.objects.order_by("id")}
+        agents = {}
+        agents_by_story = {story_id: [] for story_id in stories}
+        async for agent in Agent.objects.order_by("id"):
+            if agent.story_id not in stories:
+                # the story was added while loading, the catalog is reloaded on the next access
+                continue
+            # Share the cached story, so that agents don't fetch it again
+            agent.story = stories[agent.story_id]
+            agents[agent.id] = agent
+            agents_by_story[agent.story_id].append(agent)
+
+        self._stories, self._agents, self._agents_by_story = stories, agents, agents_by_story
+        self._derived = {}
+        self._loaded_version = version
+        self._loaded_at = time.monotonic()
+        logger.info(f"Loaded story catalog: {len(stories)} stories, {len(agents)} agents")
+
+
+story_catalog = StoryCatalog(max_age=STORY_CATALOG_MAX_AGE)
@@ -0,0 +1,109 @@
+from collections import defaultdict
+from itertools import islice
+from typing import Iterable, Iterator
+
+from django.db.models import QuerySet
+
+from stories.models import (
+    AgentInteraction,
+    AgentInteractionMessage,
+    StoryCompletion,
+    StoryCompletionArchive,
+)
+
+COMPLETION_FIELDS = (
+    "id",
+    "user_id",
+    "story_id",
+    "state",
+    "score",
+    "created_at",
+    "updated_at",
+    "completed_at",
+)
+
+
+def _chunks(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while chunk := list(islice(iterator, size)):
+        yield chunk
+
+
+def iter_completion_records(completions: QuerySet, chunk_size: int = 500) -> Iterator[dict]:
+    """
+    Yields every story completion with its agent interactions and their messages as a dict.
+
+    Completions are read with a server-side cursor and their interactions, messages and archives
+    are fetched per chunk of `chunk_size` completions, so memory does not grow with the table size.
+    Messages of archived completions are read from the archive.
+    """
+    rows = completions.order_by("id").values_list(*COMPLETION_FIELDS).iterator(chunk_size=chunk_size)
+    for chunk in _chunks(rows, chunk_size):
+        completion_ids = [row[0] for row in chunk]
+
+        interactions = defaultdict(list)
+        for interaction_id, completion_id, agent_id, agent_name in (
+            AgentInteraction.objects.filter(story_completion_id__in=completion_ids)
+            .order_by("id")
+            .values_list("id", "story_completion_id", "agent_id", "agent__name")
+        ):
+            interactions[completion_id].append(
+                dict(id=interaction_id, agent_id=agent_id, agent_name=agent_name, messages=[])
+            )
+
+        messages = defaultdict(list)
+        for interaction_id, agent_name, created_at, *content in (
+            AgentInteractionMessage.objects.filter(
+                agent_interaction__story_completion_id__in=completion_ids
+            )
+            .order_by("agent_interaction_id", "created_at", "id")
+            .values_list(
+                "agent_interaction_id",
+                "agent_interaction__agent__name",
+                "created_at",
+                *AgentInteractionMessage.CONTENT_FIELDS,
+            )
+        ):
+            role, message = AgentInteractionMessage.decode(agent_name, *content)
+            messages[interaction_id].append(dict(role=role, message=message, created_at=created_at))
+
+        archived = set()
+        for archive in StoryCompletionArchive.objects.filter(story_completion_id__in=completion_ids):
+            archived.add(archive.story_completion_id)
+            for message in archive.unpack():
+                interaction_id = message.pop("agent_interaction")
+                messages[interaction_id].append(message)
+
+        for row in chunk:
+            record = dict(zip(COMPLETION_FIELDS, row))
+            record["archived"] = record["id"] in archived
+            record["interactions"] = interactions[record["id"]]
+            for interaction in record["interactions"]:
+                interaction["messages"] = messages[interaction["id"]]
+            yield record
+
+
+def filter_completions(
+    story_ids: list[int] = None,
+    since=None,
+    until=None,
+    state: str = "all",
+) -> QuerySet:
+    """
+    Returns the story completions of the given stories, started in [since, until).
+    `state` is one of "all", "active", "finished" or "solved".
+    """
+    completions = StoryCompletion.objects.all()
+    if story_ids:
+        completions = completions.filter(story_id__in=story_ids)
+    if since is not None:
+        completions = completions.filter(created_at__gte=since)
+    if until is not None:
+        completions = completions.filter(created_at__lt=until)
+    if state == "active":
+        completions = completions.filter(completed_at__isnull=True)
+    elif state == "finished":
+        completions = completions.filter(completed_at__isnull=False)
+    elif state == "solved":
+        completions = completions.filter(completed_at__isnull=False, score=1)
+    return completions
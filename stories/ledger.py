@@ -0,0 +1,172 @@
+import asyncio
+import logging
+from contextlib import contextmanager
+from typing import Any, Dict, List
+
+from django.apps import apps
+from django.db import DatabaseError, IntegrityError, models
+from django.utils import timezone
+
+from dtb.settings import LLM_LEDGER_FLUSH_INTERVAL, LLM_LEDGER_BATCH_SIZE, LLM_LEDGER_MAX_PENDING
+from llm_helper.circuit_breaker import CircuitOpenError
+from llm_helper.usage import CallStats
+
+logger = logging.getLogger(__name__)
+
+
+class CallKind(models.IntegerChoices):
+    QUESTION = 1, "question"
+    VERDICT = 2, "verdict"
+    TRANSCRIPTION = 3, "transcription"
+
+
+class CallOutcome(models.IntegerChoices):
+    OK = 1, "ok"
+    # the answer timed out, the part received was kept
+    PARTIAL = 2, "partial"
+    TIMEOUT = 3, "timeout"
+    ERROR = 4, "error"
+    # the circuit breaker was open, the call was not sent
+    REJECTED = 5, "rejected"
+    CANCELLED = 6, "cancelled"
+
+
+def get_outcome(error: BaseException = None) -> CallOutcome:
+    if error is None:
+        return CallOutcome.OK
+    if isinstance(error, CircuitOpenError):
+        return CallOutcome.REJECTED
+    if isinstance(error, TimeoutError):
+        return CallOutcome.PARTIAL if getattr(error, "partial_answer", "") else CallOutcome.TIMEOUT
+    if isinstance(error, asyncio.CancelledError):
+        return CallOutcome.CANCELLED
+    return CallOutcome.ERROR
+
+
+class LLMCallLedger:
+    """
+    Collects the LLMCall rows of the process, written in batches by `run_llm_call_ledger`
+    so that the calls do not wait for the database.
+
+    While the database is unavailable, at most `max_pending` rows are kept, the oldest are dropped.
+    """
+
+    def __init__(
+        self,
+        batch_size: int = LLM_LEDGER_BATCH_SIZE,
+        max_pending: int = LLM_LEDGER_MAX_PENDING,
+        enabled: bool = LLM_LEDGER_FLUSH_INTERVAL > 0,
+    ):
+        if batch_size < 1:
+            raise ValueError("The LLM call ledger batch size must be at least 1")
+        self.batch_size = batch_size
+        self.max_pending = max_pending
+        self.enabled = enabled
+        # field values of the rows, the model is only loaded when writing them
+        self.pending: List[Dict[str, Any]] = []
+        self.batch_ready = asyncio.Event()
+        self.dropped = 0
+
+    def add(self, **row) -> None:
+        if not self.enabled:
+            return
+        self.pending.append(row)
+        overflow = len(self.pending) - self.max_pending
+        if overflow > 0:
+            del self.pending[:overflow]
+            self.dropped += overflow
+        if len(self.pending) >= self.batch_size:
+            self.batch_ready.set()
+
+    async def flush(self) -> int:
+        """Writes the pending rows, returns the number of written rows."""
+        LLMCall = apps.get_model("stories", "LLMCall")
+        written = 0
+        while self.pending:
+            batch, self.pending = self.pending[: self.batch_size], self.pending[self.batch_size :]
+            try:
+                await self._detach_deleted(batch)
+                await LLMCall.objects.abulk_create([LLMCall(**row) for row in batch])
+                written += len(batch)
+            except IntegrityError as e:
+                # e.g. the story completion was deleted after the check
+                logger.warning(f"Dropped {len(batch)} LLM call ledger rows: {e}")
+            except DatabaseError as e:
+                # kept for the next flush
+                logger.warning(f"Could not write {len(batch)} LLM call ledger rows: {e}")
+                self.pending = batch + self.pending
+                break
+        if self.dropped:
+            logger.warning(f"Dropped {self.dropped} LLM call ledger rows over the pending limit")
+            self.dropped = 0
+        return written
+
+    @staticmethod
+    async def _detach_deleted(batch: List[Dict[str, Any]]) -> None:
+        """Unsets the story completions and interactions deleted since the calls (e.g. expired)."""
+        for field, model_name in (
+            ("story_completion_id", "StoryCompletion"),
+            ("agent_interaction_id", "AgentInteraction"),
+        ):
+            ids = {row[field] for row in batch if row[field] is not None}
+            if not ids:
+                continue
+            model = apps.get_model("stories", model_name)
+            existing = {pk async for pk in model.objects.filter(id__in=ids).values_list("id", flat=True)}
+            for row in batch:
+                if row[field] not in existing:
+                    row[field] = None
+
+    @contextmanager
+    def record(self, kind: CallKind, story_completion_id: int = None, agent_interaction_id: int = None):
+        """
+        Records the LLM call made in the block, whatever its outcome. Pass the yielded stats
+        to the LLMHelper (or ModelRouter) method, e.g.
+
+            with llm_call_ledger.record(CallKind.VERDICT, completion.id) as stats:
+                await llm_helper.is_solved(..., stats=stats)
+        """
+        stats = CallStats()
+        created_at = timezone.now()
+        error = None
+        try:
+            yield stats
+        except BaseException as e:
+            error = e
+            raise
+        finally:
+            self.add(
+                created_at=created_at,
+                kind=kind,
+                outcome=get_outcome(error),
+                model=stats.model,
+                prompt_tokens=stats.prompt_tokens,
+                completion_tokens=stats.completion_tokens,
+                time_to_first_token=stats.time_to_first_token,
+                duration=stats.duration,
+                retries=stats.retries,
+                story_completion_id=story_completion_id,
+                agent_interaction_id=agent_interaction_id,
+            )
+
+
+# Shared by all the handlers of the process
+llm_call_ledger = LLMCallLedger()
+
+
+async def run_llm_call_ledger(interval: float = LLM_LEDGER_FLUSH_INTERVAL):
+    """Writes the pending LLM call rows every `interval` seconds, or earlier once a batch is ready."""
+    try:
+        while True:
+            try:
+                await asyncio.wait_for(llm_call_ledger.batch_ready.wait(), timeout=interval)
+            except asyncio.TimeoutError:
+                pass
+            llm_call_ledger.batch_ready.clear()
+            try:
+                await llm_call_ledger.flush()
+            except Exception as e:
+                logger.exception(e)
+    finally:
+        # the rows of the last calls are written on shutdown
+        await llm_call_ledger.flush()
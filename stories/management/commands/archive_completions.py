@@ -0,0 +1,40 @@
+import asyncio
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from dtb.settings import ARCHIVE_AFTER_DAYS, ARCHIVE_BATCH_SIZE
+from stories.archival import archive_finished_completions
+
+
+class Command(BaseCommand):
+    help = "Packs transcripts of finished story completions into compressed archives"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=float,
+            default=ARCHIVE_AFTER_DAYS,
+            help="Archive completions finished at least this many days ago",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=None, help="Maximum number of completions to archive"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=ARCHIVE_BATCH_SIZE,
+            help="Number of message rows deleted per query",
+        )
+
+    def handle(self, *args, **options):
+        archived, deleted = asyncio.run(
+            archive_finished_completions(
+                older_than=timedelta(days=options["older_than_days"]),
+                limit=options["limit"],
+                batch_size=options["batch_size"],
+            )
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f"Archived {archived} story completions, deleted {deleted} messages")
+        )
@@ -0,0 +1,44 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+
+from dtb.settings import RETENTION_BATCH_SIZE, RETENTION_IDLE_DAYS
+from stories.retention import abandoned_completions, expire_abandoned_completions
+
+
+class Command(BaseCommand):
+    help = "Deletes unfinished story completions without activity for a while"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--idle-days",
+            type=float,
+            default=RETENTION_IDLE_DAYS,
+            help="Expire completions without activity for this many days",
+        )
+        parser.add_argument(
+            "--limit", type=int, default=None, help="Maximum number of completions to expire"
+        )
+        parser.add_argument(
+            "--batch-size",
+            type=int,
+            default=RETENTION_BATCH_SIZE,
+            help="Number of completions deleted per transaction",
+        )
+        parser.add_argument(
+            "--dry-run", action="store_true", help="Only count the completions that would expire"
+        )
+
+    def handle(self, *args, **options):
+        idle_for = timedelta(days=options["idle_days"])
+        if options["dry_run"]:
+            count = abandoned_completions(idle_for).count()
+            self.stdout.write(f"{count} story completions would expire")
+            return
+
+        reclaimed, _ = expire_abandoned_completions(
+            idle_for=idle_for, limit=options["limit"], batch_size=options["batch_size"]
+        )
+        for label, count in sorted(reclaimed.items()):
+            self.stdout.write(f"{label}: {count}")
+        self.stdout.write(self.style.SUCCESS(f"Deleted {sum(reclaimed.values())} rows"))
@@ -0,0 +1,83 @@
+import gzip
+import io
+import json
+import sys
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from stories.export import filter_completions, iter_completion_records
+
+
+def parse_moment(value: str) -> datetime:
+    """Parses a date or a datetime, naive values are in the current timezone."""
+    moment = parse_datetime(value)
+    if moment is None:
+        date = parse_date(value)
+        if date is None:
+            raise CommandError(f"Invalid date: {value}")
+        moment = datetime.combine(date, time.min)
+    if timezone.is_naive(moment):
+        moment = timezone.make_aware(moment)
+    return moment
+
+
+class Command(BaseCommand):
+    help = "Streams story completions with their interactions and messages as JSON lines"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output", "-o", default="-", help="Output file, '-' for stdout (default)"
+        )
+        parser.add_argument("--gzip", action="store_true", help="Compress the output with gzip")
+        parser.add_argument(
+            "--story", type=int, action="append", dest="story_ids", help="Story id (can be repeated)"
+        )
+        parser.add_argument("--since", type=parse_moment, help="Completions started at or after this date")
+        parser.add_argument("--until", type=parse_moment, help="Completions started before this date")
+        parser.add_argument(
+            "--state",
+            choices=["all", "active", "finished", "solved"],
+            default="all",
+            help="Completion state",
+        )
+        parser.add_argument(
+            "--chunk-size", type=int, default=500, help="Number of completions fetched at once"
+        )
+
+    def handle(self, *args, **options):
+        completions = filter_completions(
+            story_ids=options["story_ids"],
+            since=options["since"],
+            until=options["until"],
+            state=options["state"],
+        )
+        records = iter_completion_records(completions, chunk_size=options["chunk_size"])
+
+        if options["output"] == "-":
+            # stdout is not closed, only the gzip stream (which writes the trailer)
+            binary = sys.stdout.buffer
+            if options["gzip"]:
+                binary = gzip.GzipFile(fileobj=binary, mode="wb")
+        elif options["gzip"]:
+            binary = gzip.open(options["output"], "wb")
+        else:
+            binary = open(options["output"], "wb")
+
+        out = io.TextIOWrapper(binary, encoding="utf-8")
+        count = 0
+        try:
+            for record in records:
+                out.write(json.dumps(record, cls=DjangoJSONEncoder, ensure_ascii=False))
+                out.write("\n")
+                count += 1
+        finally:
+            if binary is sys.stdout.buffer:
+                out.flush()
+                out.detach()
+            else:
+                out.close()
+        self.stderr.write(self.style.SUCCESS(f"Exported {count} story completions"))
@@ -0,0 +1,144 @@
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.db import migrations
+
+MESSAGE_PREFIXES = {"user": "Message to ", "assistant": "Answer from "}
+BATCH_SIZE = 500
+
+
+def _addressed_agent_name(role, message):
+    """Parses the agent name from the `Message to X:` / `Answer from X:` prefix."""
+    prefix = MESSAGE_PREFIXES.get(role)
+    if prefix is None or not message.startswith(prefix):
+        return None
+    end = message.find(":\n\n")
+    if end == -1:
+        return None
+    return message[len(prefix) : end]
+
+
+def dedupe_fanned_out_messages(apps, schema_editor):
+    """
+    Keeps a single copy of every turn: the one stored in the interaction with the questioned agent.
+
+    Messages used to be copied to every agent interaction of a story completion.
+    Copies are matched by role, text and occurrence index inside their interaction,
+    so older completions with per-agent messages are left intact.
+    """
+    StoryCompletion = apps.get_model("stories", "StoryCompletion")
+    AgentInteraction = apps.get_model("stories", "AgentInteraction")
+    AgentInteractionMessage = apps.get_model("stories", "AgentInteractionMessage")
+
+    for completion_id in StoryCompletion.objects.values_list("id", flat=True).iterator():
+        interactions = list(
+            AgentInteraction.objects.filter(story_completion_id=completion_id)
+            .order_by("id")
+            .values_list("id", "agent__name")
+        )
+        if len(interactions) < 2:
+            continue
+        owner_by_name = {}
+        for interaction_id, name in interactions:
+            owner_by_name.setdefault(name, interaction_id)
+
+        copies = defaultdict(list)
+        occurrences = defaultdict(int)
+        messages = (
+            AgentInteractionMessage.objects.filter(
+                agent_interaction__story_completion_id=completion_id
+            )
+            .exclude(role="system")
+            .order_by("id")
+            .values_list("id", "agent_interaction_id", "role", "message")
+        )
+        for message_id, interaction_id, role, message in messages:
+            occurrence = occurrences[(interaction_id, role, message)]
+            occurrences[(interaction_id, role, message)] += 1
+            copies[(role, message, occurrence)].append((interaction_id, message_id))
+
+        redundant_ids = []
+        for (role, message, _), turn_copies in copies.items():
+            owner = owner_by_name.get(_addressed_agent_name(role, message))
+            if owner not in {interaction_id for interaction_id, _ in turn_copies}:
+                owner = min(interaction_id for interaction_id, _ in turn_copies)
+            redundant_ids.extend(
+                message_id
+                for interaction_id, message_id in turn_copies
+                if interaction_id != owner
+            )
+
+        for i in range(0, len(redundant_ids), BATCH_SIZE):
+            AgentInteractionMessage.objects.filter(
+                id__in=redundant_ids[i : i + BATCH_SIZE]
+            ).delete()
+
+
+@contextmanager
+def _keep_created_at(model):
+    """Lets bulk_create store the given creation times instead of the current time."""
+    field = model._meta.get_field("created_at")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def fan_out_messages(apps, schema_editor):
+    """
+    Copies every turn back to all agent interactions of its story completion.
+
+    The messages of a completion are written again in the order of the transcript, with their
+    creation time, so that every interaction reads its system message and turns in order by id too.
+    """
+    AgentInteraction = apps.get_model("stories", "AgentInteraction")
+    AgentInteractionMessage = apps.get_model("stories", "AgentInteractionMessage")
+
+    interactions_by_completion = defaultdict(list)
+    for interaction_id, completion_id in (
+        AgentInteraction.objects.order_by("id").values_list("id", "story_completion_id").iterator()
+    ):
+        interactions_by_completion[completion_id].append(interaction_id)
+
+    def write(batch, old_ids):
+        for i in range(0, len(old_ids), BATCH_SIZE):
+            AgentInteractionMessage.objects.filter(id__in=old_ids[i : i + BATCH_SIZE]).delete()
+        AgentInteractionMessage.objects.bulk_create(batch, batch_size=BATCH_SIZE)
+
+    batch, old_ids = [], []
+    with _keep_created_at(AgentInteractionMessage):
+        for completion_id, interaction_ids in interactions_by_completion.items():
+            messages = (
+                AgentInteractionMessage.objects.filter(
+                    agent_interaction__story_completion_id=completion_id
+                )
+                .order_by("created_at", "id")
+                .values_list("id", "agent_interaction_id", "role", "message", "created_at")
+            )
+            for message_id, interaction_id, role, message, created_at in messages:
+                old_ids.append(message_id)
+                batch.extend(
+                    AgentInteractionMessage(
+                        agent_interaction_id=target_id,
+                        role=role,
+                        message=message,
+                        created_at=created_at,
+                    )
+                    # system messages belong to their interaction only
+                    for target_id in ([interaction_id] if role == "system" else interaction_ids)
+                )
+            if len(batch) >= BATCH_SIZE:
+                write(batch, old_ids)
+                batch, old_ids = [], []
+        write(batch, old_ids)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stories", "0004_rename_solution_story_extensive_solution_and_more"),
+    ]
+
+    operations = [
+        migrations.RunPython(dedupe_fanned_out_messages, fan_out_messages),
+    ]
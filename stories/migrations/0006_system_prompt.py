@@ -0,0 +1,29 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:10
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0005_dedupe_fanned_out_messages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SystemPrompt',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('digest', models.CharField(max_length=64, unique=True)),
+                ('text', models.TextField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('story', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='stories.story')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='agentinteraction',
+            name='system_prompt',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='stories.systemprompt'),
+        ),
+    ]
@@ -0,0 +1,103 @@
+import hashlib
+from collections import defaultdict
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.db import migrations
+from django.db.models import Min
+
+BATCH_SIZE = 500
+
+
+def move_system_messages_to_prompts(apps, schema_editor):
+    """Replaces per-interaction system messages with references to deduplicated SystemPrompt rows."""
+    AgentInteraction = apps.get_model("stories", "AgentInteraction")
+    AgentInteractionMessage = apps.get_model("stories", "AgentInteractionMessage")
+    SystemPrompt = apps.get_model("stories", "SystemPrompt")
+
+    prompt_ids = {}
+    # interactions to point at each prompt, updated with one UPDATE per prompt and batch
+    interaction_ids = defaultdict(list)
+    messages = AgentInteractionMessage.objects.filter(role="system").values_list(
+        "id",
+        "agent_interaction_id",
+        "agent_interaction__story_completion__story_id",
+        "message",
+    )
+    message_ids = []
+    for message_id, interaction_id, story_id, text in messages.iterator():
+        digest = hashlib.sha256(text.encode("utf-8")).hexdigest()
+        if digest not in prompt_ids:
+            prompt, _ = SystemPrompt.objects.get_or_create(
+                digest=digest, defaults=dict(story_id=story_id, text=text)
+            )
+            prompt_ids[digest] = prompt.id
+        interaction_ids[prompt_ids[digest]].append(interaction_id)
+        message_ids.append(message_id)
+
+    for prompt_id, ids in interaction_ids.items():
+        for i in range(0, len(ids), BATCH_SIZE):
+            AgentInteraction.objects.filter(id__in=ids[i : i + BATCH_SIZE]).update(
+                system_prompt_id=prompt_id
+            )
+
+    for i in range(0, len(message_ids), BATCH_SIZE):
+        AgentInteractionMessage.objects.filter(
+            id__in=message_ids[i : i + BATCH_SIZE]
+        ).delete()
+
+
+@contextmanager
+def _keep_created_at(model):
+    """Lets bulk_create store the given creation times instead of the current time."""
+    field = model._meta.get_field("created_at")
+    field.auto_now_add = False
+    try:
+        yield
+    finally:
+        field.auto_now_add = True
+
+
+def move_prompts_to_system_messages(apps, schema_editor):
+    """
+    Copies the referenced system prompt back into every agent interaction, dated just before
+    the first turn of its story completion, so that it is read before the turns.
+    """
+    AgentInteraction = apps.get_model("stories", "AgentInteraction")
+    AgentInteractionMessage = apps.get_model("stories", "AgentInteractionMessage")
+
+    first_turns = dict(
+        AgentInteractionMessage.objects.values_list("agent_interaction__story_completion_id")
+        .annotate(first_turn=Min("created_at"))
+        .order_by()
+    )
+    interactions = AgentInteraction.objects.filter(system_prompt__isnull=False).values_list(
+        "id", "story_completion_id", "story_completion__created_at", "system_prompt__text"
+    )
+    batch = []
+    with _keep_created_at(AgentInteractionMessage):
+        for interaction_id, completion_id, started_at, text in interactions.iterator():
+            batch.append(
+                AgentInteractionMessage(
+                    agent_interaction_id=interaction_id,
+                    message=text,
+                    role="system",
+                    created_at=first_turns.get(completion_id, started_at) - timedelta(microseconds=1),
+                )
+            )
+            if len(batch) >= BATCH_SIZE:
+                AgentInteractionMessage.objects.bulk_create(batch)
+                batch = []
+        AgentInteractionMessage.objects.bulk_create(batch)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stories", "0006_system_prompt"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            move_system_messages_to_prompts, move_prompts_to_system_messages
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def copy_system_prompt_from_interactions(apps, schema_editor):
+    StoryCompletion = apps.get_model("stories", "StoryCompletion")
+    AgentInteraction = apps.get_model("stories", "AgentInteraction")
+    StoryCompletion.objects.update(
+        system_prompt_id=models.Subquery(
+            AgentInteraction.objects.filter(
+                story_completion_id=models.OuterRef("id"), system_prompt__isnull=False
+            ).values("system_prompt_id")[:1]
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0007_move_system_messages_to_prompts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='storycompletion',
+            name='system_prompt',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='stories.systemprompt'),
+        ),
+        migrations.RunPython(copy_system_prompt_from_interactions, migrations.RunPython.noop),
+    ]
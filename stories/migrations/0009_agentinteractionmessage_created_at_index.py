@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0008_storycompletion_system_prompt'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='agentinteractionmessage',
+            index=models.Index(fields=['agent_interaction', 'created_at'], name='stories_age_agent_i_5001a4_idx'),
+        ),
+    ]
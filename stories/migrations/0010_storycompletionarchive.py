@@ -0,0 +1,23 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:15
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0009_agentinteractionmessage_created_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryCompletionArchive',
+            fields=[
+                ('story_completion', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='archive', serialize=False, to='stories.storycompletion')),
+                ('transcript', models.BinaryField()),
+                ('message_count', models.IntegerField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
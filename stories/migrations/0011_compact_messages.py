@@ -0,0 +1,168 @@
+import zlib
+
+from django.db import migrations, models
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+ROLES = {"user": 1, "assistant": 2}
+PREFIXES = {1: "Message to ", 2: "Answer from "}
+COMPRESSION_THRESHOLD = 1024
+BATCH_SIZE = 500
+
+# A frozen copy of utils.compression: the first byte of a payload identifies the codec
+ZLIB, ZSTD = b"z", b"s"
+
+
+def compress_text(text):
+    return ZLIB + zlib.compress(text.encode("utf-8"))
+
+
+def decompress_text(payload):
+    payload = bytes(payload)
+    header, data = payload[:1], payload[1:]
+    if header == ZLIB:
+        return zlib.decompress(data).decode("utf-8")
+    if header == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed data")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    raise ValueError(f"Unknown compression header: {header!r}")
+
+
+def _strip_prefix(role, message):
+    """
+    Drops the `Message to X:` / `Answer from X:` prefix, it is rendered from the agent name.
+    X is not checked against the agent of the owning interaction, see expand_messages.
+    """
+    prefix = PREFIXES.get(role)
+    end = message.find(":\n\n")
+    if prefix is None or not message.startswith(prefix) or end == -1:
+        return message
+    body = message[end + 3 :]
+    return body[1:] if body.startswith(" ") else body
+
+
+def _render(role, agent_name, body):
+    return f"{PREFIXES[role]}{agent_name}:\n\n {body}"
+
+
+def _update_in_batches(model, rows, fields):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            model.objects.bulk_update(batch, fields)
+            batch = []
+    model.objects.bulk_update(batch, fields)
+
+
+def compact_messages(apps, schema_editor):
+    AgentInteractionMessage = apps.get_model("stories", "AgentInteractionMessage")
+
+    def compacted():
+        for message_id, role, message in (
+            AgentInteractionMessage.objects.values_list("id", "role", "message").iterator()
+        ):
+            role_code = ROLES[role]
+            body = _strip_prefix(role_code, message)
+            compressed_message = None
+            if len(body.encode("utf-8")) >= COMPRESSION_THRESHOLD:
+                body, compressed_message = "", compress_text(body)
+            yield AgentInteractionMessage(
+                id=message_id,
+                role_code=role_code,
+                message=body,
+                compressed_message=compressed_message,
+            )
+
+    _update_in_batches(
+        AgentInteractionMessage,
+        compacted(),
+        ["role_code", "message", "compressed_message"],
+    )
+
+
+def expand_messages(apps, schema_editor):
+    """
+    Renders the prefix back into the message, from the agent of the owning interaction.
+
+    Irreversible for messages whose prefix named another agent, e.g. the per-agent copies of
+    completions older than the shared transcript that 0005 left in place: compact_messages
+    dropped that name, so they are restored with the name of the owning agent.
+    """
+    AgentInteractionMessage = apps.get_model("stories", "AgentInteractionMessage")
+    role_names = {code: role for role, code in ROLES.items()}
+
+    def expanded():
+        for message_id, role_code, message, compressed_message, agent_name in (
+            AgentInteractionMessage.objects.values_list(
+                "id",
+                "role_code",
+                "message",
+                "compressed_message",
+                "agent_interaction__agent__name",
+            ).iterator()
+        ):
+            if compressed_message is not None:
+                message = decompress_text(compressed_message)
+            yield AgentInteractionMessage(
+                id=message_id,
+                role=role_names[role_code],
+                message=_render(role_code, agent_name, message),
+                compressed_message=None,
+            )
+
+    _update_in_batches(
+        AgentInteractionMessage, expanded(), ["role", "message", "compressed_message"]
+    )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stories", "0010_storycompletionarchive"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="agentinteractionmessage",
+            name="compressed_message",
+            field=models.BinaryField(editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name="agentinteractionmessage",
+            name="message",
+            field=models.TextField(blank=True),
+        ),
+        migrations.AddField(
+            model_name="agentinteractionmessage",
+            name="role_code",
+            field=models.PositiveSmallIntegerField(null=True),
+        ),
+        # nullable, so that the column can be restored before the data when migrating backwards
+        migrations.AlterField(
+            model_name="agentinteractionmessage",
+            name="role",
+            field=models.CharField(max_length=16, null=True),
+        ),
+        # lossy backwards for messages whose prefix named another agent, see expand_messages
+        migrations.RunPython(compact_messages, expand_messages),
+        migrations.RemoveField(
+            model_name="agentinteractionmessage",
+            name="role",
+        ),
+        migrations.RenameField(
+            model_name="agentinteractionmessage",
+            old_name="role_code",
+            new_name="role",
+        ),
+        migrations.AlterField(
+            model_name="agentinteractionmessage",
+            name="role",
+            field=models.PositiveSmallIntegerField(
+                choices=[(1, "user"), (2, "assistant")]
+            ),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:19
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0011_compact_messages'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoryStats',
+            fields=[
+                ('story', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='stories.story')),
+                ('started', models.IntegerField(default=0)),
+                ('questions', models.IntegerField(default=0)),
+                ('failed_questions', models.IntegerField(default=0)),
+                ('verdicts', models.IntegerField(default=0)),
+                ('solved', models.IntegerField(default=0)),
+                ('quits', models.IntegerField(default=0)),
+                ('llm_calls', models.IntegerField(default=0)),
+                ('llm_latency_total', models.FloatField(default=0)),
+                ('llm_latency_histogram', models.JSONField(default=list)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'story stats',
+            },
+        ),
+    ]
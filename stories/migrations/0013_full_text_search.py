@@ -0,0 +1,68 @@
+from django.db import migrations
+
+CONFIG = "english"
+
+# model name -> searched fields, see stories/search.py
+SEARCHED = {
+    "story": ("title", "prelude"),
+    "agent": ("name", "background", "hidden", "alibi", "character", "relationships", "knowledge"),
+    "agentinteractionmessage": ("message",),
+}
+
+
+def _gin_index(model_name, fields):
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    return GinIndex(SearchVector(*fields, config=CONFIG), name=f"{model_name[:20]}_search_gin")
+
+
+def _fts_statements(table, fields):
+    fts = f"{table}_fts"
+    columns = ", ".join(fields)
+    new_values = ", ".join(f"new.{field}" for field in fields)
+    old_values = ", ".join(f"old.{field}" for field in fields)
+    delete = f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values});"
+    insert = f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='{table}', "
+        f"content_rowid='id', tokenize='porter unicode61')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN {delete} {insert} END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for model_name, fields in SEARCHED.items():
+        model = apps.get_model("stories", model_name)
+        if vendor == "postgresql":
+            schema_editor.add_index(model, _gin_index(model_name, fields))
+        elif vendor == "sqlite":
+            for statement in _fts_statements(model._meta.db_table, fields):
+                schema_editor.execute(statement)
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for model_name, fields in SEARCHED.items():
+        model = apps.get_model("stories", model_name)
+        if vendor == "postgresql":
+            schema_editor.remove_index(model, _gin_index(model_name, fields))
+        elif vendor == "sqlite":
+            fts = f"{model._meta.db_table}_fts"
+            for suffix in ("ai", "ad", "au"):
+                schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+            schema_editor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stories", "0012_storystats"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
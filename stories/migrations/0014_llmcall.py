@@ -0,0 +1,35 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:42
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0013_full_text_search'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LLMCall',
+            fields=[
+                ('id', models.AutoField(primary_key=True, serialize=False)),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now)),
+                ('kind', models.PositiveSmallIntegerField(choices=[(1, 'question'), (2, 'verdict'), (3, 'transcription')])),
+                ('outcome', models.PositiveSmallIntegerField(choices=[(1, 'ok'), (2, 'partial'), (3, 'timeout'), (4, 'error'), (5, 'rejected'), (6, 'cancelled')])),
+                ('model', models.CharField(blank=True, max_length=64)),
+                ('prompt_tokens', models.PositiveIntegerField(default=0)),
+                ('completion_tokens', models.PositiveIntegerField(default=0)),
+                ('time_to_first_token', models.FloatField(blank=True, null=True)),
+                ('duration', models.FloatField()),
+                ('retries', models.PositiveSmallIntegerField(default=0)),
+                ('agent_interaction', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='stories.agentinteraction')),
+                ('story_completion', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='stories.storycompletion')),
+            ],
+            options={
+                'verbose_name': 'LLM call',
+            },
+        ),
+    ]
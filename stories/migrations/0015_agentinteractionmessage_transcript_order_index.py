@@ -0,0 +1,21 @@
+# Generated by Django 4.2.7 on 2026-10-17 20:49
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0014_llmcall'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='agentinteractionmessage',
+            name='stories_age_agent_i_5001a4_idx',
+        ),
+        migrations.AddIndex(
+            model_name='agentinteractionmessage',
+            index=models.Index(fields=['agent_interaction', 'created_at', 'id'], name='stories_age_agent_i_026efe_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+from django.db import migrations, models
+
+# A frozen copy of stories.models.LATENCY_BUCKET_FIELDS
+BUCKET_FIELDS = (
+    "llm_latency_le_1s",
+    "llm_latency_le_2s",
+    "llm_latency_le_5s",
+    "llm_latency_le_10s",
+    "llm_latency_le_20s",
+    "llm_latency_le_30s",
+    "llm_latency_le_60s",
+    "llm_latency_gt_60s",
+)
+
+
+def split_histograms(apps, schema_editor):
+    StoryStats = apps.get_model("stories", "StoryStats")
+    stats = list(StoryStats.objects.all())
+    for row in stats:
+        histogram = row.llm_latency_histogram or [0] * len(BUCKET_FIELDS)
+        for field, count in zip(BUCKET_FIELDS, histogram):
+            setattr(row, field, count)
+    StoryStats.objects.bulk_update(stats, BUCKET_FIELDS, batch_size=500)
+
+
+def join_histograms(apps, schema_editor):
+    StoryStats = apps.get_model("stories", "StoryStats")
+    stats = list(StoryStats.objects.all())
+    for row in stats:
+        row.llm_latency_histogram = [getattr(row, field) for field in BUCKET_FIELDS]
+    StoryStats.objects.bulk_update(stats, ["llm_latency_histogram"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stories", "0015_agentinteractionmessage_transcript_order_index"),
+    ]
+
+    operations = [
+        *[
+            migrations.AddField(
+                model_name="storystats",
+                name=field,
+                field=models.IntegerField(default=0),
+            )
+            for field in BUCKET_FIELDS
+        ],
+        migrations.RunPython(split_histograms, join_histograms),
+        migrations.RemoveField(
+            model_name="storystats",
+            name="llm_latency_histogram",
+        ),
+    ]
@@ -0,0 +1,133 @@
+import re
+import zlib
+
+from django.db import migrations, models
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+CONFIG = "english"
+MODEL_NAME = "agentinteractionmessage"
+OLD_FIELDS = ("message",)
+NEW_FIELDS = ("message", "search_words")
+BATCH_SIZE = 500
+
+
+# Frozen copies of utils.compression.decompress_text and stories.models.get_search_words
+def decompress_text(payload):
+    payload = bytes(payload)
+    header, data = payload[:1], payload[1:]
+    if header == b"z":
+        return zlib.decompress(data).decode("utf-8")
+    if header == b"s":
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed data")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    raise ValueError(f"Unknown compression header: {header!r}")
+
+
+def get_search_words(body):
+    return " ".join(dict.fromkeys(re.findall(r"\w+", body.lower())))
+
+
+# Frozen copies of the helpers of 0013_full_text_search
+def _gin_index(fields):
+    from django.contrib.postgres.indexes import GinIndex
+    from django.contrib.postgres.search import SearchVector
+
+    return GinIndex(SearchVector(*fields, config=CONFIG), name=f"{MODEL_NAME[:20]}_search_gin")
+
+
+def _fts_statements(table, fields):
+    fts = f"{table}_fts"
+    columns = ", ".join(fields)
+    new_values = ", ".join(f"new.{field}" for field in fields)
+    old_values = ", ".join(f"old.{field}" for field in fields)
+    delete = f"INSERT INTO {fts}({fts}, rowid, {columns}) VALUES ('delete', old.id, {old_values});"
+    insert = f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values});"
+    return [
+        f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, content='{table}', "
+        f"content_rowid='id', tokenize='porter unicode61')",
+        f"CREATE TRIGGER {fts}_ai AFTER INSERT ON {table} BEGIN {insert} END",
+        f"CREATE TRIGGER {fts}_ad AFTER DELETE ON {table} BEGIN {delete} END",
+        f"CREATE TRIGGER {fts}_au AFTER UPDATE ON {table} BEGIN {delete} {insert} END",
+        f"INSERT INTO {fts}({fts}) VALUES ('rebuild')",
+    ]
+
+
+def _create_search_index(apps, schema_editor, fields):
+    model = apps.get_model("stories", MODEL_NAME)
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.add_index(model, _gin_index(fields))
+    elif vendor == "sqlite":
+        for statement in _fts_statements(model._meta.db_table, fields):
+            schema_editor.execute(statement)
+
+
+def _drop_search_index(apps, schema_editor, fields):
+    model = apps.get_model("stories", MODEL_NAME)
+    vendor = schema_editor.connection.vendor
+    if vendor == "postgresql":
+        schema_editor.remove_index(model, _gin_index(fields))
+    elif vendor == "sqlite":
+        fts = f"{model._meta.db_table}_fts"
+        for suffix in ("ai", "ad", "au"):
+            schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+        schema_editor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+def drop_old_search_index(apps, schema_editor):
+    _drop_search_index(apps, schema_editor, OLD_FIELDS)
+
+
+def create_old_search_index(apps, schema_editor):
+    _create_search_index(apps, schema_editor, OLD_FIELDS)
+
+
+def create_new_search_index(apps, schema_editor):
+    _create_search_index(apps, schema_editor, NEW_FIELDS)
+
+
+def drop_new_search_index(apps, schema_editor):
+    _drop_search_index(apps, schema_editor, NEW_FIELDS)
+
+
+def fill_search_words(apps, schema_editor):
+    AgentInteractionMessage = apps.get_model("stories", MODEL_NAME)
+    batch = []
+    for message_id, compressed_message in (
+        AgentInteractionMessage.objects.filter(compressed_message__isnull=False)
+        .values_list("id", "compressed_message")
+        .iterator()
+    ):
+        batch.append(
+            AgentInteractionMessage(
+                id=message_id, search_words=get_search_words(decompress_text(compressed_message))
+            )
+        )
+        if len(batch) >= BATCH_SIZE:
+            AgentInteractionMessage.objects.bulk_update(batch, ["search_words"])
+            batch = []
+    AgentInteractionMessage.objects.bulk_update(batch, ["search_words"])
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("stories", "0016_storystats_latency_buckets"),
+    ]
+
+    # On SQLite adding (and removing) the column rebuilds the table, which drops the FTS triggers:
+    # the search index is dropped first and created again once the column is filled.
+    operations = [
+        migrations.RunPython(drop_old_search_index, create_old_search_index),
+        migrations.AddField(
+            model_name=MODEL_NAME,
+            name="search_words",
+            field=models.TextField(blank=True, editable=False),
+        ),
+        migrations.RunPython(fill_search_words, migrations.RunPython.noop),
+        migrations.RunPython(create_new_search_index, drop_new_search_index),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-17 21:11
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('stories', '0017_agentinteractionmessage_search_words'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='agentinteraction',
+            name='system_prompt',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.RESTRICT, to='stories.systemprompt'),
+        ),
+        migrations.AlterField(
+            model_name='storycompletion',
+            name='system_prompt',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.RESTRICT, to='stories.systemprompt'),
+        ),
+    ]
@@ -1,15 +1,33 @@
 from __future__ import annotations
 
-import asyncio
+import bisect
+import hashlib
+import json
 import logging
-from typing import Callable, Coroutine, Any, Tuple
+import re
+import time
+import zlib
+from datetime import datetime
+from typing import Callable, Coroutine, Any, Tuple, Optional, Union
 from os import linesep
 
-from django.db import models
+from asgiref.sync import sync_to_async
+from django.db import IntegrityError, models, transaction
+from django.db.models import F
 from django.utils import timezone
 
+from dtb.settings import (
+    LAZY_AGENT_INTERACTIONS,
+    TRANSCRIPT_COMPRESSION_CODEC,
+    TRANSCRIPT_COMPRESSION_THRESHOLD,
+)
 from llm_helper.chat import LLMHelper
+from llm_helper.router import ModelRouter
+from llm_helper.stream import StreamTimeout
+from stories.ledger import CallKind, CallOutcome, llm_call_ledger
+from stories.transcript_cache import transcript_cache
 from users.models import User
+from utils.compression import compress_text, decompress_text
 
 logger = logging.getLogger(__name__)
 
@@ -199,16 +217,55 @@ class Agent(models.Model):
         return f"{self.name} @ {self.story.title} ({self.id})"
 
 
+class SystemPrompt(models.Model):
+    """
+    A system prompt given to the agents of a story.
+
+    Prompts are content-addressed: a story version always renders the same text,
+    which is stored once and referenced from every agent interaction that uses it.
+    """
+
+    id = models.AutoField(primary_key=True)
+    story = models.ForeignKey(Story, on_delete=models.CASCADE)
+    digest = models.CharField(max_length=64, unique=True)  # sha256 of the text
+    text = models.TextField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.story.title} - {self.digest[:12]} ({self.id})"
+
+    @staticmethod
+    def get_digest(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    @classmethod
+    def get_or_create_for_text(cls, story: Story, text: str) -> SystemPrompt:
+        """
+        Returns the stored prompt with the given text, creating it on first use.
+        Must be called in a transaction: the row is locked, so that it is not pruned
+        as an orphan (see stories.retention) before it is referenced.
+        """
+        prompt, _ = cls.objects.select_for_update().get_or_create(
+            digest=cls.get_digest(text), defaults=dict(story=story, text=text)
+        )
+        return prompt
+
+
 class StoryCompletion(models.Model):
     """
     Represents a story progress of a user. The state is a string that contains the current state of the story.
-    Messages are stored in the AgentInteractionMessage model.
+    Messages are stored in the AgentInteractionMessage model: every turn is stored once, in the interaction
+    with the questioned agent, and the transcript is shared by all agents of the completion.
     """
 
     id = models.AutoField(primary_key=True)
     user = models.ForeignKey("users.User", on_delete=models.CASCADE)
     story = models.ForeignKey(Story, on_delete=models.CASCADE)
     state = models.TextField()
+    # prompt for the agent interactions, that can be created lazily; prompts are shared between
+    # completions, so a referenced prompt is only deleted along with its story
+    system_prompt = models.ForeignKey(SystemPrompt, on_delete=models.RESTRICT, null=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
@@ -220,47 +277,76 @@ class StoryCompletion(models.Model):
         return f"{self.user.username} - {self.story.title} ({self.id})"
 
     @classmethod
-    async def start_story(cls, user: User, story: Story) -> StoryCompletion:
+    async def start_story(
+        cls,
+        user: User,
+        story: Story,
+        agents: Optional[list[Agent]] = None,
+        lazy_interactions: bool = LAZY_AGENT_INTERACTIONS,
+    ) -> StoryCompletion:
         """
         Start a story for the given user. Returns the StoryCompletion object.
+
+        Agents are fetched once and all rows are created in a single transaction,
+        so the number of queries does not depend on the number of agents.
+        :param agents: The agents of the story, if they are already known (e.g. from the story catalog).
+        :param lazy_interactions: If set, an agent interaction is created on the first question to the agent.
         """
-        story_completion = await cls.objects.acreate(user=user, story=story, state="")
+        if agents is None:
+            agents = [agent async for agent in story.agents()]
 
-        names = [agent.name async for agent in story.agents()]
+        names = [agent.name for agent in agents]
 
-        descriptions = [agent.get_system_prompt_description() async for agent in story.agents()
+        descriptions = [agent.get_system_prompt_description() for agent in agents
                         if agent.agent_type != ENVIRONMENT]
 
         system_prompt = get_system_prompt(story.extensive_solution, names, descriptions)
 
-        print(system_prompt)
+        logger.debug(system_prompt)
 
-        # add agent interactions
-        async for agent in story.agents():
-            agent_interaction = await AgentInteraction.objects.acreate(
-                story_completion=story_completion, agent=agent
-            )
-            # add system prompt initial message
+        story_completion = await sync_to_async(cls._create_with_interactions)(
+            user, story, [] if lazy_interactions else agents, system_prompt
+        )
+        await StoryStats.arecord(story.id, started=1)
+        return story_completion
 
-            await AgentInteractionMessage.objects.acreate(
-                agent_interaction=agent_interaction,
-                message=system_prompt,
-                role="system",
-            )
+    @classmethod
+    @transaction.atomic
+    def _create_with_interactions(
+        cls, user: User, story: Story, agents: list[Agent], system_prompt_text: str
+    ) -> StoryCompletion:
+        # the prompt is stored once per story version, interactions only reference it
+        system_prompt = SystemPrompt.get_or_create_for_text(story, system_prompt_text)
+
+        story_completion = cls.objects.create(
+            user=user, story=story, state="", system_prompt=system_prompt
+        )
+
+        # add agent interactions
+        AgentInteraction.objects.bulk_create(
+            [
+                AgentInteraction(
+                    story_completion=story_completion,
+                    agent=agent,
+                    system_prompt=system_prompt,
+                )
+                for agent in agents
+            ]
+        )
         return story_completion
 
     async def question_agent(
         self,
         agent: Agent,
         message: str,
-        llm_helper: LLMHelper,
+        llm_helper: Union[LLMHelper, ModelRouter],
         message_callback: Callable[[str], Coroutine[Any, Any, None]] = None,
     ) -> str:
         """
         Question the given agent with the given message. Returns the agent's answer.
         :param agent: The agent to question.
         :param message: The message to send to the agent.
-        :param llm_helper: LLM service to use.
+        :param llm_helper: LLM service to use (an LLMHelper or a ModelRouter).
         :param message_callback: The callback function to call when the agent answer updates.
         :return: The agent's answer.
         """
@@ -268,11 +354,15 @@ class StoryCompletion(models.Model):
         logger.info(f"Questioning agent {agent.name} with message: {message}")
 
         # Get the agent interaction object to add the message to
-        agent_interaction = await AgentInteraction.objects.aget(
-            story_completion=self, agent=agent
+        #  (it is created here on the first question if the story was started lazily).
+        #  The system prompt is only read on a miss of the transcript cache.
+        agent_interaction, _ = await AgentInteraction.objects.aget_or_create(
+            story_completion=self,
+            agent=agent,
+            defaults=dict(system_prompt_id=self.system_prompt_id),
         )
 
-        full_message = f"Message to {agent.name}:\n\n {message}"
+        full_message = render_message(AgentInteractionMessage.Role.USER, agent.name, message)
 
         # Craft messages for LLM
         #  We add the user's message to the messages list,
@@ -283,28 +373,50 @@ class StoryCompletion(models.Model):
         ]
 
         # Get the agent's answer from the LLM
-        # Wait for the answer for 60 seconds
-        answer = await asyncio.wait_for(
-            llm_helper.chat_complete(
-                messages=messages,
-                message_callback=message_callback,
-            ),
-            timeout=60,
+        #  (the helper gives up on a late first token, a stalled stream or a too long answer)
+        started_at = time.monotonic()
+        # a ModelRouter picks the model by the type of the agent
+        routing = dict(agent_type=agent.agent_type) if isinstance(llm_helper, ModelRouter) else {}
+        try:
+            with llm_call_ledger.record(CallKind.QUESTION, self.id, agent_interaction.id) as stats:
+                answer = await llm_helper.chat_complete(
+                    messages=messages,
+                    message_callback=message_callback,
+                    stats=stats,
+                    **routing,
+                )
+        except StreamTimeout as e:
+            # the part of the answer the user has already seen is kept
+            if not e.partial_answer:
+                await StoryStats.arecord(self.story_id, failed_questions=1)
+                raise
+            logger.warning(f"Keeping the partial answer of {agent.name}: {e}")
+            answer = e.partial_answer
+        except Exception:
+            await StoryStats.arecord(self.story_id, failed_questions=1)
+            raise
+        await StoryStats.arecord(
+            self.story_id, questions=1, latency=time.monotonic() - started_at
         )
 
-        # If the answer is received, add the message and the answer to the database
-
-        async for ai in AgentInteraction.objects.filter(story_completion=self):
-            await AgentInteractionMessage.objects.acreate(
-                agent_interaction=ai,
-                message=f"Message to {agent.name}:\n\n {message}",
-                role="user",
-            )
-            await AgentInteractionMessage.objects.acreate(
-                agent_interaction=ai,
-                message=f"Answer from {agent.name}:\n\n {answer}",
-                role="assistant",
-            )
+        # If the answer is received, add the message and the answer to the database.
+        #  The turn is stored once, in the questioned agent's interaction: the transcript
+        #  is shared by all agents (see AgentInteraction.get_openai_object).
+        #  bulk_create writes both rows with a single INSERT inside a transaction.
+        turn = await AgentInteractionMessage.objects.abulk_create(
+            [
+                AgentInteractionMessage.build(
+                    agent_interaction, AgentInteractionMessage.Role.USER, message
+                ),
+                AgentInteractionMessage.build(
+                    agent_interaction, AgentInteractionMessage.Role.ASSISTANT, answer
+                ),
+            ]
+        )
+        # Keep the cached conversations of this completion up to date
+        transcript_cache.append(
+            self.id, [message.get_openai_object(agent.name) for message in turn]
+        )
 
         return answer
 
@@ -314,6 +426,8 @@ class StoryCompletion(models.Model):
         self.completed_at = timezone.now()
         self.score = 0
         await self.asave()
+        transcript_cache.discard_completion(self.id)
+        await StoryStats.arecord(self.story_id, quits=1)
 
     async def complete(
         self, prediction: str, solution: str, prelude: str, llm_helper: LLMHelper
@@ -333,7 +447,12 @@ class StoryCompletion(models.Model):
                 - hint (str): A hint or feedback related to the completion.
         """
         self.check_completed()
-        score_person, score_motive, score_way, hint = await llm_helper.is_solved(prediction, solution, prelude)
+        started_at = time.monotonic()
+        with llm_call_ledger.record(CallKind.VERDICT, self.id) as stats:
+            score_person, score_motive, score_way, hint = await llm_helper.is_solved(
+                prediction, solution, prelude, stats=stats
+            )
+        latency = time.monotonic() - started_at
         is_solved = score_person and score_motive and score_way
         if is_solved:
             self.score = 1
@@ -341,12 +460,42 @@ class StoryCompletion(models.Model):
         else:
             self.score = 0
         await self.asave()
+        if is_solved:
+            transcript_cache.discard_completion(self.id)
+        await StoryStats.arecord(self.story_id, verdicts=1, solved=int(is_solved), latency=latency)
         return is_solved, score_person, score_motive, score_way, hint
 
     def check_completed(self):
         if self.completed_at is not None:
             raise Exception("Story completion is already completed.")
 
+    def get_transcript(self) -> list[dict]:
+        """
+        Returns the transcript shared by the agents, read from the archive if the completion was archived.
+        Messages are dicts with the TRANSCRIPT_FIELDS keys.
+        """
+        try:
+            return self.archive.unpack()
+        except StoryCompletionArchive.DoesNotExist:
+            pass
+        messages = (
+            AgentInteractionMessage.objects.filter(agent_interaction__story_completion=self)
+            .order_by("created_at", "id")
+            .values_list(
+                "agent_interaction",
+                "agent_interaction__agent__name",
+                "created_at",
+                *AgentInteractionMessage.CONTENT_FIELDS,
+            )
+        )
+        transcript = []
+        for interaction_id, agent_name, created_at, *content in messages:
+            role, message = AgentInteractionMessage.decode(agent_name, *content)
+            transcript.append(
+                dict(agent_interaction=interaction_id, role=role, message=message, created_at=created_at)
+            )
+        return transcript
+
 
 class AgentInteraction(models.Model):
     """
@@ -358,29 +507,303 @@ class AgentInteraction(models.Model):
     id = models.AutoField(primary_key=True)
     story_completion = models.ForeignKey(StoryCompletion, on_delete=models.CASCADE)
     agent = models.ForeignKey(Agent, on_delete=models.CASCADE)
+    system_prompt = models.ForeignKey(SystemPrompt, on_delete=models.RESTRICT, null=True)
 
     def __str__(self):
-        return f"{self.agent.name} @ {self.agent.story.title} with {self.story_completion.user.username} - {self.agentinteractionmessage_set.count()} messages"
+        # the message count is only shown when annotated, e.g. by the admin
+        text = f"{self.agent.name} @ {self.agent.story.title} with {self.story_completion.user.username}"
+        message_count = getattr(self, "message_count", None)
+        if message_count is not None:
+            text += f" - {message_count} messages"
+        return text
 
     async def get_openai_object(self):
-        return [
-            await message.get_openai_object()
-            async for message in self.agentinteractionmessage_set.all()
-        ]
+        """
+        Returns the conversation as seen by the agent: its system prompt
+        followed by the transcript shared by all agents of the story completion.
+        Served from the in-process transcript cache when possible.
+        """
+        cached_messages = transcript_cache.get(self.id)
+        if cached_messages is not None:
+            return cached_messages
+
+        system_messages = []
+        if self.system_prompt_id is not None:
+            system_prompt_text = await SystemPrompt.objects.values_list("text", flat=True).aget(
+                id=self.system_prompt_id
+            )
+            system_messages.append({"content": system_prompt_text, "role": "system"})
+        # Rows go straight into the OpenAI format, without instantiating models
+        shared_messages = []
+        async for agent_name, *content in (
+            AgentInteractionMessage.objects.filter(
+                agent_interaction__story_completion_id=self.story_completion_id
+            )
+            .order_by("created_at", "id")
+            .values_list("agent_interaction__agent__name", *AgentInteractionMessage.CONTENT_FIELDS)
+        ):
+            role, message = AgentInteractionMessage.decode(agent_name, *content)
+            shared_messages.append({"content": message, "role": role})
+        messages = system_messages + shared_messages
+        transcript_cache.put(self.id, self.story_completion_id, messages)
+        return messages
+
+
+def render_message(role: int, agent_name: str, body: str) -> str:
+    """Renders a message as it is sent to the LLM: with the `Message to X:` / `Answer from X:` prefix."""
+    if role == AgentInteractionMessage.Role.USER:
+        return f"Message to {agent_name}:\n\n {body}"
+    return f"Answer from {agent_name}:\n\n {body}"
+
+
+def get_search_words(body: str) -> str:
+    """The distinct words of the body, in their order: enough to match the words of a search query."""
+    return " ".join(dict.fromkeys(re.findall(r"\w+", body.lower())))
 
 
 class AgentInteractionMessage(models.Model):
+    """
+    A turn of the transcript shared by all agents of a story completion.
+
+    The message belongs to the interaction with the questioned agent, who is the speaker
+    of the answer. Only the body is stored, the prefix is rendered when the message is read.
+    Bodies longer than TRANSCRIPT_COMPRESSION_THRESHOLD bytes are stored compressed,
+    their words are kept in `search_words` for the full-text search (see stories.search).
+    """
+
+    class Role(models.IntegerChoices):
+        USER = 1, "user"
+        ASSISTANT = 2, "assistant"
+
+    # Fields needed to decode the message content, see `decode`
+    CONTENT_FIELDS = ("role", "message", "compressed_message")
+
     id = models.AutoField(primary_key=True)
     agent_interaction = models.ForeignKey(AgentInteraction, on_delete=models.CASCADE)
-    message = models.TextField()
-    role = models.CharField(max_length=16)  # 'user', 'assistant' or 'system'
+    role = models.PositiveSmallIntegerField(choices=Role.choices)
+    message = models.TextField(blank=True)  # empty if the body is compressed
+    compressed_message = models.BinaryField(null=True, editable=False)
+    search_words = models.TextField(blank=True, editable=False)  # empty unless the body is compressed
     created_at = models.DateTimeField(auto_now_add=True)
 
+    class Meta:
+        # transcripts are read in the creation order, see StoryCompletion.get_transcript
+        indexes = [models.Index(fields=["agent_interaction", "created_at", "id"])]
+
     def __str__(self):
-        return f"({self.role}) {self.agent_interaction.agent.name}: {self.message}"
+        return f"({self.get_role_display()}) {self.agent_interaction.agent.name}: {self.body}"
 
-    async def get_openai_object(self):
+    @classmethod
+    def build(cls, agent_interaction: AgentInteraction, role: int, body: str) -> AgentInteractionMessage:
+        """Creates an unsaved message, compressing the body if it is long."""
+        if 0 < TRANSCRIPT_COMPRESSION_THRESHOLD <= len(body.encode("utf-8")):
+            return cls(
+                agent_interaction=agent_interaction,
+                role=role,
+                compressed_message=compress_text(body, TRANSCRIPT_COMPRESSION_CODEC),
+                search_words=get_search_words(body),
+            )
+        return cls(agent_interaction=agent_interaction, role=role, message=body)
+
+    @classmethod
+    def decode(cls, agent_name: str, role: int, message: str, compressed_message: bytes) -> tuple[str, str]:
+        """Returns the OpenAI role and the rendered message from the CONTENT_FIELDS values."""
+        body = message if compressed_message is None else decompress_text(compressed_message)
+        return cls.Role(role).label, render_message(role, agent_name, body)
+
+    @property
+    def body(self) -> str:
+        if self.compressed_message is None:
+            return self.message
+        return decompress_text(self.compressed_message)
+
+    def get_openai_object(self, agent_name: str):
         return {
-            "content": self.message,
-            "role": self.role,
+            "content": render_message(self.role, agent_name, self.body),
+            "role": self.get_role_display(),
         }
+
+
+# Fields of a transcript message, as returned by StoryCompletion.get_transcript
+TRANSCRIPT_FIELDS = ("agent_interaction", "role", "message", "created_at")
+
+
+class StoryCompletionArchive(models.Model):
+    """
+    The transcript of a finished story completion, packed into a single compressed row.
+
+    The message rows of the completion are deleted once it is archived (see stories.archival).
+    """
+
+    story_completion = models.OneToOneField(
+        StoryCompletion, on_delete=models.CASCADE, primary_key=True, related_name="archive"
+    )
+    transcript = models.BinaryField()  # zlib-compressed JSON list of messages
+    message_count = models.IntegerField()
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Archive of {self.story_completion_id} - {self.message_count} messages"
+
+    @staticmethod
+    def pack(messages: list[dict]) -> bytes:
+        payload = [
+            [message[field] for field in TRANSCRIPT_FIELDS[:-1]]
+            + [message["created_at"].isoformat()]
+            for message in messages
+        ]
+        return zlib.compress(json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+    def unpack(self) -> list[dict]:
+        payload = json.loads(zlib.decompress(bytes(self.transcript)).decode("utf-8"))
+        return [
+            dict(zip(TRANSCRIPT_FIELDS, row[:-1] + [datetime.fromisoformat(row[-1])]))
+            for row in payload
+        ]
+
+
+# Upper bounds (in seconds) of the LLM latency histogram buckets, the last bucket is unbounded
+LATENCY_BUCKETS = (1, 2, 5, 10, 20, 30, 60)
+# StoryStats counters of the buckets
+LATENCY_BUCKET_FIELDS = tuple(f"llm_latency_le_{bound}s" for bound in LATENCY_BUCKETS) + (
+    f"llm_latency_gt_{LATENCY_BUCKETS[-1]}s",
+)
+
+
+class StoryStats(models.Model):
+    """
+    Play statistics of a story, updated incrementally when a story is started,
+    an agent is questioned, a verdict is given or a story is quit.
+    """
+
+    story = models.OneToOneField(
+        Story, on_delete=models.CASCADE, primary_key=True, related_name="stats"
+    )
+    started = models.IntegerField(default=0)
+    questions = models.IntegerField(default=0)
+    failed_questions = models.IntegerField(default=0)
+    verdicts = models.IntegerField(default=0)
+    solved = models.IntegerField(default=0)
+    quits = models.IntegerField(default=0)
+
+    # LLM calls (questions and verdicts)
+    llm_calls = models.IntegerField(default=0)
+    llm_latency_total = models.FloatField(default=0)  # seconds
+    # number of calls per LATENCY_BUCKETS bucket, plus the unbounded one
+    llm_latency_le_1s = models.IntegerField(default=0)
+    llm_latency_le_2s = models.IntegerField(default=0)
+    llm_latency_le_5s = models.IntegerField(default=0)
+    llm_latency_le_10s = models.IntegerField(default=0)
+    llm_latency_le_20s = models.IntegerField(default=0)
+    llm_latency_le_30s = models.IntegerField(default=0)
+    llm_latency_le_60s = models.IntegerField(default=0)
+    llm_latency_gt_60s = models.IntegerField(default=0)
+
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        verbose_name_plural = "story stats"
+
+    def __str__(self):
+        return f"Stats of {self.story}"
+
+    @classmethod
+    def record(cls, story_id: int, latency: float = None, **increments: int):
+        """
+        Adds the increments to the counters of the story, e.g. `record(story_id, questions=1, latency=1.5)`.
+        The counters are incremented in the database, concurrent calls do not overwrite each other.
+        """
+        updates = {field: F(field) + value for field, value in increments.items()}
+        if latency is not None:
+            bucket = LATENCY_BUCKET_FIELDS[bisect.bisect_left(LATENCY_BUCKETS, latency)]
+            updates.update(
+                {
+                    bucket: F(bucket) + 1,
+                    "llm_calls": F("llm_calls") + 1,
+                    "llm_latency_total": F("llm_latency_total") + latency,
+                }
+            )
+        # update() does not set auto_now fields
+        updates["updated_at"] = timezone.now()
+        if cls.objects.filter(story_id=story_id).update(**updates):
+            return
+        try:
+            with transaction.atomic():
+                cls.objects.create(story_id=story_id)
+        except IntegrityError:
+            # created meanwhile by a concurrent call
+            pass
+        cls.objects.filter(story_id=story_id).update(**updates)
+
+    @classmethod
+    async def arecord(cls, story_id: int, latency: float = None, **increments: int):
+        """Same as `record`, but failures are logged instead of interrupting the game."""
+        try:
+            await sync_to_async(cls.record)(story_id, latency=latency, **increments)
+        except Exception as e:
+            logger.exception(e)
+
+    @property
+    def llm_latency_histogram(self) -> list[int]:
+        return [getattr(self, field) for field in LATENCY_BUCKET_FIELDS]
+
+    @property
+    def solve_rate(self) -> Optional[float]:
+        return self.solved / self.started if self.started else None
+
+    @property
+    def questions_per_completion(self) -> Optional[float]:
+        return self.questions / self.started if self.started else None
+
+    @property
+    def average_latency(self) -> Optional[float]:
+        return self.llm_latency_total / self.llm_calls if self.llm_calls else None
+
+    def latency_percentile(self, percentile: float) -> Optional[float]:
+        """
+        Returns the upper bound of the histogram bucket of the given percentile (0-100),
+        or infinity if it is in the unbounded bucket.
+        """
+        total = sum(self.llm_latency_histogram)
+        if total == 0:
+            return None
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS + (float("inf"),), self.llm_latency_histogram):
+            seen += count
+            if seen >= total * percentile / 100:
+                return bound
+        return float("inf")
+
+
+class LLMCall(models.Model):
+    """
+    A row of the LLM call ledger: what a question, verdict or transcription call used.
+    Written in batches, see `stories.ledger`.
+    """
+
+    id = models.AutoField(primary_key=True)
+    created_at = models.DateTimeField(default=timezone.now, db_index=True)
+    # kept when the story completion expires
+    story_completion = models.ForeignKey(
+        StoryCompletion, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    agent_interaction = models.ForeignKey(
+        AgentInteraction, on_delete=models.SET_NULL, null=True, blank=True
+    )
+    kind = models.PositiveSmallIntegerField(choices=CallKind.choices)
+    outcome = models.PositiveSmallIntegerField(choices=CallOutcome.choices)
+    # the model that answered, e.g. the fallback model of a route
+    model = models.CharField(max_length=64, blank=True)
+    prompt_tokens = models.PositiveIntegerField(default=0)
+    completion_tokens = models.PositiveIntegerField(default=0)
+    # seconds, for streamed answers only
+    time_to_first_token = models.FloatField(null=True, blank=True)
+    duration = models.FloatField()  # seconds
+    retries = models.PositiveSmallIntegerField(default=0)
+
+    class Meta:
+        verbose_name = "LLM call"
+
+    def __str__(self):
+        return f"{self.get_kind_display()} call to {self.model or '?'} ({self.get_outcome_display()})"
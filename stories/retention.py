@@ -0,0 +1,170 @@
+import asyncio
+import json
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import sync_to_async
+from django.db import DatabaseError, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from django_persistence.models import ConversationData
+from dtb.settings import (
+    PERSISTENCE_NAMESPACE,
+    RETENTION_BATCH_SIZE,
+    RETENTION_IDLE_DAYS,
+    RETENTION_INTERVAL,
+)
+from stories.models import (
+    AgentInteraction,
+    AgentInteractionMessage,
+    StoryCompletion,
+    SystemPrompt,
+)
+from stories.transcript_cache import transcript_cache
+from tgbot.handlers.storytelling.states import CONVERSATION_NAME
+from users.models import User
+
+logger = logging.getLogger(__name__)
+
+
+def abandoned_completions(idle_for: timedelta):
+    """
+    Unfinished story completions that were neither updated nor received a message
+    in the last `idle_for`.
+    """
+    cutoff = timezone.now() - idle_for
+    return StoryCompletion.objects.filter(completed_at__isnull=True, updated_at__lt=cutoff).exclude(
+        Exists(
+            AgentInteractionMessage.objects.filter(
+                agent_interaction__story_completion=OuterRef("pk"), created_at__gte=cutoff
+            )
+        )
+    )
+
+
+def orphan_system_prompts(created_before):
+    """System prompts created before the given moment that are not referenced anymore."""
+    return SystemPrompt.objects.filter(created_at__lt=created_before).exclude(
+        Q(Exists(StoryCompletion.objects.filter(system_prompt=OuterRef("pk"))))
+        | Q(Exists(AgentInteraction.objects.filter(system_prompt=OuterRef("pk"))))
+    )
+
+
+def _conversation_keys(user_ids: list[int]) -> list[str]:
+    # the story conversation of a private chat is keyed by (chat_id, user_id), see DjangoPersistence
+    return [json.dumps([user_id, user_id], sort_keys=True) for user_id in user_ids]
+
+
+def expire_completions(completion_ids: list[int], idle_for: timedelta) -> tuple[Counter, list[int]]:
+    """
+    Deletes the given story completions, if they are still abandoned, with their
+    interactions and messages, and drops the story conversation of their players.
+    Returns the number of deleted rows per model and the ids of the deleted completions.
+
+    Completions locked by the bot are skipped, and the idle check is repeated under the lock,
+    so that a player who came back in the meantime keeps their story.
+    """
+    with transaction.atomic():
+        expired_ids = list(
+            abandoned_completions(idle_for)
+            .filter(id__in=completion_ids)
+            .select_for_update(skip_locked=True)
+            .values_list("id", flat=True)
+        )
+        if not expired_ids:
+            return Counter(), []
+        user_ids = list(
+            User.objects.filter(current_completion_id__in=expired_ids).values_list(
+                "user_id", flat=True
+            )
+        )
+
+        reclaimed = Counter()
+        for queryset in (
+            AgentInteractionMessage.objects.filter(
+                agent_interaction__story_completion_id__in=expired_ids
+            ),
+            # interactions are deleted with the completions, players' current completion is unset
+            StoryCompletion.objects.filter(id__in=expired_ids),
+            ConversationData.objects.filter(
+                namespace=PERSISTENCE_NAMESPACE,
+                name=CONVERSATION_NAME,
+                key__in=_conversation_keys(user_ids),
+            ),
+        ):
+            reclaimed.update(queryset.delete()[1])
+    return reclaimed, expired_ids
+
+
+def prune_system_prompts(created_before, batch_size: int = RETENTION_BATCH_SIZE) -> int:
+    """
+    Deletes the system prompts that are not referenced by any completion or interaction.
+    Returns the number of deleted prompts.
+    """
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            # a prompt being reused by a new story completion is locked, see SystemPrompt.get_or_create_for_text
+            batch = list(
+                orphan_system_prompts(created_before)
+                .select_for_update(skip_locked=True)
+                .values_list("id", flat=True)[:batch_size]
+            )
+            if not batch:
+                return deleted
+            deleted += SystemPrompt.objects.filter(id__in=batch).delete()[0]
+
+
+def expire_abandoned_completions(
+    idle_for: timedelta = timedelta(days=RETENTION_IDLE_DAYS),
+    limit: int = None,
+    batch_size: int = RETENTION_BATCH_SIZE,
+) -> tuple[Counter, list[int]]:
+    """
+    Deletes the story completions abandoned for `idle_for`, `batch_size` completions per transaction,
+    then the system prompts left unreferenced. Returns the number of deleted rows per model
+    and the ids of the deleted completions.
+    """
+    started_at = timezone.now()
+    completion_ids = abandoned_completions(idle_for).order_by("updated_at").values_list("id", flat=True)
+    completion_ids = list(completion_ids[:limit] if limit is not None else completion_ids)
+
+    reclaimed = Counter()
+    expired_ids = []
+    for start in range(0, len(completion_ids), batch_size):
+        try:
+            batch_reclaimed, batch_expired_ids = expire_completions(
+                completion_ids[start : start + batch_size], idle_for
+            )
+        except DatabaseError as e:
+            # e.g. a message was written concurrently, the batch is retried on the next run
+            logger.warning(f"Could not expire story completions: {e}")
+            continue
+        reclaimed.update(batch_reclaimed)
+        expired_ids += batch_expired_ids
+
+    if completion_ids:
+        pruned = prune_system_prompts(started_at, batch_size)
+        if pruned:
+            reclaimed[SystemPrompt._meta.label] += pruned
+    return reclaimed, expired_ids
+
+
+async def run_retention(interval: float = RETENTION_INTERVAL):
+    """Expires abandoned story completions every `interval` seconds."""
+    while True:
+        try:
+            reclaimed, expired_ids = await sync_to_async(expire_abandoned_completions)()
+            # the cache is only used from the event loop
+            for completion_id in expired_ids:
+                transcript_cache.discard_completion(completion_id)
+            if reclaimed:
+                logger.info(
+                    "Expired abandoned story completions, deleted "
+                    + ", ".join(f"{count} {label}" for label, count in sorted(reclaimed.items()))
+                )
+        except Exception as e:
+            logger.exception(e)
+        await asyncio.sleep(interval)
@@ -0,0 +1,78 @@
+"""
+Full-text search over stories, agents and transcript messages.
+
+On PostgreSQL the searched fields are matched with `to_tsvector` expressions backed by GIN
+indexes, on SQLite (local development) with FTS5 tables kept up to date by triggers, see
+the 0013_full_text_search migration. Other databases fall back to `icontains` scans.
+
+Compressed message bodies (see TRANSCRIPT_COMPRESSION_THRESHOLD) are searched by the words
+the app keeps in `AgentInteractionMessage.search_words`.
+
+On SQLite, migrations that rebuild one of the indexed tables (e.g. adding a column with a default,
+altering a column) drop its triggers: they must drop the FTS table before and create it again after,
+see the 0017_agentinteractionmessage_search_words migration.
+"""
+from django.db import connections
+from django.db.models import Q, QuerySet
+from django.db.models.expressions import RawSQL
+
+from stories.models import Agent, AgentInteractionMessage, Story
+
+SEARCH_CONFIG = "english"
+
+# The fields and their order must match the indexes created by the migration
+SEARCH_FIELDS = {
+    Story: ("title", "prelude"),
+    Agent: ("name", "background", "hidden", "alibi", "character", "relationships", "knowledge"),
+    AgentInteractionMessage: ("message", "search_words"),
+}
+
+
+def _match_expression(query: str) -> str:
+    """Turns the user input into an FTS5 query: every word is quoted, all of them must match."""
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in query.split())
+
+
+def search(queryset: QuerySet, query: str) -> QuerySet:
+    """Filters the queryset of stories, agents or messages to the rows matching the query."""
+    if not query.strip():
+        return queryset
+    fields = SEARCH_FIELDS[queryset.model]
+    vendor = connections[queryset.db].vendor
+
+    if vendor == "postgresql":
+        # imported here, it requires psycopg
+        from django.contrib.postgres.search import SearchQuery, SearchVector
+
+        return queryset.annotate(
+            search_document=SearchVector(*fields, config=SEARCH_CONFIG)
+        ).filter(
+            search_document=SearchQuery(query, config=SEARCH_CONFIG, search_type="websearch")
+        )
+
+    if vendor == "sqlite":
+        fts_table = f"{queryset.model._meta.db_table}_fts"
+        return queryset.filter(
+            pk__in=RawSQL(
+                f"SELECT rowid FROM {fts_table} WHERE {fts_table} MATCH %s",
+                [_match_expression(query)],
+            )
+        )
+
+    condition = Q()
+    for field in fields:
+        condition |= Q(**{f"{field}__icontains": query})
+    return queryset.filter(condition)
+
+
+def search_stories(query: str) -> QuerySet:
+    return search(Story.objects.all(), query)
+
+
+def search_agents(query: str) -> QuerySet:
+    return search(Agent.objects.all(), query)
+
+
+def search_messages(query: str) -> QuerySet:
+    """Messages matching the query, newest first."""
+    return search(AgentInteractionMessage.objects.all(), query).order_by("-created_at", "-id")
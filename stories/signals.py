@@ -0,0 +1,12 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+
+from stories.catalog import story_catalog
+from stories.models import Story, Agent
+
+
+@receiver([post_save, post_delete], sender=Story)
+@receiver([post_save, post_delete], sender=Agent)
+def invalidate_story_catalog(sender, **kwargs):
+    """Stories or agents were changed, the catalog is reloaded on the next access."""
+    story_catalog.invalidate()
@@ -0,0 +1,124 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+
+from stories.archival import archive_completion, archive_finished_completions, get_completions_to_archive
+from stories.models import (
+    Agent,
+    AgentInteraction,
+    AgentInteractionMessage,
+    Story,
+    StoryCompletion,
+    StoryCompletionArchive,
+)
+from users.models import User
+
+ARCHIVE_AFTER = timedelta(days=7)
+
+
+class ArchivalTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        story = Story.objects.create(title="The Manor", prelude="A storm", extensive_solution="The butler")
+        agents = [
+            Agent.objects.create(
+                story=story,
+                name=name,
+                background="",
+                hidden="",
+                alibi="",
+                character="",
+                relationships="",
+                knowledge="",
+                agent_type="WITNESS",
+            )
+            for name in ("Alice", "Carl")
+        ]
+        user = User.objects.create(user_id=1, first_name="Bob")
+        cls.completion = StoryCompletion.objects.create(user=user, story=story, state="STARTED")
+        interactions = [
+            AgentInteraction.objects.create(story_completion=cls.completion, agent=agent) for agent in agents
+        ]
+        turns = [
+            (interactions[0], "Where were you during the storm?", "In the library, reading."),
+            (interactions[1], "Did you hear the shot?", "Ja, um Mitternacht – dann Stille. " * 50),
+            (interactions[0], "Who had the key?", "Only the butler."),
+        ]
+        for interaction, question, answer in turns:
+            for role, body in (
+                (AgentInteractionMessage.Role.USER, question),
+                (AgentInteractionMessage.Role.ASSISTANT, answer),
+            ):
+                AgentInteractionMessage.build(interaction, role, body).save()
+
+    def finish(self, days_ago: float = 10) -> None:
+        self.completion.completed_at = timezone.now() - timedelta(days=days_ago)
+        self.completion.save()
+
+    def test_round_trip(self):
+        self.finish()
+        transcript = self.completion.get_transcript()
+        self.assertEqual(len(transcript), 6)
+
+        deleted = archive_completion(self.completion.id, batch_size=4)
+
+        self.assertEqual(deleted, 6)
+        self.assertFalse(AgentInteractionMessage.objects.exists())
+        archive = StoryCompletionArchive.objects.get(story_completion=self.completion)
+        self.assertEqual(archive.message_count, 6)
+        self.assertEqual(archive.unpack(), transcript)
+        self.assertEqual(StoryCompletion.objects.get(id=self.completion.id).get_transcript(), transcript)
+
+    def test_rerun(self):
+        self.finish()
+        transcript = self.completion.get_transcript()
+        archive_completion(self.completion.id)
+        packed = bytes(StoryCompletionArchive.objects.get(story_completion=self.completion).transcript)
+
+        self.assertEqual(archive_completion(self.completion.id), 0)
+
+        archive = StoryCompletionArchive.objects.get(story_completion=self.completion)
+        self.assertEqual(bytes(archive.transcript), packed)
+        self.assertEqual(archive.unpack(), transcript)
+
+    def test_rerun_deletes_leftover_messages(self):
+        # e.g. the process stopped after the archive was written
+        self.finish()
+        transcript = self.completion.get_transcript()
+        StoryCompletionArchive.objects.create(
+            story_completion=self.completion,
+            transcript=StoryCompletionArchive.pack(transcript),
+            message_count=len(transcript),
+        )
+
+        self.assertEqual(archive_completion(self.completion.id), 6)
+
+        self.assertFalse(AgentInteractionMessage.objects.exists())
+        self.assertEqual(StoryCompletion.objects.get(id=self.completion.id).get_transcript(), transcript)
+
+    def test_unfinished_completion(self):
+        with self.assertRaises(ValueError):
+            archive_completion(self.completion.id)
+        self.assertFalse(StoryCompletionArchive.objects.exists())
+        self.assertEqual(AgentInteractionMessage.objects.count(), 6)
+
+    def test_completions_to_archive(self):
+        self.assertEqual(get_completions_to_archive(ARCHIVE_AFTER), [])
+        self.finish(days_ago=1)
+        self.assertEqual(get_completions_to_archive(ARCHIVE_AFTER), [])
+        self.finish()
+        self.assertEqual(get_completions_to_archive(ARCHIVE_AFTER), [self.completion.id])
+
+        archive_completion(self.completion.id)
+
+        # archived completions have no message rows left
+        self.assertEqual(get_completions_to_archive(ARCHIVE_AFTER), [])
+
+    async def test_archive_finished_completions(self):
+        await StoryCompletion.objects.filter(id=self.completion.id).aupdate(
+            completed_at=timezone.now() - timedelta(days=10)
+        )
+
+        self.assertEqual(await archive_finished_completions(ARCHIVE_AFTER), (1, 6))
+        self.assertEqual(await archive_finished_completions(ARCHIVE_AFTER), (0, 0))
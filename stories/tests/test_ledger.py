@@ -0,0 +1,159 @@
+import asyncio
+from unittest import mock
+
+from django.db import DatabaseError
+from django.test import TestCase
+
+from llm_helper.backends import FakeBackend
+from llm_helper.chat import LLMHelper
+from llm_helper.circuit_breaker import CircuitBreaker, CircuitOpenError
+from llm_helper.stream import StreamTimeout
+from stories.ledger import CallKind, CallOutcome, LLMCallLedger, get_outcome
+from stories.models import Agent, AgentInteraction, LLMCall, Story, StoryCompletion
+from users.models import User
+
+MESSAGES = [
+    {"role": "system", "content": "You are the gardener of the manor."},
+    {"role": "user", "content": "Where were you on the night of the murder?"},
+]
+
+
+class LLMCallLedgerTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        story = Story.objects.create(title="The Manor", prelude="A storm", extensive_solution="The butler")
+        agent = Agent.objects.create(
+            story=story,
+            name="Alice",
+            background="",
+            hidden="",
+            alibi="",
+            character="",
+            relationships="",
+            knowledge="",
+            agent_type="WITNESS",
+        )
+        user = User.objects.create(user_id=1, first_name="Bob")
+        cls.completion = StoryCompletion.objects.create(user=user, story=story, state="STARTED")
+        cls.interaction = AgentInteraction.objects.create(story_completion=cls.completion, agent=agent)
+
+    def setUp(self):
+        self.ledger = LLMCallLedger(batch_size=2, max_pending=10, enabled=True)
+
+    def get_helper(self, **backend_options) -> LLMHelper:
+        options = dict(time_to_first_token=0, tokens_per_second=0, error_rate=0)
+        options.update(backend_options)
+        return LLMHelper(backend=FakeBackend(**options))
+
+    async def question(self, helper: LLMHelper) -> str:
+        with self.ledger.record(CallKind.QUESTION, self.completion.id, self.interaction.id) as stats:
+            return await helper.chat_complete(MESSAGES, stats=stats)
+
+    async def test_ok(self):
+        helper = self.get_helper()
+        answer = await self.question(helper)
+
+        [row] = self.ledger.pending
+        self.assertEqual(row["kind"], CallKind.QUESTION)
+        self.assertEqual(row["outcome"], CallOutcome.OK)
+        self.assertEqual(row["model"], helper.model)
+        self.assertGreater(row["prompt_tokens"], 0)
+        self.assertEqual(row["completion_tokens"], helper.context_window.counter.count(answer))
+        self.assertIsNotNone(row["time_to_first_token"])
+        self.assertEqual(row["story_completion_id"], self.completion.id)
+        self.assertEqual(row["agent_interaction_id"], self.interaction.id)
+
+    async def test_partial(self):
+        helper = self.get_helper(tokens_per_second=1)
+        helper.stall_timeout = 0.05
+        with self.assertRaises(StreamTimeout) as raised:
+            await self.question(helper)
+
+        self.assertTrue(raised.exception.partial_answer)
+        [row] = self.ledger.pending
+        self.assertEqual(row["outcome"], CallOutcome.PARTIAL)
+        self.assertGreater(row["completion_tokens"], 0)
+
+    async def test_timeout(self):
+        helper = self.get_helper(time_to_first_token=1)
+        helper.first_token_timeout = 0.05
+        with self.assertRaises(StreamTimeout):
+            await self.question(helper)
+
+        [row] = self.ledger.pending
+        self.assertEqual(row["outcome"], CallOutcome.TIMEOUT)
+        self.assertIsNone(row["time_to_first_token"])
+
+    async def test_rejected(self):
+        helper = self.get_helper()
+        helper.circuit_breaker = CircuitBreaker(name="test_ledger")
+        helper.circuit_breaker._open("test")
+        with self.assertRaises(CircuitOpenError):
+            await self.question(helper)
+
+        [row] = self.ledger.pending
+        self.assertEqual(row["outcome"], CallOutcome.REJECTED)
+
+    def test_get_outcome(self):
+        self.assertEqual(get_outcome(), CallOutcome.OK)
+        self.assertEqual(get_outcome(StreamTimeout("late", "Answer")), CallOutcome.PARTIAL)
+        self.assertEqual(get_outcome(StreamTimeout("late")), CallOutcome.TIMEOUT)
+        self.assertEqual(get_outcome(CircuitOpenError()), CallOutcome.REJECTED)
+        self.assertEqual(get_outcome(asyncio.CancelledError()), CallOutcome.CANCELLED)
+        self.assertEqual(get_outcome(ValueError()), CallOutcome.ERROR)
+
+    async def test_flush(self):
+        helper = self.get_helper()
+        for _ in range(3):
+            await self.question(helper)
+        self.assertTrue(self.ledger.batch_ready.is_set())
+
+        self.assertEqual(await self.ledger.flush(), 3)
+
+        self.assertEqual(self.ledger.pending, [])
+        self.assertEqual(
+            await LLMCall.objects.filter(
+                story_completion=self.completion, agent_interaction=self.interaction, outcome=CallOutcome.OK
+            ).acount(),
+            3,
+        )
+
+    async def test_flush_deleted_completion(self):
+        helper = self.get_helper()
+        await self.question(helper)
+        with self.ledger.record(CallKind.VERDICT, self.completion.id) as stats:
+            await helper.is_solved("The butler", "The butler did it", "A storm", stats=stats)
+        await self.completion.adelete()
+
+        self.assertEqual(await self.ledger.flush(), 2)
+
+        rows = [row async for row in LLMCall.objects.values("kind", "story_completion", "agent_interaction")]
+        self.assertEqual(
+            sorted(rows, key=lambda row: row["kind"]),
+            [
+                dict(kind=CallKind.QUESTION, story_completion=None, agent_interaction=None),
+                dict(kind=CallKind.VERDICT, story_completion=None, agent_interaction=None),
+            ],
+        )
+
+    async def test_flush_keeps_rows_while_database_is_unavailable(self):
+        await self.question(self.get_helper())
+        with mock.patch.object(LLMCall.objects, "abulk_create", side_effect=DatabaseError("unavailable")):
+            self.assertEqual(await self.ledger.flush(), 0)
+        self.assertEqual(len(self.ledger.pending), 1)
+
+        self.assertEqual(await self.ledger.flush(), 1)
+        self.assertEqual(self.ledger.pending, [])
+
+    def test_max_pending(self):
+        ledger = LLMCallLedger(batch_size=2, max_pending=2, enabled=True)
+        for kind in (CallKind.QUESTION, CallKind.VERDICT, CallKind.TRANSCRIPTION):
+            with ledger.record(kind):
+                pass
+
+        self.assertEqual([row["kind"] for row in ledger.pending], [CallKind.VERDICT, CallKind.TRANSCRIPTION])
+        self.assertEqual(ledger.dropped, 1)
+
+    def test_batch_size_must_be_positive(self):
+        with self.assertRaises(ValueError):
+            LLMCallLedger(batch_size=0)
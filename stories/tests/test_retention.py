@@ -0,0 +1,248 @@
+import asyncio
+import io
+import json
+import threading
+from datetime import timedelta
+from unittest import mock
+
+from asgiref.sync import sync_to_async
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import RestrictedError
+from django.test import TestCase, TransactionTestCase, skipUnlessDBFeature
+from django.utils import timezone
+
+from django_persistence.models import ConversationData
+from stories.models import (
+    Agent,
+    AgentInteraction,
+    AgentInteractionMessage,
+    Story,
+    StoryCompletion,
+    SystemPrompt,
+)
+from stories.retention import (
+    PERSISTENCE_NAMESPACE,
+    expire_abandoned_completions,
+    expire_completions,
+    run_retention,
+)
+from tgbot.handlers.storytelling.states import CONVERSATION_NAME
+from users.models import User
+
+IDLE_FOR = timedelta(days=30)
+
+
+def create_story() -> tuple[Story, Agent]:
+    story = Story.objects.create(title="The Manor", prelude="A storm", extensive_solution="The butler")
+    agent = Agent.objects.create(
+        story=story,
+        name="Alice",
+        background="",
+        hidden="",
+        alibi="",
+        character="",
+        relationships="",
+        knowledge="",
+        agent_type="WITNESS",
+    )
+    return story, agent
+
+
+def create_completion(user: User, story: Story, agent: Agent, idle_for: timedelta = None) -> StoryCompletion:
+    """A completion with a question and an answer, that saw no activity for `idle_for`."""
+    with transaction.atomic():
+        prompt = SystemPrompt.get_or_create_for_text(story, f"You are {agent.name}.")
+    completion = StoryCompletion.objects.create(user=user, story=story, state="STARTED", system_prompt=prompt)
+    interaction = AgentInteraction.objects.create(story_completion=completion, agent=agent, system_prompt=prompt)
+    for role, body in (
+        (AgentInteractionMessage.Role.USER, "Where were you?"),
+        (AgentInteractionMessage.Role.ASSISTANT, "In the library."),
+    ):
+        AgentInteractionMessage.build(interaction, role, body).save()
+    user.current_completion = completion
+    user.save()
+    if idle_for is not None:
+        set_last_activity(completion, timezone.now() - idle_for)
+    return completion
+
+
+def set_last_activity(completion: StoryCompletion, moment) -> None:
+    StoryCompletion.objects.filter(id=completion.id).update(updated_at=moment)
+    AgentInteractionMessage.objects.filter(agent_interaction__story_completion=completion).update(
+        created_at=moment
+    )
+
+
+def conversation_key(user: User) -> str:
+    return json.dumps([user.user_id, user.user_id])
+
+
+class RetentionTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.story, cls.agent = create_story()
+        cls.user = User.objects.create(user_id=1, first_name="Bob")
+
+    def test_expires_abandoned_completion(self):
+        completion = create_completion(self.user, self.story, self.agent, idle_for=IDLE_FOR * 2)
+        for namespace, name in (
+            (PERSISTENCE_NAMESPACE, CONVERSATION_NAME),
+            (f"{PERSISTENCE_NAMESPACE}-other", CONVERSATION_NAME),
+            (PERSISTENCE_NAMESPACE, "other"),
+        ):
+            ConversationData.objects.create(namespace=namespace, name=name, key=conversation_key(self.user), state=1)
+
+        reclaimed, expired_ids = expire_abandoned_completions(IDLE_FOR)
+
+        self.assertEqual(expired_ids, [completion.id])
+        self.assertFalse(StoryCompletion.objects.filter(id=completion.id).exists())
+        self.assertFalse(AgentInteraction.objects.filter(story_completion_id=completion.id).exists())
+        self.assertFalse(AgentInteractionMessage.objects.exists())
+        self.assertEqual(reclaimed[AgentInteractionMessage._meta.label], 2)
+        self.assertEqual(reclaimed[ConversationData._meta.label], 1)
+        # the player starts over
+        self.user.refresh_from_db()
+        self.assertIsNone(self.user.current_completion_id)
+        # only the story conversation of this bot is dropped
+        self.assertEqual(
+            set(ConversationData.objects.values_list("namespace", "name")),
+            {(f"{PERSISTENCE_NAMESPACE}-other", CONVERSATION_NAME), (PERSISTENCE_NAMESPACE, "other")},
+        )
+
+    def test_keeps_active_completions(self):
+        recent = create_completion(self.user, self.story, self.agent, idle_for=IDLE_FOR / 2)
+        # the completion itself was not updated, but a message was written recently
+        messaged = create_completion(self.user, self.story, self.agent, idle_for=IDLE_FOR * 2)
+        AgentInteractionMessage.objects.filter(agent_interaction__story_completion=messaged).update(
+            created_at=timezone.now()
+        )
+        finished = create_completion(self.user, self.story, self.agent)
+        StoryCompletion.objects.filter(id=finished.id).update(completed_at=timezone.now())
+        set_last_activity(finished, timezone.now() - IDLE_FOR * 2)
+
+        reclaimed, expired_ids = expire_abandoned_completions(IDLE_FOR)
+
+        self.assertEqual((reclaimed, expired_ids), ({}, []))
+        self.assertEqual(StoryCompletion.objects.count(), 3)
+        self.assertEqual(
+            set(StoryCompletion.objects.values_list("id", flat=True)), {recent.id, messaged.id, finished.id}
+        )
+
+    def test_idle_check_is_repeated(self):
+        completion = create_completion(self.user, self.story, self.agent, idle_for=IDLE_FOR * 2)
+        # the player came back after the completions to expire were listed
+        AgentInteractionMessage.build(
+            completion.agentinteraction_set.get(), AgentInteractionMessage.Role.USER, "I am back"
+        ).save()
+
+        reclaimed, expired_ids = expire_completions([completion.id], IDLE_FOR)
+
+        self.assertEqual(expired_ids, [])
+        self.assertTrue(StoryCompletion.objects.filter(id=completion.id).exists())
+        self.user.refresh_from_db()
+        self.assertEqual(self.user.current_completion_id, completion.id)
+
+    def test_prunes_unreferenced_system_prompts(self):
+        expired = create_completion(self.user, self.story, self.agent, idle_for=IDLE_FOR * 2)
+        other_agent = Agent.objects.create(
+            story=self.story,
+            name="Carl",
+            background="",
+            hidden="",
+            alibi="",
+            character="",
+            relationships="",
+            knowledge="",
+            agent_type="SUSPECT",
+        )
+        kept = create_completion(self.user, self.story, other_agent)
+        expired_prompt, kept_prompt = expired.system_prompt, kept.system_prompt
+        # both prompts are older than the retention run
+        SystemPrompt.objects.update(created_at=timezone.now() - IDLE_FOR)
+
+        reclaimed, _ = expire_abandoned_completions(IDLE_FOR)
+
+        self.assertEqual(reclaimed[SystemPrompt._meta.label], 1)
+        self.assertFalse(SystemPrompt.objects.filter(id=expired_prompt.id).exists())
+        self.assertTrue(SystemPrompt.objects.filter(id=kept_prompt.id).exists())
+        # a prompt still in use is never deleted
+        with self.assertRaises(RestrictedError):
+            kept_prompt.delete()
+
+    def test_prompts_created_during_the_run_are_kept(self):
+        create_completion(self.user, self.story, self.agent, idle_for=IDLE_FOR * 2)
+        new_prompt = SystemPrompt.objects.create(story=self.story, digest="0" * 64, text="New story version")
+        # created after the run started, not referenced yet
+        SystemPrompt.objects.filter(id=new_prompt.id).update(created_at=timezone.now() + timedelta(minutes=1))
+
+        expire_abandoned_completions(IDLE_FOR)
+
+        self.assertTrue(SystemPrompt.objects.filter(id=new_prompt.id).exists())
+
+    def test_limit_and_batches(self):
+        completions = [
+            create_completion(self.user, self.story, self.agent, idle_for=IDLE_FOR * (2 + days))
+            for days in range(3)
+        ]
+
+        _, expired_ids = expire_abandoned_completions(IDLE_FOR, limit=2, batch_size=1)
+
+        # the longest abandoned first
+        self.assertEqual(expired_ids, [completions[2].id, completions[1].id])
+        self.assertEqual(list(StoryCompletion.objects.values_list("id", flat=True)), [completions[0].id])
+
+    def test_command(self):
+        create_completion(self.user, self.story, self.agent, idle_for=IDLE_FOR * 2)
+        out = io.StringIO()
+
+        call_command("expire_completions", "--dry-run", "--idle-days", "30", stdout=out)
+        self.assertIn("1 story completions would expire", out.getvalue())
+        self.assertTrue(StoryCompletion.objects.exists())
+
+        call_command("expire_completions", "--idle-days", "30", stdout=out)
+        self.assertIn(f"{StoryCompletion._meta.label}: 1", out.getvalue())
+        self.assertFalse(StoryCompletion.objects.exists())
+
+    async def test_run_retention_evicts_cached_transcripts(self):
+        completion = await sync_to_async(create_completion)(self.user, self.story, self.agent, IDLE_FOR * 2)
+
+        with mock.patch("stories.retention.transcript_cache") as transcript_cache:
+            task = asyncio.create_task(run_retention(interval=60))
+            while not transcript_cache.discard_completion.called:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+        transcript_cache.discard_completion.assert_called_once_with(completion.id)
+
+
+@skipUnlessDBFeature("has_select_for_update_skip_locked")
+class ExpireLockedCompletionTest(TransactionTestCase):
+    def test_locked_completion_is_skipped(self):
+        story, agent = create_story()
+        user = User.objects.create(user_id=1, first_name="Bob")
+        completion = create_completion(user, story, agent, idle_for=IDLE_FOR * 2)
+        locked, release = threading.Event(), threading.Event()
+
+        def lock_completion():
+            # e.g. the bot answering a question of the player
+            try:
+                with transaction.atomic():
+                    StoryCompletion.objects.select_for_update().get(id=completion.id)
+                    locked.set()
+                    release.wait(5)
+            finally:
+                connection.close()
+
+        thread = threading.Thread(target=lock_completion)
+        thread.start()
+        self.assertTrue(locked.wait(5))
+        try:
+            reclaimed, expired_ids = expire_completions([completion.id], IDLE_FOR)
+        finally:
+            release.set()
+            thread.join()
+
+        self.assertEqual(expired_ids, [])
+        self.assertTrue(StoryCompletion.objects.filter(id=completion.id).exists())
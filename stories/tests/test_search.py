@@ -0,0 +1,58 @@
+from django.db import connection
+from django.test import TestCase
+
+from stories.models import Agent, AgentInteraction, AgentInteractionMessage, Story, StoryCompletion
+from stories.search import SEARCH_FIELDS, search_messages
+from users.models import User
+
+
+class SearchMessagesTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        story = Story.objects.create(title="The Manor", prelude="A storm", extensive_solution="The butler")
+        agent = Agent.objects.create(
+            story=story,
+            name="Alice",
+            background="",
+            hidden="",
+            alibi="",
+            character="",
+            relationships="",
+            knowledge="",
+            agent_type="WITNESS",
+        )
+        user = User.objects.create(user_id=1, first_name="Bob")
+        completion = StoryCompletion.objects.create(user=user, story=story, state="STARTED")
+        cls.interaction = AgentInteraction.objects.create(story_completion=completion, agent=agent)
+
+    def add_message(self, body: str) -> AgentInteractionMessage:
+        message = AgentInteractionMessage.build(self.interaction, AgentInteractionMessage.Role.USER, body)
+        message.save()
+        return message
+
+    def test_plain_message(self):
+        message = self.add_message("Where were you during the storm?")
+        self.assertEqual(list(search_messages("storm")), [message])
+
+    def test_compressed_message(self):
+        message = self.add_message("The library was locked from the inside. " * 100)
+        self.assertIsNotNone(message.compressed_message)
+        self.assertEqual(message.message, "")
+        self.assertEqual(list(search_messages("library locked")), [message])
+
+    def test_deleted_message(self):
+        message = self.add_message("Where were you during the storm?")
+        message.delete()
+        self.assertFalse(search_messages("storm").exists())
+
+    def test_search_triggers(self):
+        # a migration rebuilding a table on SQLite drops its triggers, see stories.search
+        if connection.vendor != "sqlite":
+            self.skipTest("FTS5 triggers are only used on SQLite")
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT tbl_name, name FROM sqlite_master WHERE type = 'trigger'")
+            triggers = set(cursor.fetchall())
+        for model in SEARCH_FIELDS:
+            table = model._meta.db_table
+            for suffix in ("ai", "ad", "au"):
+                self.assertIn((table, f"{table}_fts_{suffix}"), triggers)
@@ -0,0 +1,80 @@
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from llm_helper.backends import FakeBackend
+from llm_helper.chat import LLMHelper
+from stories.models import Agent, AgentInteraction, Story, StoryCompletion, SystemPrompt
+from stories.transcript_cache import TranscriptCache
+from users.models import User
+
+
+class TranscriptCacheTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        story = Story.objects.create(title="The Manor", prelude="A storm", extensive_solution="The butler")
+        cls.agents = [
+            Agent.objects.create(
+                story=story,
+                name=name,
+                background="",
+                hidden="",
+                alibi="",
+                character="",
+                relationships="",
+                knowledge="",
+                agent_type="WITNESS",
+            )
+            for name in ("Alice", "Carl")
+        ]
+        prompt = SystemPrompt.objects.create(
+            story=story, digest=SystemPrompt.get_digest("You are"), text="You are"
+        )
+        user = User.objects.create(user_id=1, first_name="Bob")
+        cls.completion = StoryCompletion.objects.create(
+            user=user, story=story, state="STARTED", system_prompt=prompt
+        )
+
+    def setUp(self):
+        self.transcript_cache = TranscriptCache()
+        patcher = mock.patch("stories.models.transcript_cache", self.transcript_cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.helper = LLMHelper(backend=FakeBackend(time_to_first_token=0, tokens_per_second=0, error_rate=0))
+
+    async def get_conversations(self) -> dict:
+        """The conversations of the agents, cached and read from the database."""
+        interactions = [
+            interaction async for interaction in AgentInteraction.objects.filter(story_completion=self.completion)
+        ]
+        cached = {interaction.agent_id: self.transcript_cache.get(interaction.id) for interaction in interactions}
+        with mock.patch("stories.models.transcript_cache", TranscriptCache()):
+            stored = {interaction.agent_id: await interaction.get_openai_object() for interaction in interactions}
+        return cached, stored
+
+    async def test_cached_transcript_matches_the_database(self):
+        alice, carl = self.agents
+
+        for agent, question in ((alice, "Where were you?"), (carl, "Did you hear it?"), (alice, "Who had the key?")):
+            await self.completion.question_agent(agent, question, self.helper)
+
+            cached, stored = await self.get_conversations()
+            self.assertEqual(cached, stored)
+
+        self.assertEqual(stored[alice.id][0], {"content": "You are", "role": "system"})
+        self.assertEqual(len(stored[alice.id]), 1 + 6)
+
+    def test_system_prompt_is_read_on_a_cache_miss_only(self):
+        question_agent = async_to_sync(self.completion.question_agent)
+        alice = self.agents[0]
+
+        with CaptureQueriesContext(connection) as queries:
+            question_agent(alice, "Where were you?", self.helper)
+        self.assertTrue(any("stories_systemprompt" in query["sql"] for query in queries))
+
+        with CaptureQueriesContext(connection) as queries:
+            question_agent(alice, "Who had the key?", self.helper)
+        self.assertFalse(any("stories_systemprompt" in query["sql"] for query in queries))
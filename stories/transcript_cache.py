@@ -0,0 +1,83 @@
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Set
+
+from dtb.settings import TRANSCRIPT_CACHE_MAX_IDLE, TRANSCRIPT_CACHE_SIZE
+
+
+class TranscriptCache:
+    """
+    A bounded in-process LRU cache of agent conversations in the OpenAI format.
+
+    Entries are keyed by AgentInteraction id and evicted when the cache is full
+    or when they were not used for `max_idle` seconds. The transcript is shared
+    by all agents of a story completion, so new turns are appended to the cached
+    conversations of every agent of the completion.
+
+    The cache is per process: it relies on all updates of a user being handled by the same process.
+
+    Args:
+        max_entries (int): The maximum number of cached conversations.
+        max_idle (float): The number of seconds after which an unused conversation is evicted.
+    """
+
+    def __init__(self, max_entries: int = 1024, max_idle: float = 1800.0):
+        self.max_entries = max_entries
+        self.max_idle = max_idle
+        # interaction id -> (story completion id, messages, last access time)
+        self.entries: OrderedDict[int, tuple[int, List[Dict[str, Any]], float]] = OrderedDict()
+        self.interactions_by_completion: Dict[int, Set[int]] = {}
+
+    def get(self, interaction_id: int) -> Optional[List[Dict[str, Any]]]:
+        """Returns a copy of the cached conversation, or None on a miss."""
+        self._evict_idle()
+        entry = self.entries.get(interaction_id)
+        if entry is None:
+            return None
+        completion_id, messages, _ = entry
+        self.entries[interaction_id] = (completion_id, messages, time.monotonic())
+        self.entries.move_to_end(interaction_id)
+        return list(messages)
+
+    def put(self, interaction_id: int, completion_id: int, messages: List[Dict[str, Any]]):
+        """Caches the full conversation of the agent interaction."""
+        if self.max_entries <= 0:
+            return
+        self._remove(interaction_id)
+        self.entries[interaction_id] = (completion_id, list(messages), time.monotonic())
+        self.interactions_by_completion.setdefault(completion_id, set()).add(interaction_id)
+        while len(self.entries) > self.max_entries:
+            self._remove(next(iter(self.entries)))
+
+    def append(self, completion_id: int, messages: List[Dict[str, Any]]):
+        """Appends new turns to the cached conversations of all agents of the story completion."""
+        for interaction_id in self.interactions_by_completion.get(completion_id, ()):
+            self.entries[interaction_id][1].extend(messages)
+
+    def discard_completion(self, completion_id: int):
+        """Evicts the conversations of all agents of the story completion."""
+        for interaction_id in list(self.interactions_by_completion.get(completion_id, ())):
+            self._remove(interaction_id)
+
+    def _evict_idle(self):
+        deadline = time.monotonic() - self.max_idle
+        while self.entries:
+            interaction_id, (_, _, last_access) = next(iter(self.entries.items()))
+            if last_access >= deadline:
+                break
+            self._remove(interaction_id)
+
+    def _remove(self, interaction_id: int):
+        entry = self.entries.pop(interaction_id, None)
+        if entry is None:
+            return
+        completion_id = entry[0]
+        interaction_ids = self.interactions_by_completion[completion_id]
+        interaction_ids.discard(interaction_id)
+        if not interaction_ids:
+            del self.interactions_by_completion[completion_id]
+
+
+transcript_cache = TranscriptCache(
+    max_entries=TRANSCRIPT_CACHE_SIZE, max_idle=TRANSCRIPT_CACHE_MAX_IDLE
+)
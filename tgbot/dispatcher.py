@@ -69,7 +69,7 @@ def setup_event_handlers(dp):
                 ),
             ],
             persistent=True,
-            name="storytelling",
+            name=storytelling_handlers.states.CONVERSATION_NAME,
         )
     )
 
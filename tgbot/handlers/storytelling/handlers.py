@@ -1,14 +1,20 @@
 import asyncio
 import html
 import logging
+from contextlib import asynccontextmanager
 
 from telegram._update import Update
 from telegram.constants import ParseMode
 from telegram.ext import ConversationHandler, ContextTypes
 from telegram.helpers import escape_markdown
 
-from llm_helper.chat import LLMHelper
-from stories.models import Story, StoryCompletion, Agent
+from dtb.settings import LLM_ADMIN_WEIGHT
+from llm_helper.circuit_breaker import CircuitOpenError
+from llm_helper.router import ModelRouter
+from llm_helper.scheduler import llm_scheduler
+from stories.catalog import story_catalog
+from stories.ledger import CallKind, llm_call_ledger
+from stories.models import StoryCompletion
 from tgbot.handlers.storytelling import states
 from tgbot.handlers.storytelling import static_text
 from tgbot.handlers.storytelling.info import (
@@ -23,13 +29,28 @@ from tgbot.handlers.storytelling.keyboards import (
     make_keyboard_for_stories_list,
     make_keyboard_for_agents_list,
 )
-from tgbot.handlers.utils.python_update_timer import TimeoutTimer
+from tgbot.handlers.utils.streaming_message import (
+    StreamingMessage,
+    STREAMING,
+    CONTINUED,
+    FINAL,
+)
+from tgbot.main import streaming_bot
 from users.models import User
 
-global_llm_helper = LLMHelper()
+# picks the model of every call, see the LLM_ROUTES setting
+global_llm_helper = ModelRouter()
 logger = logging.getLogger(__name__)
 
 
+@asynccontextmanager
+async def llm_slot(user: User):
+    """Waits for the user's turn to call the LLM, admins get a larger share"""
+    weight = LLM_ADMIN_WEIGHT if user.is_admin else 1
+    async with llm_scheduler.slot(user.user_id, weight):
+        yield
+
+
 async def command_start(update: Update, context: ContextTypes.DEFAULT_TYPE):
     await update.message.reply_text(text=static_text.start_md, parse_mode="Markdown")
 
@@ -49,8 +70,10 @@ async def unknown_callback_handler(update: Update, context: ContextTypes.DEFAULT
 
 
 async def stories_list_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
-    list_stories = [story async for story in Story.objects.all()]
-    keyboard = make_keyboard_for_stories_list(list_stories)
+    list_stories = await story_catalog.stories()
+    keyboard = story_catalog.derived(
+        "stories_keyboard", lambda: make_keyboard_for_stories_list(list_stories)
+    )
     await update.message.reply_text(
         text=static_text.choose_story, reply_markup=keyboard
     )
@@ -61,14 +84,16 @@ async def story_start_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
 
     # extract story_id
     story_id = update.callback_query.data.split("_")[1]
-    story = await Story.objects.aget(id=story_id)
+    story = await story_catalog.get_story(story_id)
     await set_story(update, context, story)
 
     # extract user
     user = await User.get_user(update, context)
 
     # create new story completion
-    story_completion = await StoryCompletion.start_story(user, story)
+    story_completion = await StoryCompletion.start_story(
+        user, story, agents=await story_catalog.agents(story.id)
+    )
     await set_story_completion(update, context, story_completion)
 
     full_text = static_text.story_start_md.format(
@@ -115,8 +140,10 @@ async def questioning_lobby_handler(update: Update, context: ContextTypes.DEFAUL
     story = await extract_story(update, context)
 
     # List agents
-    agents = [agent async for agent in story.agents()]
-    keyboard = make_keyboard_for_agents_list(agents)
+    agents = await story_catalog.agents(story.id)
+    keyboard = story_catalog.derived(
+        ("agents_keyboard", story.id), lambda: make_keyboard_for_agents_list(agents)
+    )
     await update.effective_message.reply_text(
         text=static_text.story_lobby_md.format(
             title=escape_markdown(story.title, version=1),
@@ -132,7 +159,7 @@ async def agent_selected_handler(update: Update, context: ContextTypes.DEFAULT_T
 
     # extract agent_id
     agent_id = update.callback_query.data.split("_")[1]
-    agent = await Agent.objects.aget(id=agent_id)
+    agent = await story_catalog.get_agent(agent_id)
     await set_agent(update, context, agent)
 
     await update.effective_message.reply_text(
@@ -150,6 +177,10 @@ async def agent_answer_handler(update: Update, context: ContextTypes.DEFAULT_TYP
 
 
 async def agent_audio_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
+    if global_llm_helper.circuit_breaker.rejects_calls:
+        await investigation_paused(update)
+        return states.TALKING_TO_AGENT
+
     file = await update.effective_message.voice.get_file()
 
     # Check the file size
@@ -164,12 +195,19 @@ async def agent_audio_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
     path = await file.download_to_drive()
     try:
         # Transcribe the audio (timeout after 60 seconds)
-        transcript = await asyncio.wait_for(
-            global_llm_helper.transcribe_audio_file(path), timeout=60
-        )
+        user = await User.get_user(update, context)
+        async with llm_slot(user):
+            with llm_call_ledger.record(CallKind.TRANSCRIPTION, user.current_completion_id) as stats:
+                transcript = await asyncio.wait_for(
+                    global_llm_helper.transcribe_audio_file(path, stats), timeout=60
+                )
 
         # delete file
         path.unlink()
+    except CircuitOpenError:
+        path.unlink()
+        await investigation_paused(update)
+        return states.TALKING_TO_AGENT
     except Exception as e:
         # if agent fails to transcribe, log the error and notify the user
         logger.error(e)
@@ -186,57 +224,54 @@ async def agent_audio_handler(update: Update, context: ContextTypes.DEFAULT_TYPE
 
         return states.TALKING_TO_AGENT
 
-    return await ask_agent(context, transcript, update)
+    return await ask_agent(context, transcript, update, user)
 
 
-async def ask_agent(context, message, update):
+async def ask_agent(context, message, update, user: User = None):
     """Ask agent a question and display the answer"""
-    agent = await extract_agent(update, context)
-    story_completion = await extract_story_completion(update, context)
+    user = user or await User.get_user(update, context)
+    agent = await extract_agent(update, context, user)
+    story_completion = await extract_story_completion(update, context, user)
+    if story_completion is None:
+        return await story_expired(update)
+    if global_llm_helper.circuit_breaker.rejects_calls:
+        await investigation_paused(update)
+        return states.TALKING_TO_AGENT
     # answer placeholder
     placeholder_message = await update.effective_message.reply_text(
         text=static_text.agent_thinking_html.format(agent_name=html.escape(agent.name)),
         parse_mode=ParseMode.HTML,
     )
 
-    # Create a timer to update the message under the telegram API rate limits (20 messages per minute per chat)
-    timeout_timer = TimeoutTimer()
-
-    async def update_message(current_answer: str) -> None:
-        """Update message with agent (partial) answer"""
-        is_timeout_approved = await timeout_timer.step()
-        if not is_timeout_approved:
-            # If the timeout is not approved, do not update the message
-            #  So that we don't hit the telegram API rate limit
-            return
-
-        # Update message
-        try:
-            await placeholder_message.edit_text(
-                text=static_text.agent_partial_answer_html.format(
-                    agent_name=html.escape(agent.name),
-                    agent_answer=html.escape(current_answer),
-                ),
-                parse_mode=ParseMode.HTML,
+    # Edits are throttled under the telegram API rate limits (20 messages per minute per chat)
+    def render_answer(agent_answer: str, first: bool, state: int) -> str:
+        """Renders a part of the (partial) answer, long answers are continued in new messages"""
+        if not first:
+            template = (
+                static_text.agent_continued_full_answer_html
+                if state == FINAL
+                else static_text.agent_continued_answer_html
             )
-        except Exception as e:
-            # Hack: if the message is not ~visually~ modified,
-            #  telegram raises an error
-            logger.debug(e)
+        elif state == STREAMING:
+            template = static_text.agent_partial_answer_html
+        elif state == CONTINUED:
+            template = static_text.agent_answer_html
+        else:
+            template = static_text.agent_full_answer_html
+        return template.format(agent_name=html.escape(agent.name), agent_answer=agent_answer)
+
+    streaming_message = StreamingMessage(placeholder_message, render_answer, bot=streaming_bot)
 
     # Question agent
     try:
-        answer = await story_completion.question_agent(
-            agent, message, global_llm_helper, update_message
-        )
+        async with llm_slot(user):
+            answer = await story_completion.question_agent(
+                agent, message, global_llm_helper, streaming_message.update
+            )
         # Final answer
-        await placeholder_message.edit_text(
-            text=static_text.agent_full_answer_html.format(
-                agent_name=html.escape(agent.name),
-                agent_answer=html.escape(answer),
-            ),
-            parse_mode=ParseMode.HTML,
-        )
+        await streaming_message.finish(answer)
+    except CircuitOpenError:
+        await investigation_paused(update, placeholder_message)
     except Exception as e:
         # If the agent fails to answer, log the error and notify the user
         logger.error(e)
@@ -261,14 +296,26 @@ async def ask_for_verdict_handler(update: Update, context: ContextTypes.DEFAULT_
 async def verdict_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     player_verdict = update.effective_message.text
 
-    story = await extract_story(update, context)
+    user = await User.get_user(update, context)
+    story = await extract_story(update, context, user)
     authors_verdict = story.extensive_solution
 
-    story_completion = await extract_story_completion(update, context)
+    story_completion = await extract_story_completion(update, context, user)
+    if story_completion is None:
+        return await story_expired(update)
 
-    is_solved, score_person, score_motive, score_way, hint = await story_completion.complete(
-        player_verdict, authors_verdict, story.prelude, global_llm_helper
-    )
+    # the player can send the verdict again once the investigation resumes
+    if global_llm_helper.circuit_breaker.rejects_calls:
+        await investigation_paused(update)
+        return states.TYPING_VERDICT
+    try:
+        async with llm_slot(user):
+            is_solved, score_person, score_motive, score_way, hint = await story_completion.complete(
+                player_verdict, authors_verdict, story.prelude, global_llm_helper
+            )
+    except CircuitOpenError:
+        await investigation_paused(update)
+        return states.TYPING_VERDICT
     score_person = static_text.correct if score_person else static_text.incorrect
     score_motive = static_text.correct if score_motive else static_text.incorrect
     score_way = static_text.correct if score_way else static_text.incorrect
@@ -292,8 +339,30 @@ async def back_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
 async def quit_handler(update: Update, context: ContextTypes.DEFAULT_TYPE):
     story_completion = await extract_story_completion(update, context)
 
-    await story_completion.quit()
+    # the completion is gone if it expired, see stories.retention
+    if story_completion is not None:
+        await story_completion.quit()
     await update.effective_message.reply_text(
         text=escape_markdown(static_text.quit_md, version=1), parse_mode="Markdown"
     )
     return ConversationHandler.END
+
+
+async def story_expired(update: Update):
+    """Ends the conversation of a player whose story completion expired"""
+    await update.effective_message.reply_text(
+        text=escape_markdown(static_text.story_expired_md, version=1), parse_mode="Markdown"
+    )
+    return ConversationHandler.END
+
+
+async def investigation_paused(update: Update, placeholder_message=None):
+    """Tells the player in their language that the LLM provider is down, replacing the placeholder if any"""
+    language_code = getattr(update.effective_user, "language_code", None) or "en"
+    text = static_text.investigation_paused_html.get(
+        language_code[:2], static_text.investigation_paused_html["en"]
+    )
+    if placeholder_message is None:
+        await update.effective_message.reply_text(text=text, parse_mode=ParseMode.HTML)
+    else:
+        await placeholder_message.edit_text(text=text, parse_mode=ParseMode.HTML)
@@ -2,33 +2,42 @@ from asgiref.sync import sync_to_async
 from telegram import Update
 from telegram.ext import ContextTypes
 
+from stories.catalog import story_catalog
 from stories.models import Story, Agent, StoryCompletion
 from users.models import User
 
 
-async def extract_story(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Story:
+async def extract_story(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, user: User = None
+) -> Story:
     """
-    Extracts the story from the user data.
+    Extracts the story from the user data, of the `user` if the handler already loaded it.
     """
-    user = await User.get_user(update, context)
-    return await sync_to_async(lambda u: u.current_story)(user)
+    user = user or await User.get_user(update, context)
+    if user.current_story_id is None:
+        return None
+    return await story_catalog.get_story(user.current_story_id)
 
 
-async def extract_agent(update: Update, context: ContextTypes.DEFAULT_TYPE) -> Agent:
+async def extract_agent(
+    update: Update, context: ContextTypes.DEFAULT_TYPE, user: User = None
+) -> Agent:
     """
-    Extracts the agent from the user data.
+    Extracts the agent from the user data, of the `user` if the handler already loaded it.
     """
-    user = await User.get_user(update, context)
-    return await sync_to_async(lambda u: u.current_agent)(user)
+    user = user or await User.get_user(update, context)
+    if user.current_agent_id is None:
+        return None
+    return await story_catalog.get_agent(user.current_agent_id)
 
 
 async def extract_story_completion(
-    update: Update, context: ContextTypes.DEFAULT_TYPE
+    update: Update, context: ContextTypes.DEFAULT_TYPE, user: User = None
 ) -> StoryCompletion:
     """
-    Extracts the story completion from the user data.
+    Extracts the story completion from the user data, of the `user` if the handler already loaded it.
     """
-    user = await User.get_user(update, context)
+    user = user or await User.get_user(update, context)
     return await sync_to_async(lambda u: u.current_completion)(user)
 
 
@@ -1 +1,4 @@
 IN_QUESTIONING_LOBBY, TALKING_TO_AGENT, TYPING_VERDICT = range(3)
+
+# name of the persistent story conversation
+CONVERSATION_NAME = "storytelling"
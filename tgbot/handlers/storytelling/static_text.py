@@ -38,6 +38,23 @@ agent_full_answer_html = """
 To go back to the characters list, type /back 🔙
 """.strip()
 
+# long answers are continued in new messages
+agent_answer_html = """
+🕵️‍♂️ <b>{agent_name}</b> says:
+
+<i>{agent_answer}</i>
+""".strip()
+
+agent_continued_answer_html = """
+<i>{agent_answer}</i>
+""".strip()
+
+agent_continued_full_answer_html = """
+<i>{agent_answer}</i>
+
+To go back to the characters list, type /back 🔙
+""".strip()
+
 agent_thinking_html = """
 <b>🕵️‍♂️ {agent_name}</b> is thinking... ⏳
 """.strip()
@@ -50,6 +67,38 @@ Please try again later.
 To go back to the characters list, type /back 🔙
 """.strip()
 
+# Sent in the language of the player while the LLM provider is down, see llm_helper.circuit_breaker
+investigation_paused_html = {
+    "en": """
+⏸️ <b>The investigation is paused.</b>
+
+Our detectives cannot reach their informants right now. Please try again in a few minutes.
+
+To go back to the characters list, type /back 🔙
+""".strip(),
+    "fr": """
+⏸️ <b>L’enquête est suspendue.</b>
+
+Nos détectives ne parviennent pas à joindre leurs informateurs pour le moment. Veuillez réessayer dans quelques minutes.
+
+Pour revenir à la liste des personnages, tapez /back 🔙
+""".strip(),
+    "ru": """
+⏸️ <b>Расследование приостановлено.</b>
+
+Наши детективы сейчас не могут связаться со своими информаторами. Пожалуйста, попробуйте снова через несколько минут.
+
+Чтобы вернуться к списку персонажей, введите /back 🔙
+""".strip(),
+    "de": """
+⏸️ <b>Die Ermittlung ist unterbrochen.</b>
+
+Unsere Detektive können ihre Informanten gerade nicht erreichen. Bitte versuchen Sie es in ein paar Minuten erneut.
+
+Um zur Liste der Figuren zurückzukehren, geben Sie /back ein 🔙
+""".strip(),
+}
+
 ask_for_verdict_md = """
 You are about to reveal your verdict 🕵️‍♂️
 
@@ -96,6 +145,12 @@ quit_md = """
 You have exited the mystery. 🚪🔍
 """.strip()
 
+story_expired_md = """
+This investigation was closed after a long break. ⌛
+
+Use /list to start a new story. 🕵️‍♂️
+""".strip()
+
 correct = "correct ✅"
 incorrect = "incorrect ❌"
 
@@ -0,0 +1,119 @@
+import html
+import logging
+from typing import Callable, List, Optional
+
+from telegram import Bot, Message
+from telegram.constants import MessageLimit, ParseMode
+from telegram.error import BadRequest, TelegramError
+
+from tgbot.handlers.utils.python_update_timer import TimeoutTimer
+
+logger = logging.getLogger(__name__)
+
+# State of a part of the answer, passed to the render function:
+#  being streamed, complete but continued in the next message, the end of the final answer
+STREAMING, CONTINUED, FINAL = range(3)
+
+
+class StreamingMessage:
+    """
+    Shows a streamed answer by editing a Telegram message in place.
+
+    `render(answer_html, first, state)` turns an escaped part of the answer into the message text,
+    `first` is set for the part shown in the initial message. The answer is split into parts
+    that fit in a message, cut between words, and continued in new messages.
+    The raw text is cut before it is escaped, so HTML entities are never split.
+    Edits that would not change a message are skipped, partial edits are throttled by the timer.
+    A failed partial update is skipped, the next one catches up; errors of the final update are raised.
+    Messages are sent and edited with `bot`, by default the bot of the initial message.
+    """
+
+    def __init__(
+        self,
+        message: Message,
+        render: Callable[[str, bool, int], str],
+        timer: Optional[TimeoutTimer] = None,
+        bot: Optional[Bot] = None,
+    ):
+        self.messages: List[Message] = [message]
+        self.sent_texts: List[Optional[str]] = [None]
+        self.render = render
+        self.timer = timer if timer is not None else TimeoutTimer()
+        self.bot = bot if bot is not None else message.get_bot()
+
+    async def update(self, answer: str) -> None:
+        """Shows the partial answer, unless an edit was made too recently."""
+        if not await self.timer.step():
+            # So that we don't hit the telegram API rate limit
+            return
+        await self._show(answer, final=False)
+
+    async def finish(self, answer: str) -> None:
+        """Shows the final answer."""
+        await self._show(answer, final=True)
+
+    async def _show(self, answer: str, final: bool) -> None:
+        parts = self.split(answer)
+        for index, part in enumerate(parts):
+            if index < len(parts) - 1:
+                state = CONTINUED
+            else:
+                state = FINAL if final else STREAMING
+            await self._send(index, self.render(html.escape(part), index == 0, state), final)
+
+    def split(self, answer: str) -> List[str]:
+        """Splits the answer into parts that fit in a message each."""
+        parts = []
+        while True:
+            capacity = self._capacity(first=not parts)
+            cut = self._cut(answer, capacity)
+            if cut is None:
+                parts.append(answer.strip())
+                return parts
+            parts.append(answer[:cut].strip())
+            answer = answer[cut:]
+
+    def _capacity(self, first: bool) -> int:
+        """Number of escaped answer characters that fit in a message."""
+        overhead = max(len(self.render("", first, state)) for state in (STREAMING, CONTINUED, FINAL))
+        return MessageLimit.MAX_TEXT_LENGTH - overhead
+
+    @staticmethod
+    def _cut(text: str, capacity: int) -> Optional[int]:
+        """Returns where to cut the text so that its escaped head fits, None if it fits whole."""
+        size = 0
+        for cut, char in enumerate(text):
+            size += len(html.escape(char))
+            if size > capacity:
+                break
+        else:
+            return None
+        # prefer cutting between words, unless it leaves the part mostly empty
+        space = max(text.rfind(" ", 0, cut), text.rfind("\n", 0, cut))
+        return space + 1 if space > cut // 2 else cut
+
+    async def _send(self, index: int, text: str, final: bool) -> None:
+        try:
+            if index == len(self.messages):
+                message = await self.bot.send_message(
+                    chat_id=self.messages[-1].chat_id, text=text, parse_mode=ParseMode.HTML
+                )
+                self.messages.append(message)
+                self.sent_texts.append(text)
+                return
+            if text == self.sent_texts[index]:
+                return
+            await self.bot.edit_message_text(
+                text=text,
+                chat_id=self.messages[index].chat_id,
+                message_id=self.messages[index].message_id,
+                parse_mode=ParseMode.HTML,
+            )
+            self.sent_texts[index] = text
+        except TelegramError as e:
+            # the text may differ only in markup that telegram does not keep
+            not_modified = isinstance(e, BadRequest) and "not modified" in e.message.lower()
+            if final and not not_modified:
+                raise
+            # a failed partial update (e.g. flood control, a network error) is caught up by the next one
+            logger.debug(e)
@@ -1,6 +1,54 @@
+import httpx
 from telegram.ext import ExtBot
+from telegram.request import HTTPXRequest
 
-from dtb.settings import TELEGRAM_TOKEN
+from dtb.settings import (
+    TELEGRAM_TOKEN,
+    TELEGRAM_POOL_SIZE,
+    TELEGRAM_STREAMING_POOL_SIZE,
+    TELEGRAM_POOL_TIMEOUT,
+    TELEGRAM_HTTP_VERSION,
+    HTTP_KEEPALIVE_EXPIRY,
+)
+from utils.http import pool_wait_hooks
 
 
-bot = ExtBot(TELEGRAM_TOKEN)
+class InstrumentedHTTPXRequest(HTTPXRequest):
+    """HTTPXRequest with a keep-alive expiry, recording pool waits in the `<name>.pool_wait` metric."""
+
+    __slots__ = ("_name",)
+
+    def __init__(self, name: str, **kwargs):
+        self._name = name
+        super().__init__(**kwargs)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        limits = self._client_kwargs["limits"]
+        return httpx.AsyncClient(
+            **{
+                **self._client_kwargs,
+                "limits": httpx.Limits(
+                    max_connections=limits.max_connections,
+                    max_keepalive_connections=limits.max_keepalive_connections,
+                    keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+                ),
+            },
+            event_hooks=pool_wait_hooks(self._name),
+        )
+
+
+def make_request(name: str, pool_size: int) -> InstrumentedHTTPXRequest:
+    return InstrumentedHTTPXRequest(
+        name,
+        connection_pool_size=pool_size,
+        pool_timeout=TELEGRAM_POOL_TIMEOUT,
+        http_version=TELEGRAM_HTTP_VERSION,
+    )
+
+
+bot = ExtBot(TELEGRAM_TOKEN, request=make_request("telegram", TELEGRAM_POOL_SIZE))
+
+# Edits of streamed answers go through their own pool, so that they do not delay replies
+streaming_bot = ExtBot(
+    TELEGRAM_TOKEN, request=make_request("telegram_streaming", TELEGRAM_STREAMING_POOL_SIZE)
+)
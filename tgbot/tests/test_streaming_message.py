@@ -0,0 +1,108 @@
+import html
+from types import SimpleNamespace
+from unittest import IsolatedAsyncioTestCase, mock
+
+from telegram.constants import MessageLimit
+from telegram.error import BadRequest, NetworkError
+
+from tgbot.handlers.utils.streaming_message import CONTINUED, FINAL, StreamingMessage
+
+# escapes to up to 6 characters each
+ANSWER = "Tom & Jerry <said> \"it's\" " * 800
+
+
+def render(answer_html: str, first: bool, state: int) -> str:
+    header = "<b>Answer from Alice:</b>\n" if first else ""
+    footer = " (continued)" if state == CONTINUED else "" if state == FINAL else " …"
+    return header + answer_html + footer
+
+
+class StreamingMessageTest(IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.bot = mock.AsyncMock()
+        self.bot.send_message.side_effect = lambda chat_id, **kwargs: SimpleNamespace(
+            chat_id=chat_id, message_id=self.bot.send_message.call_count + 1
+        )
+        self.timer = mock.AsyncMock()
+        self.timer.step.return_value = True
+        self.streaming_message = StreamingMessage(
+            SimpleNamespace(chat_id=1, message_id=1), render, timer=self.timer, bot=self.bot
+        )
+
+    def sent_texts(self) -> list:
+        return [call.kwargs["text"] for call in self.bot.edit_message_text.call_args_list] + [
+            call.kwargs["text"] for call in self.bot.send_message.call_args_list
+        ]
+
+    def test_split_never_cuts_an_entity(self):
+        parts = self.streaming_message.split(ANSWER)
+
+        self.assertGreater(len(parts), 1)
+        # only whitespace is dropped at the cuts
+        self.assertEqual(" ".join(parts).split(), ANSWER.split())
+        for index, part in enumerate(parts):
+            for state in (CONTINUED, FINAL):
+                text = render(html.escape(part), index == 0, state)
+                self.assertLessEqual(len(text), MessageLimit.MAX_TEXT_LENGTH)
+            self.assertEqual(html.unescape(html.escape(part)), part)
+
+    def test_split_of_a_text_without_spaces(self):
+        answer = "&" * 5000
+
+        parts = self.streaming_message.split(answer)
+
+        self.assertEqual("".join(parts), answer)
+        for index, part in enumerate(parts):
+            text = render(html.escape(part), index == 0, FINAL)
+            self.assertLessEqual(len(text), MessageLimit.MAX_TEXT_LENGTH)
+
+    async def test_long_answer_is_continued_in_new_messages(self):
+        await self.streaming_message.finish(ANSWER)
+
+        texts = self.sent_texts()
+        self.assertEqual(self.bot.edit_message_text.call_count, 1)
+        self.assertEqual(len(texts), len(self.streaming_message.split(ANSWER)))
+        for text in texts:
+            self.assertLessEqual(len(text), MessageLimit.MAX_TEXT_LENGTH)
+            # a cut entity would leave a stray "&" behind
+            self.assertNotRegex(text, r"&(?!amp;|lt;|gt;|quot;|#x27;)")
+        self.assertTrue(texts[0].startswith("<b>Answer from Alice:</b>\n"))
+        self.assertTrue(texts[0].endswith(" (continued)"))
+        self.assertFalse(texts[-1].endswith((" (continued)", " …")))
+
+    async def test_unchanged_text_is_not_sent_again(self):
+        await self.streaming_message.update("In the library")
+        await self.streaming_message.finish("In the library")
+        await self.streaming_message.finish("In the library")
+
+        self.assertEqual(
+            self.sent_texts(),
+            ["<b>Answer from Alice:</b>\nIn the library …", "<b>Answer from Alice:</b>\nIn the library"],
+        )
+
+    async def test_throttled_update_is_skipped(self):
+        self.timer.step.return_value = False
+
+        await self.streaming_message.update("In the library")
+
+        self.bot.edit_message_text.assert_not_called()
+
+    async def test_failed_partial_update_is_caught_up(self):
+        self.bot.edit_message_text.side_effect = [NetworkError("timed out"), None]
+
+        await self.streaming_message.update("In the")
+        await self.streaming_message.finish("In the library")
+
+        self.assertEqual(self.bot.edit_message_text.call_count, 2)
+        self.assertEqual(self.streaming_message.sent_texts, ["<b>Answer from Alice:</b>\nIn the library"])
+
+    async def test_failed_final_update_is_raised(self):
+        self.bot.edit_message_text.side_effect = NetworkError("timed out")
+
+        with self.assertRaises(NetworkError):
+            await self.streaming_message.finish("In the library")
+
+    async def test_final_update_not_modified(self):
+        self.bot.edit_message_text.side_effect = BadRequest("Message is not modified")
+
+        await self.streaming_message.finish("In the library")
@@ -13,6 +13,7 @@ class UserAdmin(admin.ModelAdmin):
     ]
     list_filter = ["is_blocked_bot", ]
     search_fields = ('username', 'user_id')
+    raw_id_fields = ['current_story', 'current_agent', 'current_completion']
 
 
 @admin.register(Location)
@@ -0,0 +1,30 @@
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # zstandard is optional, zlib is used without it
+    zstandard = None
+
+# The first byte of a compressed payload identifies the codec
+ZLIB, ZSTD = b"z", b"s"
+
+
+def compress_text(text: str, codec: str = "zlib") -> bytes:
+    """Compresses the text with the given codec ("zlib" or "zstd")."""
+    data = text.encode("utf-8")
+    if codec == "zstd" and zstandard is not None:
+        return ZSTD + zstandard.ZstdCompressor().compress(data)
+    return ZLIB + zlib.compress(data)
+
+
+def decompress_text(payload: bytes) -> str:
+    """Decompresses a payload produced by `compress_text`."""
+    payload = bytes(payload)
+    header, data = payload[:1], payload[1:]
+    if header == ZLIB:
+        return zlib.decompress(data).decode("utf-8")
+    if header == ZSTD:
+        if zstandard is None:
+            raise RuntimeError("zstandard is required to read zstd-compressed data")
+        return zstandard.ZstdDecompressor().decompress(data).decode("utf-8")
+    raise ValueError(f"Unknown compression header: {header!r}")
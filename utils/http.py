@@ -0,0 +1,37 @@
+import time
+
+import httpx
+
+from typing import Tuple
+
+from utils.metrics import DURATION_BUCKETS, get_metric
+
+# The first event traced once a request got a connection from the pool:
+#  a new connection is opened or the request is sent over a kept-alive one
+POOL_ACQUIRED_EVENTS = (
+    "connection.connect_tcp.started",
+    "http11.send_request_headers.started",
+    "http2.send_request_headers.started",
+)
+
+
+def pool_wait_hooks(name: str, buckets: Tuple[float, ...] = DURATION_BUCKETS) -> dict:
+    """
+    httpx event hooks recording in the `<name>.pool_wait` metric
+    how long requests wait for a connection of the pool.
+    """
+    metric = get_metric(f"{name}.pool_wait", buckets)
+
+    async def on_request(request: httpx.Request) -> None:
+        started_at = time.monotonic()
+        waiting = True
+
+        async def trace(event_name: str, info: dict) -> None:
+            nonlocal waiting
+            if waiting and event_name in POOL_ACQUIRED_EVENTS:
+                waiting = False
+                metric.observe(time.monotonic() - started_at)
+
+        request.extensions["trace"] = trace
+
+    return {"request": [on_request]}
@@ -0,0 +1,84 @@
+from bisect import bisect_left
+from typing import Callable, Dict, Tuple, Union
+
+# Upper bounds (in seconds) of the histogram buckets, the last bucket is unbounded
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5)
+# Buckets for what waits on LLM calls, e.g. a whole call or a slot held by one, that last up to minutes
+LLM_DURATION_BUCKETS = (0.1, 0.5, 1, 2, 5, 10, 20, 30, 60, 120)
+
+
+class DurationMetric:
+    """Count, sum, maximum and histogram of durations, kept in the memory of the process."""
+
+    def __init__(self, buckets: Tuple[float, ...] = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram = [0] * (len(buckets) + 1)
+
+    def observe(self, seconds: float) -> None:
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+        self.histogram[bisect_left(self.buckets, seconds)] += 1
+
+    def snapshot(self) -> dict:
+        labels = [f"≤{bound}s" for bound in self.buckets] + [f">{self.buckets[-1]}s"]
+        return dict(
+            count=self.count,
+            total=round(self.total, 3),
+            average=round(self.total / self.count, 3) if self.count else None,
+            max=round(self.max, 3),
+            histogram=dict(zip(labels, self.histogram)),
+        )
+
+
+class GaugeMetric:
+    """Current and maximum value of a quantity, e.g. the depth of a queue."""
+
+    def __init__(self):
+        self.value = 0
+        self.max = 0
+
+    def inc(self, amount: int = 1) -> None:
+        self.value += amount
+        self.max = max(self.max, self.value)
+
+    def dec(self, amount: int = 1) -> None:
+        self.value -= amount
+
+    def snapshot(self) -> dict:
+        return dict(value=self.value, max=self.max)
+
+
+_metrics: Dict[str, Union[DurationMetric, GaugeMetric]] = {}
+
+
+def get_metric(name: str, buckets: Tuple[float, ...] = DURATION_BUCKETS) -> DurationMetric:
+    """Returns the duration metric with the given name, creating it with `buckets` on first use."""
+    if name not in _metrics:
+        _metrics[name] = DurationMetric(buckets)
+    return _metrics[name]
+
+
+def get_gauge(name: str) -> GaugeMetric:
+    """Returns the gauge with the given name, creating it on first use."""
+    if name not in _metrics:
+        _metrics[name] = GaugeMetric()
+    return _metrics[name]
+
+
+_collectors: Dict[str, Callable[[], dict]] = {}
+
+
+def register_collector(name: str, collect: Callable[[], dict]) -> None:
+    """Adds the result of `collect()` to the snapshot, for metrics kept elsewhere."""
+    _collectors[name] = collect
+
+
+def snapshot() -> Dict[str, dict]:
+    """All metrics of the process by name."""
+    metrics = {name: metric.snapshot() for name, metric in _metrics.items()}
+    metrics.update((name, collect()) for name, collect in _collectors.items())
+    return dict(sorted(metrics.items()))
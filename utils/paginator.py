@@ -0,0 +1,37 @@
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+# Below this many rows the estimate is not worth it, the table is counted
+ESTIMATE_THRESHOLD = 10000
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator for big tables: on PostgreSQL an unfiltered queryset is counted with
+    the planner's estimate from pg_class instead of a full COUNT(*) scan.
+    Filtered querysets and other databases get the exact count.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = self._estimate_count()
+        if estimate is not None and estimate >= ESTIMATE_THRESHOLD:
+            return estimate
+        return super().count
+
+    def _estimate_count(self):
+        query = getattr(self.object_list, "query", None)
+        if query is None or query.where:
+            return None
+        connection = connections[self.object_list.db]
+        if connection.vendor != "postgresql":
+            return None
+        with connection.cursor() as cursor:
+            cursor.execute(
+                "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+                [self.object_list.model._meta.db_table],
+            )
+            row = cursor.fetchone()
+        # reltuples is -1 for tables that were never analyzed
+        return int(row[0]) if row else None